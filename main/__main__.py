@@ -16,7 +16,8 @@ try:
             'API_ID', 'API_HASH', 'BOT_TOKEN', 'AUTH', 'MONGO_DB',
             'FORCESUB', 'SESSION', 'TELEGRAM_PROXY_SCHEME', 
             'TELEGRAM_PROXY_HOST', 'TELEGRAM_PROXY_PORT',
-            'ENCRYPTION_KEY'
+            'ENCRYPTION_KEY', 'TASK_QUEUE_BACKEND', 'TASK_QUEUE_SQLITE_PATH',
+            'EXTERNAL_WORKERS'
         ]
         
         for key in env_vars:
@@ -37,4 +38,9 @@ logging.basicConfig(format='[%(levelname) 5s/%(asctime)s] %(name)s: %(message)s'
 from .app import main
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # python -m main worker [名称]：以独立下载工作进程运行
+    if len(sys.argv) > 1 and sys.argv[1] == "worker":
+        from .worker import main as worker_main
+        worker_main(sys.argv[2] if len(sys.argv) > 2 else "worker")
+    else:
+        main()
\ No newline at end of file
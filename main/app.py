@@ -39,7 +39,7 @@ async def setup_commands():
     ]
     
     try:
-        await client_manager.pyrogram_bot.set_bot_commands(commands)
+        await client_manager.bot_client.set_bot_commands(commands)
         logger.info("机器人命令已自动设置完成！")
     except Exception as e:
         logger.error(f"设置命令时出错: {e}", exc_info=True)
@@ -104,7 +104,7 @@ async def startup():
     
     # 设置机器人命令（确保客户端已启动）
     try:
-        if client_manager.pyrogram_bot and client_manager.pyrogram_bot.is_connected:
+        if settings.BOT_BACKEND == "telethon" or (client_manager.pyrogram_bot and client_manager.pyrogram_bot.is_connected):
             await setup_commands()
         else:
             logger.warning("Pyrogram客户端未连接，跳过命令设置")
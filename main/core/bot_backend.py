@@ -0,0 +1,148 @@
+"""机器人发送后端模块
+
+下载流程通过一个机器人客户端编辑状态消息、发送和删除消息。BOT_BACKEND 为 telethon 时
+使用 TelethonBotAdapter：它提供下载流程使用的Pyrogram方法，实际通过接收命令的
+Telethon客户端发送。发送的文件按Pyrogram格式编码file_id后返回，媒体缓存照常生效；
+缓存的file_id也解码后由Telethon发送，Pyrogram机器人只在遇到无法转换的file_id时按需启动。
+"""
+import logging
+from types import SimpleNamespace
+from typing import Any, Callable, Optional, TYPE_CHECKING
+
+from pyrogram.file_id import FileId, FileType, FileUniqueId, FileUniqueType, PHOTO_TYPES, ThumbnailSource
+from telethon.tl.functions.bots import SetBotCommandsRequest
+from telethon.tl.types import (BotCommand, BotCommandScopeDefault, DocumentAttributeVideo,
+                               InputDocument, InputPhoto)
+
+if TYPE_CHECKING:
+    from .clients import ClientManager
+
+logger = logging.getLogger(__name__)
+
+
+def _progress_callback(progress: Optional[Callable], progress_args: tuple) -> Optional[Callable]:
+    """把Pyrogram风格的进度回调转换为Telethon的 progress_callback(current, total)"""
+    if progress is None:
+        return None
+    return lambda current, total: progress(current, total, *progress_args)
+
+
+def _cache_reference(message: Any, media_type: str, file_type: FileType) -> Optional[SimpleNamespace]:
+    """把Telethon发送的文件消息转换为 MediaCacheService.extract_file_id 可识别的对象
+
+    Returns:
+        Optional[SimpleNamespace]: 带有 <media_type>.file_id / file_unique_id 的对象，消息没有文件时返回None
+    """
+    attr = "photo" if file_type in PHOTO_TYPES else "document"
+    media = getattr(message, attr, None) if message is not None else None
+    if media is None:
+        return None
+    if attr == "photo":
+        # 与Pyrogram解析照片消息时的编码方式一致：使用最大尺寸
+        sizes = [size for size in getattr(media, "sizes", []) if getattr(size, "type", None)]
+        file_id = FileId(
+            file_type=file_type,
+            dc_id=media.dc_id,
+            media_id=media.id,
+            access_hash=media.access_hash,
+            file_reference=media.file_reference,
+            thumbnail_source=ThumbnailSource.THUMBNAIL,
+            thumbnail_file_type=file_type,
+            thumbnail_size=sizes[-1].type if sizes else "",
+            volume_id=0,
+            local_id=0
+        ).encode()
+    else:
+        file_id = FileId(
+            file_type=file_type,
+            dc_id=media.dc_id,
+            media_id=media.id,
+            access_hash=media.access_hash,
+            file_reference=media.file_reference
+        ).encode()
+    file_unique_id = FileUniqueId(file_unique_type=FileUniqueType.DOCUMENT, media_id=media.id).encode()
+    return SimpleNamespace(**{media_type: SimpleNamespace(file_id=file_id, file_unique_id=file_unique_id)})
+
+
+class TelethonBotAdapter:
+    """通过Telethon机器人实现下载流程使用的Pyrogram机器人方法"""
+
+    def __init__(self, manager: "ClientManager"):
+        self.manager = manager
+
+    @property
+    def bot(self):
+        return self.manager.bot
+
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str):
+        return await self.bot.edit_message(chat_id, message_id, text)
+
+    async def send_message(self, chat_id: int, text: str):
+        return await self.bot.send_message(chat_id, text)
+
+    async def delete_messages(self, chat_id: int, message_ids):
+        return await self.bot.delete_messages(chat_id, message_ids)
+
+    async def get_messages(self, chat_id: Any, message_ids: int):
+        return await self.bot.get_messages(chat_id, ids=message_ids)
+
+    async def copy_message(self, chat_id: int, from_chat_id: Any, message_id: int):
+        message = await self.bot.get_messages(from_chat_id, ids=message_id)
+        if message is None:
+            raise ValueError(f"消息不存在: {from_chat_id}/{message_id}")
+        # 发送Message对象会复制内容，不显示转发来源
+        return await self.bot.send_message(chat_id, message)
+
+    async def send_video(self, chat_id: int, video: str, caption: Optional[str] = None,
+                         supports_streaming: bool = True, height: int = 0, width: int = 0, duration: int = 0,
+                         thumb: Optional[str] = None, progress: Optional[Callable] = None,
+                         progress_args: tuple = ()):
+        attributes = [DocumentAttributeVideo(duration=duration, w=width, h=height,
+                                             supports_streaming=supports_streaming)]
+        sent = await self.bot.send_file(chat_id, video, caption=caption, thumb=thumb, attributes=attributes,
+                                        force_document=False,
+                                        progress_callback=_progress_callback(progress, progress_args))
+        return _cache_reference(sent, "video", FileType.VIDEO)
+
+    async def send_video_note(self, chat_id: int, video_note: str, length: int = 1, duration: int = 0,
+                              thumb: Optional[str] = None, progress: Optional[Callable] = None,
+                              progress_args: tuple = ()):
+        attributes = [DocumentAttributeVideo(duration=duration, w=length, h=length, round_message=True)]
+        sent = await self.bot.send_file(chat_id, video_note, thumb=thumb, attributes=attributes,
+                                        force_document=False,
+                                        progress_callback=_progress_callback(progress, progress_args))
+        return _cache_reference(sent, "video_note", FileType.VIDEO_NOTE)
+
+    async def send_document(self, chat_id: int, document: str, caption: Optional[str] = None,
+                            thumb: Optional[str] = None, progress: Optional[Callable] = None,
+                            progress_args: tuple = ()):
+        sent = await self.bot.send_file(chat_id, document, caption=caption, thumb=thumb, force_document=True,
+                                        progress_callback=_progress_callback(progress, progress_args))
+        return _cache_reference(sent, "document", FileType.DOCUMENT)
+
+    async def send_photo(self, chat_id: int, photo: str, caption: Optional[str] = None):
+        sent = await self.bot.send_file(chat_id, photo, caption=caption)
+        return _cache_reference(sent, "photo", FileType.PHOTO)
+
+    async def send_cached_media(self, chat_id: int, file_id: str, caption: Optional[str] = None):
+        # 同一个机器人的file_id中包含文件的id、access_hash和file_reference，可以直接由Telethon发送
+        decoded = FileId.decode(file_id)
+        if decoded.media_id is None:
+            # 网页文件等无法转换的file_id交给Pyrogram机器人
+            pyrogram_bot = await self.manager.get_pyrogram_bot()
+            return await pyrogram_bot.send_cached_media(chat_id, file_id, caption=caption)
+
+        if decoded.file_type in PHOTO_TYPES:
+            media = InputPhoto(id=decoded.media_id, access_hash=decoded.access_hash,
+                               file_reference=decoded.file_reference)
+        else:
+            media = InputDocument(id=decoded.media_id, access_hash=decoded.access_hash,
+                                  file_reference=decoded.file_reference)
+        return await self.bot.send_file(chat_id, media, caption=caption)
+
+    async def set_bot_commands(self, commands: list):
+        return await self.bot(SetBotCommandsRequest(
+            scope=BotCommandScopeDefault(),
+            lang_code="",
+            commands=[BotCommand(command=c.command, description=c.description) for c in commands]
+        ))
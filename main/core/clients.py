@@ -1,12 +1,21 @@
 """Telegram客户端管理模块"""
+import asyncio
 import logging
 import os
+import time
+from contextlib import asynccontextmanager
 from typing import Optional, Dict, Any
 from pyrogram import Client
 from telethon.sessions import StringSession
 from telethon.sync import TelegramClient
 
 from ..config import settings
+from ..core.userbot_pool import UserbotPool, UserClientCache, PoolAccount
+from ..core.connection_supervisor import ConnectionSupervisor
+from ..core.proxy_pool import ProxyPool, parse_proxy_url
+from ..core.bot_backend import TelethonBotAdapter
+from ..core.media_sessions import MediaSessionPool
+from ..core.session_storage import prepare_session_file
 from ..services.session_service import session_service
 from ..utils.security import security_manager
 
@@ -18,19 +27,74 @@ class ClientManager:
     
     def __init__(self):
         self.bot: Optional[TelegramClient] = None
-        self.userbot: Optional[Client] = None
+        # 主Userbot同时作为账号池中的 "primary" 账号
+        self.userbot_pool = UserbotPool()
+        # Userbot下载文件时按DC复用的媒体会话
+        self.media_sessions = MediaSessionPool(idle_timeout=settings.MEDIA_SESSION_IDLE_TIMEOUT)
+        self._userbot: Optional[Client] = None
+        # 各客户端的启动状态: starting / ready / failed
+        self.client_states: Dict[str, str] = {}
+        self._userbot_task: Optional[asyncio.Task] = None
+        # 被替换下来、等待正在进行的下载结束后停止的旧Userbot: 会话名 -> 停止任务
+        self._retiring: Dict[str, asyncio.Task] = {}
+        self.supervisor = ConnectionSupervisor(self, interval=settings.CONNECTION_CHECK_INTERVAL)
+        # 按需启动的请求者本人的Userbot
+        self.user_clients = UserClientCache(
+            self._start_user_client,
+            max_clients=settings.USER_CLIENT_CACHE_SIZE,
+            idle_timeout=settings.USER_CLIENT_IDLE_TIMEOUT,
+            on_stop=lambda user_id: self.proxy_pool.release(f"user_{user_id}{self.session_suffix}")
+        )
         self.pyrogram_bot: Optional[Client] = None
+        self._pyrogram_bot_lock = asyncio.Lock()
+        # BOT_BACKEND 为 telethon 时下载流程通过Telethon发送，Pyrogram机器人按需启动
+        self._telethon_adapter = TelethonBotAdapter(self)
         self.session_svc = session_service
-        # 延迟获取代理配置，直到需要时
-        self._proxy_config = None
+        # 用户保存或删除SESSION后，丢弃用旧SESSION启动的客户端
+        self.session_svc.add_change_listener(self.user_clients.invalidate)
+        # 会话名后缀，同一主机上运行多个进程时用于区分各自的会话文件
+        self.session_suffix = ""
+        # 延迟创建代理池，直到需要时
+        self._proxy_pool: Optional[ProxyPool] = None
         self.logger = logging.getLogger(__name__)
         
     @property
-    def proxy_config(self) -> Optional[Dict[str, Any]]:
-        """动态获取代理配置"""
-        if self._proxy_config is None:
-            self._proxy_config = self._get_proxy_config()
-        return self._proxy_config
+    def userbot(self) -> Optional[Client]:
+        """主Userbot客户端"""
+        return self._userbot
+    
+    @userbot.setter
+    def userbot(self, client: Optional[Client]):
+        self._userbot = client
+        self.userbot_pool.add("primary", client, owned=False)
+    
+    @property
+    def bot_client(self) -> Any:
+        """下载流程用于编辑状态、发送和删除消息的机器人客户端（由 BOT_BACKEND 决定）"""
+        if settings.BOT_BACKEND == "telethon":
+            return self._telethon_adapter
+        return self.pyrogram_bot
+    
+    @property
+    def proxy_pool(self) -> ProxyPool:
+        """代理池：TELEGRAM_PROXIES 中的代理，未配置时为单个 TELEGRAM_PROXY_* 代理"""
+        if self._proxy_pool is None:
+            proxies = []
+            for url in settings.TELEGRAM_PROXIES:
+                try:
+                    proxies.append(parse_proxy_url(url))
+                except ValueError as e:
+                    logger.warning(str(e))
+            if not proxies:
+                proxy_config = self._get_proxy_config()
+                if proxy_config:
+                    proxies.append(proxy_config)
+            if os.getenv('DISABLE_PROXY', '').lower() in ['true', '1', 'yes']:
+                proxies = []
+            self._proxy_pool = ProxyPool(proxies)
+            if proxies:
+                logger.info(f"已配置 {len(proxies)} 个Telegram代理")
+        return self._proxy_pool
         
     def _get_proxy_config(self) -> Optional[Dict[str, Any]]:
         """获取代理配置"""
@@ -148,23 +212,24 @@ class ClientManager:
         
         return pyrogram_proxy_config
     
-    def _get_telethon_proxy(self) -> Optional[tuple]:
-        """获取Telethon代理配置"""
-        if self.proxy_config:
-            scheme = self.proxy_config['scheme']
-            hostname = self.proxy_config['hostname']
-            port = self.proxy_config['port']
+    def _get_telethon_proxy(self, name: str) -> Optional[Any]:
+        """获取分配给Telethon客户端的代理配置"""
+        proxy_config = self.proxy_pool.assign(name)
+        if proxy_config:
+            scheme = proxy_config['scheme']
+            hostname = proxy_config['hostname']
+            port = proxy_config['port']
             
             # 支持SOCKS5代理
             if scheme in ['socks5', 'socks4', 'socks']:
                 # 如果有认证信息，包含在代理配置中
-                if 'username' in self.proxy_config and 'password' in self.proxy_config:
+                if 'username' in proxy_config and 'password' in proxy_config:
                     return (
                         scheme,
                         hostname,
                         port,
-                        self.proxy_config['username'],
-                        self.proxy_config['password']
+                        proxy_config['username'],
+                        proxy_config['password']
                     )
                 else:
                     return (
@@ -174,51 +239,121 @@ class ClientManager:
                     )
             # 对于HTTP代理，使用字典格式以确保认证正确工作
             elif scheme in ['http', 'https']:
-                if 'username' in self.proxy_config and 'password' in self.proxy_config:
+                if 'username' in proxy_config and 'password' in proxy_config:
                     # 返回字典格式的代理配置
                     return {
                         'proxy_type': 'http',
                         'addr': hostname,
                         'port': port,
-                        'username': self.proxy_config['username'],
-                        'password': self.proxy_config['password']
+                        'username': proxy_config['username'],
+                        'password': proxy_config['password']
                     }
                 else:
                     # 返回元组格式的代理配置
                     return ('http', hostname, port)
         return None
     
-    def _get_pyrogram_proxy(self) -> Optional[Dict[str, Any]]:
-        """获取Pyrogram代理配置"""
-        return self.proxy_config
+    def _get_pyrogram_proxy(self, name: str) -> Optional[Dict[str, Any]]:
+        """获取分配给Pyrogram客户端的代理配置
+        
+        HTTP代理（包括带认证的）同样通过 proxy 参数传递给客户端，
+        不修改进程的 HTTP_PROXY 环境变量，避免影响其他客户端和出站连接。
+        """
+        pyrogram_proxy_config = self._create_pyrogram_proxy_config(self.proxy_pool.assign(name))
+        if pyrogram_proxy_config:
+            logger.info(f"{name} 使用代理: {pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}")
+        return pyrogram_proxy_config
     
-    async def initialize_clients(self):
-        """初始化所有Telegram客户端"""
+    async def initialize_clients(self, wait_for_userbot: bool = False):
+        """初始化所有Telegram客户端
+        
+        各客户端并发连接。两个bot客户端就绪后立即返回，使机器人可以开始处理命令；
+        Userbot（需要先查询并解密SESSION）在后台继续启动，可通过 get_userbot() 等待。
+        
+        Args:
+            wait_for_userbot: 是否等待Userbot启动完成后再返回
+        """
         try:
-            # 初始化Telethon bot客户端
+            # 创建bot客户端（不涉及网络）
             self._init_telethon_bot()
-            
-            # 初始化Pyrogram bot客户端
             self._init_pyrogram_bot()
             
-            # 初始化userbot客户端
-            await self._init_userbot()
-            
-            # 启动Telethon bot客户端
-            if self.bot:
-                await self.bot.start(bot_token=settings.BOT_TOKEN)
-                logger.info("Telethon bot客户端启动成功")
+            self._userbot_task = asyncio.create_task(self._start_userbots())
             
-            # 启动Pyrogram bot客户端
-            if self.pyrogram_bot:
-                await self.pyrogram_bot.start()
-                logger.info("Pyrogram bot客户端启动成功")
+            starts = [self._start_client("telethon_bot", self.bot, self.bot.start(bot_token=settings.BOT_TOKEN))]
+            if settings.BOT_BACKEND == "telethon":
+                # Pyrogram机器人在首次需要时由 get_pyrogram_bot() 启动
+                self.client_states["pyrogram_bot"] = "idle"
+            else:
+                starts.append(self._start_client("pyrogram_bot", self.pyrogram_bot, self.pyrogram_bot.start()))
+            results = await asyncio.gather(*starts, return_exceptions=True)
+            errors = [r for r in results if isinstance(r, BaseException)]
+            if errors:
+                raise errors[0]
             
-            logger.info("所有Telegram客户端初始化完成")
+            if wait_for_userbot:
+                await self._userbot_task
+            self.supervisor.start()
+            self.proxy_pool.start_health_checks()
+            logger.info(f"Telegram bot客户端初始化完成，客户端状态: {self.client_states}")
         except Exception as e:
             logger.error(f"初始化客户端失败: {e}")
             raise
     
+    async def _start_client(self, name: str, client: Any, start_coro) -> None:
+        """启动单个客户端并记录其状态，超时视为失败"""
+        self.client_states[name] = "starting"
+        try:
+            await asyncio.wait_for(start_coro, timeout=settings.CLIENT_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.client_states[name] = "failed"
+            raise TimeoutError(f"{name} 启动超时（{settings.CLIENT_START_TIMEOUT}秒）")
+        except Exception:
+            self.client_states[name] = "failed"
+            raise
+        self.client_states[name] = "ready"
+        logger.info(f"{name} 客户端启动成功")
+    
+    async def _start_userbots(self):
+        """后台启动主Userbot和账号池"""
+        self.client_states["userbot"] = "starting"
+        try:
+            await asyncio.wait_for(self._init_userbot(), timeout=settings.CLIENT_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.error(f"Userbot启动超时（{settings.CLIENT_START_TIMEOUT}秒），应用将继续运行")
+            self.userbot = None
+        self.client_states["userbot"] = "ready" if self.userbot is not None else "failed"
+        
+        try:
+            await self._init_userbot_pool()
+        except Exception as e:
+            logger.error(f"启动Userbot账号池失败: {e}")
+    
+    async def get_userbot(self, timeout: Optional[float] = None) -> Optional[Client]:
+        """获取主Userbot，正在后台启动时等待启动完成
+        
+        Args:
+            timeout: 最长等待时间（秒），默认不限制
+            
+        Returns:
+            Optional[Client]: 主Userbot，启动失败或未配置SESSION时返回None
+        """
+        task = self._userbot_task
+        if task is not None and not task.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(task), timeout=timeout)
+            except asyncio.TimeoutError:
+                logger.warning("等待Userbot启动超时")
+        return self.userbot
+    
+    async def get_pyrogram_bot(self) -> Client:
+        """获取Pyrogram机器人，尚未启动时（BOT_BACKEND 为 telethon）先启动"""
+        async with self._pyrogram_bot_lock:
+            if not self.pyrogram_bot.is_connected:
+                logger.info("按需启动Pyrogram bot客户端")
+                await self._start_client("pyrogram_bot", self.pyrogram_bot, self.pyrogram_bot.start())
+        return self.pyrogram_bot
+    
     def _init_telethon_bot(self):
         """初始化Telethon bot客户端"""
         try:
@@ -227,54 +362,19 @@ class ClientManager:
             logger.info(f"正在启动Telethon bot客户端 (Token: {masked_token})")
             
             # 获取代理配置
-            telethon_proxy = self._get_telethon_proxy()
-            
-            # 创建Telethon客户端
+            telethon_proxy = self._get_telethon_proxy("telethon_bot")
             if telethon_proxy:
-                # 检查代理类型
-                if isinstance(telethon_proxy, dict):
-                    # 字典格式代理（HTTP代理推荐使用）
-                    logger.info(f"使用带认证的HTTP代理: {telethon_proxy['addr']}:{telethon_proxy['port']} with auth")
-                    self.bot = TelegramClient(
-                        'bot', 
-                        settings.API_ID, 
-                        settings.API_HASH,
-                        proxy=telethon_proxy,
-                        connection_retries=5
-                    )
-                elif len(telethon_proxy) >= 5 and telethon_proxy[0] in ['socks5', 'socks4']:
-                    # SOCKS代理带认证
-                    logger.info(f"使用带认证的SOCKS代理: {telethon_proxy[1]}:{telethon_proxy[2]} with auth")
-                    self.bot = TelegramClient(
-                        'bot', 
-                        settings.API_ID, 
-                        settings.API_HASH,
-                        proxy=telethon_proxy,
-                        connection_retries=5
-                    )
-                elif len(telethon_proxy) >= 3:
-                    # 不带认证的代理
-                    logger.info(f"使用代理: {telethon_proxy[1]}:{telethon_proxy[2]}")
-                    self.bot = TelegramClient(
-                        'bot', 
-                        settings.API_ID, 
-                        settings.API_HASH,
-                        proxy=telethon_proxy,
-                        connection_retries=5
-                    )
-                else:
-                    # 默认情况
-                    logger.info(f"使用代理: {telethon_proxy}")
-                    self.bot = TelegramClient(
-                        'bot', 
-                        settings.API_ID, 
-                        settings.API_HASH,
-                        proxy=telethon_proxy,
-                        connection_retries=5
-                    )
+                logger.info("Telethon bot使用代理连接Telegram")
             else:
                 logger.info("不使用代理直接连接Telegram")
-                self.bot = TelegramClient('bot', settings.API_ID, settings.API_HASH, connection_retries=5)
+            
+            self.bot = TelegramClient(
+                f'bot{self.session_suffix}', 
+                settings.API_ID, 
+                settings.API_HASH,
+                proxy=telethon_proxy,
+                connection_retries=5
+            )
             
             logger.info("Telethon bot客户端初始化完成")
         except Exception as e:
@@ -288,50 +388,14 @@ class ClientManager:
             masked_token = security_manager.mask_sensitive_data(settings.BOT_TOKEN, 10)
             logger.info(f"正在启动Pyrogram bot客户端 (Token: {masked_token})")
             
-            # 获取代理配置
-            pyrogram_proxy = self._get_pyrogram_proxy()
-            
             # 创建Pyrogram客户端
-            if pyrogram_proxy:
-                pyrogram_proxy_config = self._create_pyrogram_proxy_config(pyrogram_proxy)
-                if pyrogram_proxy_config:
-                    logger.info(f"使用代理: {pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config.get('username', '')}@{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}")
-                
-                # 对于HTTP代理认证，Pyrogram可能不支持通过proxy参数传递
-                # 尝试使用环境变量设置代理
-                if pyrogram_proxy_config and pyrogram_proxy_config['scheme'] in ['http', 'https']:
-                    import os
-                    # 检查是否有认证信息
-                    if pyrogram_proxy_config.get('username') and pyrogram_proxy_config.get('password'):
-                        proxy_url = f"{pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config['username']}:{pyrogram_proxy_config['password']}@{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}"
-                    else:
-                        proxy_url = f"{pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}"
-                    os.environ['HTTP_PROXY'] = proxy_url
-                    os.environ['HTTPS_PROXY'] = proxy_url
-                    logger.info(f"通过环境变量设置代理: {proxy_url}")
-                    # 不传递proxy参数，让Pyrogram使用环境变量
-                    self.pyrogram_bot = Client(
-                        "SaveRestricted",
-                        bot_token=settings.BOT_TOKEN,
-                        api_id=settings.API_ID,
-                        api_hash=settings.API_HASH
-                    )
-                else:
-                    # 对于SOCKS代理或其他情况，正常使用proxy参数
-                    self.pyrogram_bot = Client(
-                        "SaveRestricted",
-                        bot_token=settings.BOT_TOKEN,
-                        api_id=settings.API_ID,
-                        api_hash=settings.API_HASH,
-                        proxy=pyrogram_proxy_config
-                    )
-            else:
-                self.pyrogram_bot = Client(
-                    "SaveRestricted",
-                    bot_token=settings.BOT_TOKEN,
-                    api_id=settings.API_ID,
-                    api_hash=settings.API_HASH
-                )
+            self.pyrogram_bot = Client(
+                f"SaveRestricted{self.session_suffix}",
+                bot_token=settings.BOT_TOKEN,
+                api_id=settings.API_ID,
+                api_hash=settings.API_HASH,
+                proxy=self._get_pyrogram_proxy("pyrogram_bot")
+            )
             
             logger.info("Pyrogram bot客户端初始化完成")
         except Exception as e:
@@ -370,54 +434,24 @@ class ClientManager:
                 masked_session = security_manager.mask_sensitive_data(settings.SESSION, 15)
                 logger.info(f"正在启动Userbot客户端 (Session: {masked_session})")
                 
-                # 获取代理配置
-                pyrogram_proxy = self._get_pyrogram_proxy()
+                # 会话存储（文件会话或SESSION字符串）
+                session_kwargs = await self._session_kwargs(f"saverestricted{self.session_suffix}", settings.SESSION)
                 
-                # 创建Pyrogram客户端（Userbot）
-                if pyrogram_proxy:
-                    pyrogram_proxy_config = self._create_pyrogram_proxy_config(pyrogram_proxy)
-                    if pyrogram_proxy_config:
-                        logger.info(f"Userbot使用代理: {pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config.get('username', '')}@{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}")
-                    
-                    # 对于HTTP代理认证，Pyrogram可能不支持通过proxy参数传递
-                    # 尝试使用环境变量设置代理
-                    if pyrogram_proxy_config and pyrogram_proxy_config['scheme'] in ['http', 'https']:
-                        import os
-                        # 检查是否有认证信息
-                        if pyrogram_proxy_config.get('username') and pyrogram_proxy_config.get('password'):
-                            proxy_url = f"{pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config['username']}:{pyrogram_proxy_config['password']}@{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}"
-                        else:
-                            proxy_url = f"{pyrogram_proxy_config['scheme']}://{pyrogram_proxy_config['hostname']}:{pyrogram_proxy_config['port']}"
-                        os.environ['HTTP_PROXY'] = proxy_url
-                        os.environ['HTTPS_PROXY'] = proxy_url
-                        logger.info(f"通过环境变量设置代理: {proxy_url}")
-                        # 不传递proxy参数，让Pyrogram使用环境变量
-                        self.userbot = Client(
-                            "saverestricted", 
-                            session_string=settings.SESSION, 
-                            api_hash=settings.API_HASH, 
-                            api_id=settings.API_ID
-                        )
-                    else:
-                        # 对于SOCKS代理或其他情况，正常使用proxy参数
-                        self.userbot = Client(
-                            "saverestricted", 
-                            session_string=settings.SESSION, 
-                            api_hash=settings.API_HASH, 
-                            api_id=settings.API_ID,
-                            proxy=pyrogram_proxy_config
-                        )
-                else:
-                    self.userbot = Client(
-                        "saverestricted", 
-                        session_string=settings.SESSION, 
-                        api_hash=settings.API_HASH, 
-                        api_id=settings.API_ID
-                    )
+                # 创建Pyrogram客户端（Userbot），启动成功后才设为主Userbot并加入账号池，
+                # 避免下载请求拿到尚未连接的客户端
+                client = Client(
+                    f"saverestricted{self.session_suffix}", 
+                    **session_kwargs, 
+                    api_hash=settings.API_HASH, 
+                    api_id=settings.API_ID,
+                    proxy=self._get_pyrogram_proxy(f"saverestricted{self.session_suffix}")
+                )
+                self.media_sessions.install(client)
                 
                 # 尝试启动Userbot
                 try:
-                    await self.userbot.start()
+                    await client.start()
+                    self.userbot = client
                     logger.info("Userbot客户端启动成功")
                 except Exception as start_error:
                     error_msg = str(start_error).lower()
@@ -466,6 +500,10 @@ class ClientManager:
                         logger.info("2. /generatesession - 在线生成SESSION字符串")
                         self.userbot = None
                         return
+
+                    # 其他错误同样不能保留之前的客户端（例如刷新SESSION时已停止的旧客户端），
+                    # 否则它仍会作为主Userbot和账号池中的primary账号被使用
+                    self.userbot = None
             else:
                 logger.warning("未配置SESSION，Userbot将以有限功能运行")
                 logger.info("提示：您可以使用以下命令来添加SESSION：")
@@ -480,6 +518,144 @@ class ClientManager:
             logger.info("2. /generatesession - 在线生成SESSION字符串")
             self.userbot = None
     
+    async def _session_kwargs(self, name: str, session_string: str) -> Dict[str, Any]:
+        """获取创建Userbot时的会话参数
+        
+        启用持久化会话时使用 SESSION_DIR 下的会话文件，重启后保留peer缓存；
+        否则（或会话文件不可用时）使用内存中的SESSION字符串。
+        """
+        if settings.PERSISTENT_SESSIONS and await prepare_session_file(name, session_string, settings.SESSION_DIR):
+            return {"workdir": settings.SESSION_DIR}
+        return {"session_string": session_string}
+    
+    async def _create_userbot_client(self, name: str, session_string: str) -> Client:
+        """创建Userbot客户端，各客户端按名称分配到不同的代理"""
+        client = Client(
+            name,
+            **await self._session_kwargs(name, session_string),
+            api_hash=settings.API_HASH,
+            api_id=settings.API_ID,
+            proxy=self._get_pyrogram_proxy(name)
+        )
+        self.media_sessions.install(client)
+        return client
+    
+    async def _init_userbot_pool(self):
+        """启动账号池中除主Userbot以外的账号（数据库中其他用户保存的SESSION）"""
+        if not settings.USERBOT_POOL:
+            return
+        
+        async def start_account(user_id: int, session_string: str):
+            client = await self._create_userbot_client(f"pool_{user_id}{self.session_suffix}", session_string)
+            try:
+                await asyncio.wait_for(client.start(), timeout=settings.CLIENT_START_TIMEOUT)
+            except Exception as e:
+                logger.warning(f"用户 {user_id} 的SESSION启动失败，不加入账号池: {e}")
+                return
+            self.userbot_pool.add(user_id, client)
+        
+        # 各账号并发连接
+        sessions = await self.session_svc.get_all_sessions()
+        await asyncio.gather(*(
+            start_account(record["user_id"], record["session_string"])
+            for record in sessions
+            if record.get("session_string") and record["session_string"] != settings.SESSION
+        ))
+        
+        self.userbot_pool.start_health_checks()
+        logger.info(f"Userbot账号池已启动，账号数: {self.userbot_pool.size}")
+    
+    async def replace_userbot(self, session_string: str):
+        """启动新的主Userbot并替换当前客户端
+        
+        新客户端启动成功后才替换，替换后的新请求使用新客户端；旧客户端
+        在其上正在进行的下载结束后停止。启动失败时保留当前客户端并抛出异常。
+        
+        新旧客户端同时运行期间不能共用同一个会话文件，新客户端在主会话名和备用会话名之间交替。
+        
+        Args:
+            session_string: 新客户端使用的SESSION
+        """
+        base_name = f"saverestricted{self.session_suffix}"
+        current_name = self.userbot.name if self.userbot is not None else None
+        name = f"{base_name}_standby" if current_name == base_name else base_name
+        # 上一次被替换的客户端仍在使用这个会话名时先停止它
+        pending = self._retiring.get(name)
+        if pending is not None:
+            pending.cancel()
+            await asyncio.gather(pending, return_exceptions=True)
+        
+        client = await self._create_userbot_client(name, session_string)
+        await asyncio.wait_for(client.start(), timeout=settings.CLIENT_START_TIMEOUT)
+        
+        old_client, old_account = self.userbot, self.userbot_pool.get_account("primary")
+        self.userbot = client
+        settings.SESSION = session_string
+        if old_client is not None:
+            self._retire(old_client, old_account)
+        logger.info("已替换Userbot客户端")
+    
+    async def retire_userbot(self):
+        """停用当前主Userbot（SESSION失效且没有可替换的SESSION时）"""
+        old_client, old_account = self.userbot, self.userbot_pool.get_account("primary")
+        self.userbot = None
+        if old_client is not None:
+            self._retire(old_client, old_account)
+    
+    def _retire(self, client: Client, account: Optional[PoolAccount], grace: float = 600.0):
+        """等待旧客户端上的下载结束（最多 grace 秒）后停止该客户端"""
+        async def retire():
+            deadline = time.monotonic() + grace
+            try:
+                while account is not None and account.active > 0 and time.monotonic() < deadline:
+                    await asyncio.sleep(1)
+            finally:
+                try:
+                    await client.stop()
+                except Exception as e:
+                    logger.debug(f"停止旧Userbot客户端失败: {e}")
+        
+        task = asyncio.create_task(retire())
+        self._retiring[client.name] = task
+        task.add_done_callback(
+            lambda t: self._retiring.pop(client.name, None) if self._retiring.get(client.name) is t else None)
+    
+    async def _start_user_client(self, user_id: int) -> Optional[Client]:
+        """使用用户保存的SESSION启动其Userbot，没有SESSION时返回None"""
+        session_string = await self.session_svc.get_session(user_id)
+        if not session_string:
+            return None
+        client = await self._create_userbot_client(f"user_{user_id}{self.session_suffix}", session_string)
+        await client.start()
+        return client
+    
+    @asynccontextmanager
+    async def acquire_user_client(self, user_id: int, chat: Any = None):
+        """获取请求者本人的Userbot
+        
+        所有者不使用专属账号（返回None），由调用方通过账号池按负载选择；
+        已在账号池中的用户通过账号池租用，优先使用其本人的账号，计入负载并遵守冷却；
+        其他用户按需启动并缓存其本人的客户端。
+        
+        Args:
+            user_id: 请求者用户ID
+            chat: 要访问的聊天
+        
+        Yields:
+            Optional[Client]: 用于本次请求的客户端，没有专属账号时为None
+        """
+        if user_id == settings.AUTH:
+            yield None
+            return
+        
+        if self.userbot_pool.get(user_id) is not None:
+            async with self.userbot_pool.acquire(chat, prefer=user_id) as pooled:
+                yield pooled
+            return
+        
+        async with self.user_clients.acquire(user_id) as client:
+            yield client
+    
     def _validate_and_fix_session(self, session_string: str) -> Optional[str]:
         """验证SESSION格式并返回修正后的SESSION
         
@@ -555,14 +731,28 @@ class ClientManager:
         try:
             logger.info("正在停止所有客户端...")
             
+            await self.supervisor.stop()
+            await self.proxy_pool.stop()
+            await self.media_sessions.stop()
+            if self._userbot_task and not self._userbot_task.done():
+                self._userbot_task.cancel()
+            
+            retiring = list(self._retiring.values())
+            for task in retiring:
+                task.cancel()
+            await asyncio.gather(*retiring, return_exceptions=True)
+            
             if self.bot:
                 await self.bot.disconnect()
                 logger.info("Telethon bot客户端已停止")
                 
-            if self.pyrogram_bot:
+            if self.pyrogram_bot and self.pyrogram_bot.is_connected:
                 await self.pyrogram_bot.stop()
                 logger.info("Pyrogram bot客户端已停止")
                 
+            await self.user_clients.stop()
+            await self.userbot_pool.stop()
+            
             if self.userbot:
                 await self.userbot.stop()
                 logger.info("Userbot客户端已停止")
@@ -572,60 +762,55 @@ class ClientManager:
             logger.error(f"停止客户端时出错: {e}")
     
     async def refresh_userbot_session(self, new_session: str) -> bool:
-        """刷新Userbot SESSION"""
-        try:
-            corrected_session = self._validate_and_fix_session(new_session)
-            # 如果SESSION验证失败，记录错误并继续使用原始SESSION
-            if corrected_session is None:
-                logger.warning("SESSION验证失败，将使用原始SESSION尝试初始化")
-                corrected_session = new_session
-            
-            # 停止当前userbot
-            if self.userbot:
-                try:
-                    await self.userbot.stop()
-                except:
-                    pass
-            
-            # 更新配置
-            settings.SESSION = corrected_session
-            
-            # 重新初始化userbot
-            await self._init_userbot()
-            
-            logger.info("Userbot SESSION刷新成功")
-            return self.userbot is not None and self.userbot.is_connected
-        except Exception as e:
-            logger.error(f"刷新Userbot SESSION时出错: {e}")
-            # 即使出错也尝试使用原始SESSION初始化
+        """刷新Userbot SESSION
+        
+        通过 replace_userbot 启动新客户端：启动成功后才替换，旧客户端在其上的下载结束后停止；
+        全部尝试失败时保留当前客户端。依次尝试修正后的SESSION、原始SESSION和数据库中的SESSION。
+        """
+        corrected_session = self._validate_and_fix_session(new_session)
+        # 如果SESSION验证失败，记录错误并继续使用原始SESSION
+        if corrected_session is None:
+            logger.warning("SESSION验证失败，将使用原始SESSION尝试初始化")
+            corrected_session = new_session
+        
+        candidates = [corrected_session]
+        if new_session != corrected_session:
+            candidates.append(new_session)
+        
+        for index, session_string in enumerate(candidates):
             try:
-                settings.SESSION = new_session
-                await self._init_userbot()
-                logger.info("Userbot SESSION使用原始字符串刷新成功")
-                return self.userbot is not None and self.userbot.is_connected
-            except Exception as fallback_error:
-                logger.error(f"使用原始SESSION刷新也失败: {fallback_error}")
-                # 最后的备用方案：尝试使用数据库中的SESSION
-                try:
-                    db_session = await self.session_svc.get_session(settings.AUTH)
-                    if db_session and db_session != new_session:
-                        logger.info("尝试使用数据库中的SESSION作为最后备用方案")
-                        settings.SESSION = db_session
-                        await self._init_userbot()
-                        logger.info("使用数据库SESSION刷新Userbot成功")
-                        return self.userbot is not None and self.userbot.is_connected
-                except Exception as last_fallback_error:
-                    logger.error(f"使用数据库SESSION作为备用方案也失败: {last_fallback_error}")
-                return False
+                await self.replace_userbot(session_string)
+                logger.info("Userbot SESSION刷新成功" if index == 0 else "Userbot SESSION使用原始字符串刷新成功")
+                return True
+            except Exception as e:
+                logger.error(f"刷新Userbot SESSION时出错: {e}")
+        
+        # 最后的备用方案：尝试使用数据库中的SESSION
+        try:
+            db_session = await self.session_svc.get_session(settings.AUTH)
+            if db_session and db_session not in candidates:
+                logger.info("尝试使用数据库中的SESSION作为最后备用方案")
+                await self.replace_userbot(db_session)
+                logger.info("使用数据库SESSION刷新Userbot成功")
+                return True
+        except Exception as last_fallback_error:
+            logger.error(f"使用数据库SESSION作为备用方案也失败: {last_fallback_error}")
+        return False
     
     def get_client_status(self) -> dict:
         """获取客户端状态"""
         return {
             "telethon_bot": self.bot is not None,
             "pyrogram_bot": self.pyrogram_bot is not None and self.pyrogram_bot.is_connected,
+            "bot_backend": settings.BOT_BACKEND,
+            "media_sessions": self.media_sessions.get_stats(),
             "userbot": self.userbot is not None and self.userbot.is_connected,
+            "userbot_pool": self.userbot_pool.size,
+            "states": dict(self.client_states),
+            "user_clients": self.user_clients.size,
             "session_configured": settings.SESSION is not None,
-            "proxy_enabled": self.proxy_config is not None
+            "proxy_enabled": self.proxy_pool.size > 0,
+            "proxies": self.proxy_pool.get_stats()
         }
 
 
@@ -0,0 +1,164 @@
+"""连接监控模块
+
+定期检查Telethon bot、Pyrogram bot和主Userbot的连接，连续多次检查失败后才判定连接中断，
+按指数退避自动重连。Userbot重连时先启动新客户端再替换旧客户端，旧客户端等正在进行的
+下载（账号池中的租用计数）结束后才停止。
+"""
+import asyncio
+import logging
+import time
+from typing import Dict, Optional, TYPE_CHECKING
+
+from pyrogram.errors import Unauthorized
+
+from ..config import settings
+
+if TYPE_CHECKING:
+    from .clients import ClientManager
+
+logger = logging.getLogger(__name__)
+
+
+class ConnectionSupervisor:
+    """Telegram客户端连接监控"""
+
+    CLIENTS = ("telethon_bot", "pyrogram_bot", "userbot")
+
+    def __init__(self, manager: "ClientManager", interval: float = 30.0, ping_timeout: float = 10.0,
+                 max_backoff: float = 300.0, failure_threshold: int = 3, retry_interval: float = 5.0):
+        """
+        Args:
+            manager: 客户端管理器
+            interval: 正常情况下的检查间隔（秒）
+            ping_timeout: 单次检查的超时时间（秒）
+            max_backoff: 重连失败后的最长等待时间（秒）
+            failure_threshold: 连续多少次检查失败后才重连
+            retry_interval: 检查失败后再次确认的间隔（秒）
+        """
+        self.manager = manager
+        self.interval = interval
+        self.ping_timeout = ping_timeout
+        self.max_backoff = max_backoff
+        self.failure_threshold = max(1, failure_threshold)
+        self.retry_interval = retry_interval
+        self._failures: Dict[str, int] = {}
+        self._next_check: Dict[str, float] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """启动监控任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"连接监控已启动，检查间隔: {self.interval}秒")
+
+    async def stop(self):
+        """停止监控任务"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            # 以较短的间隔轮询，使重连退避可以精确到秒
+            await asyncio.sleep(1)
+            now = time.monotonic()
+            for name in self.CLIENTS:
+                if now >= self._next_check.get(name, 0):
+                    await self._check(name)
+
+    def _get_client(self, name: str):
+        if name == "telethon_bot":
+            return self.manager.bot
+        if name == "pyrogram_bot":
+            return self.manager.pyrogram_bot
+        return self.manager.userbot
+
+    async def _ping(self, name: str, client) -> bool:
+        if name == "telethon_bot" and not client.is_connected():
+            return False
+        if name != "telethon_bot" and not client.is_connected:
+            return False
+        await asyncio.wait_for(client.get_me(), timeout=self.ping_timeout)
+        return True
+
+    async def _check(self, name: str):
+        client = self._get_client(name)
+        # 仍在启动中、按需启动尚未使用或未配置的客户端不监控
+        if client is None or self.manager.client_states.get(name) in ("starting", "idle"):
+            self._next_check[name] = time.monotonic() + self.interval
+            return
+
+        try:
+            healthy = await self._ping(name, client)
+        except Unauthorized as e:
+            if name == "userbot":
+                await self._on_userbot_revoked(e)
+                self._next_check[name] = time.monotonic() + self.interval
+                return
+            healthy = False
+        except Exception as e:
+            logger.warning(f"{name} 连接检查失败: {e}")
+            healthy = False
+
+        if healthy:
+            if self._failures.pop(name, 0):
+                logger.info(f"{name} 连接已恢复")
+            self.manager.client_states[name] = "ready"
+            self._next_check[name] = time.monotonic() + self.interval
+            return
+
+        failures = self._failures.get(name, 0) + 1
+        self._failures[name] = failures
+        if failures < self.failure_threshold:
+            # 偶发的检查失败（例如一次超时）不立即重连，稍后再次确认
+            self._next_check[name] = time.monotonic() + min(self.retry_interval, self.interval)
+            return
+        
+        self.manager.client_states[name] = "reconnecting"
+        try:
+            await self._reconnect(name, client)
+            logger.info(f"{name} 重连成功")
+            self._failures.pop(name, None)
+            self.manager.client_states[name] = "ready"
+            self._next_check[name] = time.monotonic() + self.interval
+        except Exception as e:
+            attempts = failures - self.failure_threshold + 1
+            backoff = min(2 ** attempts, self.max_backoff)
+            logger.warning(f"{name} 第 {attempts} 次重连失败: {e}，{backoff} 秒后重试")
+            self._next_check[name] = time.monotonic() + backoff
+
+    async def _reconnect(self, name: str, client):
+        if name == "telethon_bot":
+            # 断开Telethon会结束 run_until_disconnected，只重连已断开的客户端
+            if not client.is_connected():
+                await asyncio.wait_for(client.connect(), timeout=settings.CLIENT_START_TIMEOUT)
+        elif name == "pyrogram_bot":
+            try:
+                await client.stop()
+            except Exception:
+                pass
+            await asyncio.wait_for(client.start(), timeout=settings.CLIENT_START_TIMEOUT)
+        else:
+            # 新客户端启动成功后再替换，旧客户端上正在进行的下载不受影响
+            await self.manager.replace_userbot(settings.SESSION)
+
+    async def _on_userbot_revoked(self, error: Exception):
+        """SESSION被撤销时改用数据库中更新过的SESSION，没有时停用Userbot"""
+        logger.error(f"Userbot SESSION已失效: {error}")
+        self.manager.client_states["userbot"] = "revoked"
+        try:
+            db_session = await self.manager.session_svc.get_session(settings.AUTH)
+            if db_session and db_session != settings.SESSION:
+                await self.manager.replace_userbot(db_session)
+                self.manager.client_states["userbot"] = "ready"
+                logger.info("已使用数据库中的SESSION恢复Userbot")
+                return
+        except Exception as e:
+            logger.error(f"使用数据库中的SESSION恢复Userbot失败: {e}")
+
+        await self.manager.retire_userbot()
+        logger.warning("Userbot已停用，请使用 /addsession 添加新的SESSION")
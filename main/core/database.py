@@ -134,6 +134,13 @@ class DatabaseManager:
             self.db.users.create_index("last_reset_daily")
             self.db.users.create_index("last_reset_monthly")
             
+            # 媒体缓存索引
+            self.db.media_cache.create_index([("chat_id", 1), ("message_id", 1)], unique=True)
+            self.db.media_cache.create_index("file_unique_id")
+            
+            # 缩略图索引
+            self.db.thumbnails.create_index("user_id", unique=True)
+            
             logger.info("数据库索引创建完成")
         except Exception as e:
             logger.warning(f"创建索引失败: {e}")
@@ -1067,6 +1074,172 @@ class DatabaseManager:
                 logger.error(f"获取所有会话失败: {e}")
                 return []
 
+    
+    # ==================== 媒体缓存 ====================
+    
+    async def get_cached_media(self, chat_id: str, message_id: int) -> Optional[Dict[str, Any]]:
+        """按源消息获取已上传媒体的缓存记录
+        
+        Args:
+            chat_id: 源聊天ID或用户名
+            message_id: 源消息ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 缓存记录，如果不存在则返回None
+        """
+        async with self._lock:
+            if self.db is None:
+                return None
+            
+            try:
+                self._ensure_connection()
+                return self.db.media_cache.find_one({"chat_id": chat_id, "message_id": message_id}, {"_id": 0})
+            except Exception as e:
+                logger.error(f"获取媒体缓存失败: {e}")
+                return None
+    
+    async def get_cached_media_by_unique_id(self, file_unique_id: str) -> Optional[Dict[str, Any]]:
+        """按源文件的file_unique_id获取已上传媒体的缓存记录
+        
+        Args:
+            file_unique_id: 源文件的唯一ID
+            
+        Returns:
+            Optional[Dict[str, Any]]: 缓存记录，如果不存在则返回None
+        """
+        async with self._lock:
+            if self.db is None:
+                return None
+            
+            try:
+                self._ensure_connection()
+                return self.db.media_cache.find_one({"file_unique_id": file_unique_id}, {"_id": 0})
+            except Exception as e:
+                logger.error(f"获取媒体缓存失败: {e}")
+                return None
+    
+    async def save_cached_media(self, chat_id: str, message_id: int, record: Dict[str, Any]) -> bool:
+        """保存已上传媒体的缓存记录
+        
+        Args:
+            chat_id: 源聊天ID或用户名
+            message_id: 源消息ID
+            record: 缓存内容（file_id、file_unique_id、media_type等）
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        async with self._lock:
+            if self.db is None:
+                return False
+            
+            try:
+                self._ensure_connection()
+                self.db.media_cache.update_one(
+                    {"chat_id": chat_id, "message_id": message_id},
+                    {"$set": {**record, "updated_at": datetime.now()}},
+                    upsert=True
+                )
+                return True
+            except Exception as e:
+                logger.error(f"保存媒体缓存失败: {e}")
+                return False
+    
+    async def delete_cached_media(self, file_id: str) -> bool:
+        """删除引用指定file_id的所有缓存记录
+        
+        Args:
+            file_id: 已失效的file_id
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        async with self._lock:
+            if self.db is None:
+                return False
+            
+            try:
+                self._ensure_connection()
+                self.db.media_cache.delete_many({"file_id": file_id})
+                return True
+            except Exception as e:
+                logger.error(f"删除媒体缓存失败: {e}")
+                return False
+
+    
+    # ==================== 缩略图 ====================
+    
+    async def get_thumbnail(self, user_id: int) -> Optional[bytes]:
+        """获取用户自定义缩略图
+        
+        Args:
+            user_id: 用户ID
+            
+        Returns:
+            Optional[bytes]: JPEG数据，如果不存在则返回None
+            
+        Raises:
+            DatabaseOperationError: 查询失败（与缩略图不存在区分开，调用方不应因此删除本地副本）
+        """
+        async with self._lock:
+            if self.db is None:
+                return None
+            
+            try:
+                self._ensure_connection()
+                doc = self.db.thumbnails.find_one({"user_id": user_id})
+            except Exception as e:
+                logger.error(f"获取缩略图失败: {e}")
+                raise DatabaseOperationError(f"获取缩略图失败: {e}")
+            return bytes(doc["data"]) if doc else None
+    
+    async def save_thumbnail(self, user_id: int, data: bytes) -> bool:
+        """保存用户自定义缩略图
+        
+        Args:
+            user_id: 用户ID
+            data: JPEG数据
+            
+        Returns:
+            bool: 操作是否成功
+        """
+        async with self._lock:
+            if self.db is None:
+                return False
+            
+            try:
+                self._ensure_connection()
+                self.db.thumbnails.update_one(
+                    {"user_id": user_id},
+                    {"$set": {"data": data, "updated_at": datetime.now()}},
+                    upsert=True
+                )
+                return True
+            except Exception as e:
+                logger.error(f"保存缩略图失败: {e}")
+                return False
+    
+    async def delete_thumbnail(self, user_id: int) -> bool:
+        """删除用户自定义缩略图
+        
+        Args:
+            user_id: 用户ID
+            
+        Returns:
+            bool: 是否删除了已有的缩略图
+        """
+        async with self._lock:
+            if self.db is None:
+                return False
+            
+            try:
+                self._ensure_connection()
+                result = self.db.thumbnails.delete_one({"user_id": user_id})
+                return result.deleted_count > 0
+            except Exception as e:
+                logger.error(f"删除缩略图失败: {e}")
+                return False
+
 
 # 全局数据库管理器实例
 db_manager = DatabaseManager()
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""媒体DC会话池模块
+
+Pyrogram 的 get_file 每下载一个文件都会新建一个媒体会话，文件位于其他DC时还要重新
+生成授权密钥并导出/导入授权，下载完成后立即断开。批量下载同一频道的文件时，
+这些握手占用了大部分时间。
+
+这里为Userbot替换 get_file：每个客户端按DC保留一个已授权的媒体会话
+（保存在 client.media_sessions 中，客户端停止时由Pyrogram一并断开），
+连续下载复用同一个会话，空闲超时的会话由后台任务断开。
+
+实现依赖Pyrogram 2.0.106 的内部属性（requirements.txt 中固定了该版本），
+客户端缺少这些属性时不替换 get_file，继续使用Pyrogram原有的下载流程。
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import time
+import weakref
+from typing import Dict, Optional, Any
+
+from pyrogram import Client, raw
+from pyrogram.errors import AuthBytesInvalid, Unauthorized
+from pyrogram.file_id import FileId, FileType, ThumbnailSource
+from pyrogram.session import Session
+from pyrogram.session.auth import Auth
+from pyrogram import utils
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1024 * 1024
+
+# 会话池使用的Pyrogram客户端内部属性
+_REQUIRED_ATTRS = ("media_sessions", "media_sessions_lock", "get_file_semaphore", "storage", "executor")
+
+
+def _file_location(file_id: FileId):
+    """根据file_id构造 upload.GetFile 使用的文件位置"""
+    if file_id.file_type == FileType.CHAT_PHOTO:
+        if file_id.chat_id > 0:
+            peer = raw.types.InputPeerUser(user_id=file_id.chat_id, access_hash=file_id.chat_access_hash)
+        elif file_id.chat_access_hash == 0:
+            peer = raw.types.InputPeerChat(chat_id=-file_id.chat_id)
+        else:
+            peer = raw.types.InputPeerChannel(
+                channel_id=utils.get_channel_id(file_id.chat_id),
+                access_hash=file_id.chat_access_hash
+            )
+        return raw.types.InputPeerPhotoFileLocation(
+            peer=peer,
+            photo_id=file_id.media_id,
+            big=file_id.thumbnail_source == ThumbnailSource.CHAT_PHOTO_BIG
+        )
+    if file_id.file_type == FileType.PHOTO:
+        return raw.types.InputPhotoFileLocation(
+            id=file_id.media_id,
+            access_hash=file_id.access_hash,
+            file_reference=file_id.file_reference,
+            thumb_size=file_id.thumbnail_size
+        )
+    return raw.types.InputDocumentFileLocation(
+        id=file_id.media_id,
+        access_hash=file_id.access_hash,
+        file_reference=file_id.file_reference,
+        thumb_size=file_id.thumbnail_size
+    )
+
+
+class MediaSessionPool:
+    """按客户端和DC复用的媒体会话池"""
+
+    def __init__(self, idle_timeout: float = 300.0):
+        """
+        Args:
+            idle_timeout: 会话空闲多少秒后断开
+        """
+        self.idle_timeout = idle_timeout
+        # 客户端 -> {DC: 最后使用时间}，客户端被回收后自动移除
+        self._last_used: "weakref.WeakKeyDictionary[Client, Dict[int, float]]" = weakref.WeakKeyDictionary()
+        self._reaper: Optional[asyncio.Task] = None
+        self.created = 0
+        self.reused = 0
+
+    def install(self, client: Client):
+        """让客户端的文件下载使用会话池"""
+        if client in self._last_used:
+            return
+        missing = [attr for attr in _REQUIRED_ATTRS if not hasattr(client, attr)]
+        if missing:
+            logger.warning(f"当前Pyrogram版本缺少 {', '.join(missing)}，媒体会话池未启用")
+            return
+        self._last_used[client] = {}
+        original_get_file = client.get_file
+
+        async def get_file(file_id: FileId, file_size: int = 0, limit: int = 0, offset: int = 0,
+                           progress=None, progress_args: tuple = ()):
+            async for chunk in self._get_file(client, original_get_file, file_id, file_size,
+                                              limit, offset, progress, progress_args):
+                yield chunk
+
+        # 实例属性优先于类方法，download_media / stream_media 都会经过这里
+        client.get_file = get_file
+
+    async def _create_session(self, client: Client, dc_id: int) -> Session:
+        test_mode = await client.storage.test_mode()
+        if dc_id == await client.storage.dc_id():
+            session = Session(client, dc_id, await client.storage.auth_key(), test_mode, is_media=True)
+            await session.start()
+            return session
+
+        session = Session(client, dc_id, await Auth(client, dc_id, test_mode).create(), test_mode, is_media=True)
+        await session.start()
+        for _ in range(3):
+            exported_auth = await client.invoke(raw.functions.auth.ExportAuthorization(dc_id=dc_id))
+            try:
+                await session.invoke(raw.functions.auth.ImportAuthorization(
+                    id=exported_auth.id,
+                    bytes=exported_auth.bytes
+                ))
+            except AuthBytesInvalid:
+                continue
+            return session
+        await session.stop()
+        raise AuthBytesInvalid
+
+    async def _session(self, client: Client, dc_id: int) -> Session:
+        async with client.media_sessions_lock:
+            session = client.media_sessions.get(dc_id)
+            if session is None:
+                session = await self._create_session(client, dc_id)
+                client.media_sessions[dc_id] = session
+                self.created += 1
+                logger.debug(f"已建立DC{dc_id}的媒体会话")
+            else:
+                self.reused += 1
+        self._last_used.setdefault(client, {})[dc_id] = time.monotonic()
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._reap_idle())
+        return session
+
+    async def _discard(self, client: Client, dc_id: int):
+        async with client.media_sessions_lock:
+            session = client.media_sessions.pop(dc_id, None)
+        self._last_used.get(client, {}).pop(dc_id, None)
+        if session is not None:
+            try:
+                await session.stop()
+            except Exception as e:
+                logger.debug(f"断开DC{dc_id}的媒体会话失败: {e}")
+
+    async def _invoke(self, client: Client, dc_id: int, query):
+        """通过DC的媒体会话发送请求，会话失效时重建一次"""
+        for attempt in range(2):
+            session = await self._session(client, dc_id)
+            try:
+                return await session.invoke(query, sleep_threshold=30)
+            except (OSError, TimeoutError, Unauthorized) as e:
+                await self._discard(client, dc_id)
+                if attempt:
+                    raise
+                logger.warning(f"DC{dc_id}的媒体会话不可用，重新建立: {e}")
+
+    async def _get_file(self, client: Client, original_get_file, file_id: FileId, file_size: int,
+                        limit: int, offset: int, progress, progress_args: tuple):
+        dc_id = file_id.dc_id
+        location = _file_location(file_id)
+        total = abs(limit) or (1 << 31) - 1
+        offset_bytes = abs(offset) * CHUNK_SIZE
+        current = 0
+        cdn_redirect = False
+
+        async with client.get_file_semaphore:
+            while True:
+                r = await self._invoke(client, dc_id, raw.functions.upload.GetFile(
+                    location=location,
+                    offset=offset_bytes,
+                    limit=CHUNK_SIZE
+                ))
+                if isinstance(r, raw.types.upload.FileCdnRedirect):
+                    cdn_redirect = True
+                    break
+
+                chunk = r.bytes
+                yield chunk
+
+                current += 1
+                offset_bytes += CHUNK_SIZE
+                if progress:
+                    func = functools.partial(
+                        progress,
+                        min(offset_bytes, file_size) if file_size != 0 else offset_bytes,
+                        file_size,
+                        *progress_args
+                    )
+                    if inspect.iscoroutinefunction(progress):
+                        await func()
+                    else:
+                        await client.loop.run_in_executor(client.executor, func)
+
+                if len(chunk) < CHUNK_SIZE or current >= total:
+                    break
+
+        if cdn_redirect:
+            # CDN上的文件（只有大型频道的热门文件）仍由Pyrogram原有流程下载
+            async for chunk in original_get_file(file_id, file_size, limit, offset, progress, progress_args):
+                yield chunk
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 60.0))
+            now = time.monotonic()
+            for client, sessions in list(self._last_used.items()):
+                for dc_id, last_used in list(sessions.items()):
+                    if now - last_used > self.idle_timeout:
+                        logger.debug(f"断开空闲的DC{dc_id}媒体会话")
+                        await self._discard(client, dc_id)
+
+    async def stop(self):
+        """停止空闲清理任务（会话本身随客户端停止而断开）"""
+        if self._reaper:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取会话池统计"""
+        return {
+            "sessions": sum(len(sessions) for sessions in self._last_used.values()),
+            "created": self.created,
+            "reused": self.reused
+        }
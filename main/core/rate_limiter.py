@@ -108,6 +108,7 @@ class AdaptiveRateLimiter(RateLimiter):
         self.success_count = 0
         self.last_rate_adjustment = time.monotonic()
         self.rate_adjustment_interval = 60.0  # 速率调整间隔（秒）
+        self.last_flood_wait: Optional[float] = None  # 最近一次FloodWait的time.monotonic()时间戳
     
     async def on_flood_wait(self, wait_seconds: float) -> None:
         """收到FloodWait错误时调用"""
@@ -115,17 +116,25 @@ class AdaptiveRateLimiter(RateLimiter):
             return
         
         async with self.lock:
-            self.flood_wait_count += 1
-            
-            # 降低速率（至少降低到最小速率）
-            new_rate = max(self.min_rate, self.rate_per_second * 0.5)
-            if new_rate != self.rate_per_second:
-                self.rate_per_second = new_rate
-                logger.warning(f"收到FloodWait({wait_seconds:.1f}s)，降低速率至 {self.rate_per_second:.2f}/s")
+            self.record_flood_wait(wait_seconds)
             
             # 等待指定时间
             await asyncio.sleep(wait_seconds + 1)
     
+    def record_flood_wait(self, wait_seconds: float) -> None:
+        """记录一次FloodWait并降低速率，不等待"""
+        if self._closed:
+            return
+        
+        self.flood_wait_count += 1
+        self.last_flood_wait = time.monotonic()
+        
+        # 降低速率（至少降低到最小速率）
+        new_rate = max(self.min_rate, self.rate_per_second * 0.5)
+        if new_rate != self.rate_per_second:
+            self.rate_per_second = new_rate
+            logger.warning(f"收到FloodWait({wait_seconds:.1f}s)，降低速率至 {self.rate_per_second:.2f}/s")
+    
     async def on_success(self) -> None:
         """请求成功时调用"""
         if self._closed:
@@ -0,0 +1,66 @@
+"""Pyrogram会话文件模块
+
+使用 session_string 启动的Pyrogram客户端把会话保存在内存中，每次重启都会丢失
+已解析的peer（access_hash）缓存，重启后第一次访问频道需要重新解析。
+这里把SESSION字符串导入到 `<SESSION_DIR>/<名称>.session` SQLite文件中，
+之后直接使用文件会话启动客户端，peer缓存在重启后仍然有效。
+"""
+import logging
+import os
+from pathlib import Path
+
+from pyrogram.storage import FileStorage, MemoryStorage
+
+logger = logging.getLogger(__name__)
+
+# 从SESSION字符串复制到会话文件的字段
+_SESSION_FIELDS = ("dc_id", "api_id", "test_mode", "auth_key", "user_id", "is_bot", "date")
+
+
+async def prepare_session_file(name: str, session_string: str, workdir: str) -> bool:
+    """确保会话文件存在并与SESSION字符串一致
+
+    已有会话文件属于同一账号时只更新授权密钥，保留peer缓存；
+    属于其他账号时重新创建。
+
+    Args:
+        name: 客户端名称（会话文件名）
+        session_string: Pyrogram SESSION字符串
+        workdir: 会话文件目录
+
+    Returns:
+        bool: 会话文件是否可用，失败时调用方应继续使用SESSION字符串
+    """
+    os.makedirs(workdir, mode=0o700, exist_ok=True)
+    source = MemoryStorage(name, session_string)
+    target = FileStorage(name, Path(workdir))
+    try:
+        await source.open()
+        await target.open()
+
+        if await target.auth_key() == await source.auth_key():
+            return True
+
+        if await target.user_id() not in (None, await source.user_id()):
+            logger.info(f"会话文件 {name} 属于其他账号，重新创建")
+            await target.close()
+            await target.delete()
+            target = FileStorage(name, Path(workdir))
+            await target.open()
+
+        for field in _SESSION_FIELDS:
+            await getattr(target, field)(await getattr(source, field)())
+        await target.save()
+        # 会话文件包含授权密钥，只允许当前用户读写
+        os.chmod(target.database, 0o600)
+        logger.info(f"已从SESSION字符串导入会话文件: {target.database}")
+        return True
+    except Exception as e:
+        logger.warning(f"准备会话文件 {name} 失败，将使用内存会话: {e}")
+        return False
+    finally:
+        for storage in (source, target):
+            try:
+                await storage.close()
+            except Exception:
+                pass
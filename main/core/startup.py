@@ -27,10 +27,15 @@ def load_environment_variables():
             env_vars = [
                 'API_ID', 'API_HASH', 'BOT_TOKEN', 'AUTH', 'MONGO_DB',
                 'FORCESUB', 'SESSION', 'TELEGRAM_PROXY_SCHEME', 
-                'TELEGRAM_PROXY_HOST', 'TELEGRAM_PROXY_PORT',
-                'ENCRYPTION_KEY', 'MAX_WORKERS', 'CHUNK_SIZE',
+                'TELEGRAM_PROXY_HOST', 'TELEGRAM_PROXY_PORT', 'TELEGRAM_PROXIES',
+                'ENCRYPTION_KEY', 'MAX_WORKERS', 'MIN_WORKERS', 'MAX_TASKS_PER_USER', 'CHUNK_SIZE',
                 'DEFAULT_DAILY_LIMIT', 'DEFAULT_MONTHLY_LIMIT', 
-                'DEFAULT_PER_FILE_LIMIT', 'DEBUG', 'LOG_LEVEL'
+                'DEFAULT_PER_FILE_LIMIT', 'DEBUG', 'LOG_LEVEL',
+                'TASK_QUEUE_BACKEND', 'TASK_QUEUE_SQLITE_PATH', 'TASK_VISIBILITY_TIMEOUT',
+                'EXTERNAL_WORKERS', 'MEDIA_CACHE_DIR', 'MEDIA_CACHE_MAX_SIZE', 'USERBOT_POOL',
+                'USER_CLIENT_CACHE_SIZE', 'USER_CLIENT_IDLE_TIMEOUT', 'CLIENT_START_TIMEOUT',
+                'CONNECTION_CHECK_INTERVAL', 'BOT_BACKEND', 'PERSISTENT_SESSIONS', 'SESSION_DIR',
+                'MEDIA_SESSION_IDLE_TIMEOUT'
             ]
             
             loaded_vars = []
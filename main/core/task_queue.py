@@ -1,9 +1,12 @@
 """任务队列管理模块"""
 import asyncio
+import heapq
+import itertools
 import logging
 import time
 import uuid
-from typing import Optional, Callable, Any, Dict, List
+from collections import OrderedDict, deque
+from typing import Optional, Callable, Any, Dict, List, AsyncIterator
 from datetime import datetime
 from dataclasses import dataclass, asdict
 from enum import Enum
@@ -34,6 +37,7 @@ class TaskInfo:
     error: Optional[str] = None
     result: Any = None
     priority: int = 0
+    owner: Any = None
     task_func: Optional[Callable] = None
     args: tuple = ()
     kwargs: dict = None
@@ -43,25 +47,98 @@ class TaskInfo:
             self.kwargs = {}
 
 
+class TaskResult:
+    """已结束任务的精简记录
+    
+    只保留状态和结果，不持有任务函数及其参数的引用，便于长期保存。
+    """
+    __slots__ = ("task_id", "name", "status", "created_at", "started_at",
+                 "completed_at", "error", "result", "priority", "owner")
+    
+    def __init__(self, task_info: TaskInfo):
+        self.task_id = task_info.task_id
+        self.name = task_info.name
+        self.status = task_info.status
+        self.created_at = task_info.created_at
+        self.started_at = task_info.started_at
+        self.completed_at = task_info.completed_at
+        self.error = task_info.error
+        self.result = task_info.result
+        self.priority = task_info.priority
+        self.owner = task_info.owner
+    
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为字典"""
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
 class TaskQueueError(Exception):
     """任务队列异常"""
     pass
 
 
 class ImprovedTaskQueue:
-    """改进的任务队列系统"""
+    """改进的任务队列系统
+    
+    每个任务归属于一个owner（通常是用户ID），不同owner之间按赤字轮转（DRR）公平调度，
+    同一owner内部按优先级和入队顺序调度。
+    """
     
-    def __init__(self, max_workers: int = 3, queue_max_size: int = 1000):
+    def __init__(self, max_workers: int = 3, queue_max_size: int = 1000,
+                 completed_max_size: int = 1000, completed_ttl: float = 3600.0,
+                 sweep_interval: float = 60.0, priority_aging: float = 60.0,
+                 per_owner_limit: Optional[int] = None, min_workers: Optional[int] = None,
+                 scale_interval: float = 5.0, rate_limiter: Any = None,
+                 latency_tolerance: float = 2.0):
         self.max_workers = max_workers
+        # 工作线程数在[min_workers, max_workers]之间自动伸缩，未指定min_workers时固定为max_workers
+        self.min_workers = max_workers if min_workers is None else max(1, min(min_workers, max_workers))
+        self.scale_interval = scale_interval
+        # 提供last_flood_wait（time.monotonic时间戳）的速率限制器，用于感知Telegram限流
+        self.rate_limiter = rate_limiter
+        # 任务平均耗时超过基线的倍数后不再扩容
+        self.latency_tolerance = latency_tolerance
         self.queue_max_size = queue_max_size
+        # 单个owner同时运行的任务数上限，None表示不限制
+        self.per_owner_limit = per_owner_limit
+        # 已完成任务记录的容量上限（LRU淘汰）和保留时长（秒）
+        self.completed_max_size = completed_max_size
+        self.completed_ttl = completed_ttl
+        self.sweep_interval = sweep_interval
+        # 每提升一级优先级相当于提前入队的秒数，<=0时退化为严格优先级
+        self.priority_aging = priority_aging
         
-        # 使用asyncio.Queue替代deque，提供更好的线程安全性
-        self.pending_queue: asyncio.PriorityQueue = asyncio.PriorityQueue()
+        # 每个owner一个小顶堆，元素为(排序键, 入队序号, TaskInfo)
+        self._owner_queues: Dict[Any, list] = {}
+        # 有等待任务的owner轮转顺序、赤字计数、权重和运行中任务数
+        self._active_owners: deque = deque()
+        self._deficits: Dict[Any, float] = {}
+        self._owner_weights: Dict[Any, float] = {}
+        self._owner_running: Dict[Any, int] = {}
+        # 有新任务入队或owner释放运行名额时置位，唤醒空闲的工作线程
+        self._task_available = asyncio.Event()
+        # 单调递增的入队序号，保证同优先级先进先出且不会比较TaskInfo
+        self._sequence = itertools.count()
+        # 等待中/运行中/已完成三个索引，任务在任一时刻只存在于其中一个
+        self.pending_tasks: Dict[str, TaskInfo] = {}
         self.running_tasks: Dict[str, TaskInfo] = {}
-        self.completed_tasks: Dict[str, TaskInfo] = {}
+        self.completed_tasks: "OrderedDict[str, TaskResult]" = OrderedDict()
+        # 运行中任务对应的asyncio.Task，用于向任务协程传播取消
+        self._running_futures: Dict[str, asyncio.Task] = {}
+        # 等待任务结束的future，按需创建，任务结束时唤醒所有等待者
+        self._waiters: Dict[str, asyncio.Future] = {}
         self.workers: List[asyncio.Task] = []
+        self._worker_ids = itertools.count()
+        self._target_workers = self.min_workers
+        self._sweeper: Optional[asyncio.Task] = None
+        self._autoscaler: Optional[asyncio.Task] = None
         self.is_running = False
         
+        # 任务耗时的指数移动平均及观测到的最小值（作为基线）
+        self._latency_ewma: Optional[float] = None
+        self._latency_baseline: Optional[float] = None
+        self._last_scale_check = time.monotonic()
+        
         # 统计信息
         self.stats = {
             "total_tasks": 0,
@@ -81,11 +158,16 @@ class ImprovedTaskQueue:
             return
         
         self.is_running = True
-        self.workers = [
-            asyncio.create_task(self._worker(i))
-            for i in range(self.max_workers)
-        ]
-        logger.info(f"任务队列已启动，工作线程数: {self.max_workers}")
+        self._target_workers = self.min_workers
+        self._last_scale_check = time.monotonic()
+        self.workers = []
+        self._spawn_workers(self._target_workers)
+        self._sweeper = asyncio.create_task(self._sweep_completed())
+        if self.min_workers < self.max_workers:
+            self._autoscaler = asyncio.create_task(self._autoscale())
+            logger.info(f"任务队列已启动，工作线程数: {self.min_workers}（自动伸缩上限 {self.max_workers}）")
+        else:
+            logger.info(f"任务队列已启动，工作线程数: {self.max_workers}")
     
     async def stop(self, timeout: float = 5.0):
         """停止任务队列"""
@@ -95,6 +177,10 @@ class ImprovedTaskQueue:
         logger.info("正在停止任务队列...")
         self.is_running = False
         
+        for background in (self._sweeper, self._autoscaler):
+            if background and not background.done():
+                background.cancel()
+        
         # 取消所有工作线程
         for worker in self.workers:
             if not worker.done():
@@ -118,59 +204,58 @@ class ImprovedTaskQueue:
         while self.is_running:
             try:
                 # 从队列获取任务
-                priority, task_info = await self.pending_queue.get()
-                
-                # 检查任务是否已被取消
                 async with self._lock:
-                    if task_info.task_id not in self.running_tasks:
-                        self.pending_queue.task_done()
-                        continue
+                    # 缩容时多余的工作线程在领取下一个任务前退出
+                    if len(self.workers) > self._target_workers:
+                        self.workers.remove(asyncio.current_task())
+                        logger.info(f"工作线程 {worker_id} 因缩容退出")
+                        return
+                    
+                    task_info = self._pop_next_locked()
+                    if task_info is None:
+                        self._task_available.clear()
+                    else:
+                        # 更新任务状态为运行中
+                        del self.pending_tasks[task_info.task_id]
+                        task_info.status = TaskStatus.RUNNING
+                        task_info.started_at = datetime.now()
+                        self.running_tasks[task_info.task_id] = task_info
+                        self._owner_running[task_info.owner] = self._owner_running.get(task_info.owner, 0) + 1
+                        future = asyncio.ensure_future(self._execute_task(task_info))
+                        self._running_futures[task_info.task_id] = future
                 
-                logger.info(f"工作线程 {worker_id} 正在处理任务 {task_info.name} ({task_info.task_id})")
+                if task_info is None:
+                    await self._task_available.wait()
+                    continue
                 
-                # 更新任务状态为运行中
-                async with self._lock:
-                    task_info.status = TaskStatus.RUNNING
-                    task_info.started_at = datetime.now()
-                    self.running_tasks[task_info.task_id] = task_info
+                logger.info(f"工作线程 {worker_id} 正在处理任务 {task_info.name} ({task_info.task_id})")
                 
-                # 执行任务
+                started = time.monotonic()
                 try:
-                    # 这里需要从某个地方获取实际的任务函数和参数
-                    # 由于重构，我们需要重新设计任务执行方式
-                    result = await self._execute_task(task_info)
-                    
-                    # 更新任务状态为完成
-                    async with self._lock:
-                        task_info.status = TaskStatus.COMPLETED
-                        task_info.completed_at = datetime.now()
-                        task_info.result = result
-                        self.completed_tasks[task_info.task_id] = task_info
-                        del self.running_tasks[task_info.task_id]
-                    
-                    async with self._stats_lock:
-                        self.stats["completed_tasks"] += 1
-                        self.stats["total_tasks"] += 1
-                    
+                    result = await future
+                    self._observe_latency(time.monotonic() - started)
+                    await self._finish_task(task_info, TaskStatus.COMPLETED, result=result)
                     logger.info(f"任务 {task_info.name} ({task_info.task_id}) 执行成功")
                     
+                except asyncio.CancelledError:
+                    # cancel_task会先把状态置为CANCELLED
+                    if task_info.status == TaskStatus.CANCELLED:
+                        logger.info(f"任务 {task_info.name} ({task_info.task_id}) 在运行中被取消")
+                    elif self._is_stopping_worker():
+                        future.cancel()
+                        await self._finish_task(task_info, TaskStatus.CANCELLED)
+                        raise
+                    else:
+                        # 任务自身抛出的CancelledError（例如内部的子任务被取消），工作线程继续运行
+                        logger.warning(f"任务 {task_info.name} ({task_info.task_id}) 内部被取消")
+                        await self._finish_task(task_info, TaskStatus.FAILED, error="任务内部被取消")
+                    
                 except Exception as e:
                     logger.error(f"任务 {task_info.name} ({task_info.task_id}) 执行失败: {e}", exc_info=True)
-                    
-                    # 更新任务状态为失败
-                    async with self._lock:
-                        task_info.status = TaskStatus.FAILED
-                        task_info.completed_at = datetime.now()
-                        task_info.error = str(e)
-                        self.completed_tasks[task_info.task_id] = task_info
-                        del self.running_tasks[task_info.task_id]
-                    
-                    async with self._stats_lock:
-                        self.stats["failed_tasks"] += 1
-                        self.stats["total_tasks"] += 1
+                    await self._finish_task(task_info, TaskStatus.FAILED, error=str(e))
                 
                 finally:
-                    self.pending_queue.task_done()
+                    self._running_futures.pop(task_info.task_id, None)
                     
             except asyncio.CancelledError:
                 logger.info(f"工作线程 {worker_id} 被取消")
@@ -181,6 +266,173 @@ class ImprovedTaskQueue:
         
         logger.info(f"工作线程 {worker_id} 已停止")
     
+    def _is_stopping_worker(self) -> bool:
+        """当前工作线程自身是否正在被取消（而不是其执行的任务抛出了CancelledError）"""
+        current = asyncio.current_task()
+        return not self.is_running or (current is not None and current.cancelling() > 0)
+    
+    async def _finish_task(self, task_info: TaskInfo, status: TaskStatus,
+                           result: Any = None, error: Optional[str] = None):
+        """将运行中的任务移入已完成索引"""
+        async with self._lock:
+            if task_info.task_id not in self.running_tasks:
+                # 已被cancel_task处理
+                return
+            task_info.status = status
+            task_info.completed_at = datetime.now()
+            task_info.result = result
+            task_info.error = error
+            del self.running_tasks[task_info.task_id]
+            self._release_owner_slot(task_info)
+            self._record_completed(task_info)
+        
+        stat_key = {
+            TaskStatus.COMPLETED: "completed_tasks",
+            TaskStatus.FAILED: "failed_tasks",
+            TaskStatus.CANCELLED: "cancelled_tasks",
+        }[status]
+        async with self._stats_lock:
+            self.stats[stat_key] += 1
+            self.stats["total_tasks"] += 1
+    
+    def _spawn_workers(self, count: int):
+        """启动指定数量的工作线程"""
+        for _ in range(count):
+            self.workers.append(asyncio.create_task(self._worker(next(self._worker_ids))))
+    
+    def _observe_latency(self, seconds: float):
+        """记录成功任务的耗时"""
+        if self._latency_ewma is None:
+            self._latency_ewma = seconds
+        else:
+            self._latency_ewma = 0.8 * self._latency_ewma + 0.2 * seconds
+        if self._latency_baseline is None or self._latency_ewma < self._latency_baseline:
+            self._latency_baseline = self._latency_ewma
+    
+    async def _autoscale(self):
+        """根据积压、任务耗时和FloodWait反馈定期调整工作线程数"""
+        while self.is_running:
+            try:
+                await asyncio.sleep(self.scale_interval)
+                async with self._lock:
+                    self._rescale_locked()
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"调整工作线程数时出错: {e}", exc_info=True)
+    
+    def _rescale_locked(self):
+        """在持有_lock的情况下计算目标工作线程数（加性增、乘性减）"""
+        now = time.monotonic()
+        last_check, self._last_scale_check = self._last_scale_check, now
+        current = self._target_workers
+        target = current
+        
+        last_flood_wait = getattr(self.rate_limiter, "last_flood_wait", None)
+        if last_flood_wait is not None and last_flood_wait >= last_check:
+            # Telegram开始限流，工作线程数减半
+            target = max(self.min_workers, current // 2)
+            reason = "收到FloodWait"
+        elif self.pending_tasks and len(self.running_tasks) >= current:
+            # 有积压且所有工作线程都在忙，耗时未明显恶化时逐个扩容
+            saturated = (self._latency_baseline is not None and self._latency_ewma is not None
+                         and self._latency_ewma > self._latency_baseline * self.latency_tolerance)
+            if not saturated:
+                target = min(self.max_workers, current + 1)
+            reason = "队列积压"
+        elif not self.pending_tasks and len(self.running_tasks) < current:
+            target = max(self.min_workers, current - 1)
+            reason = "工作线程空闲"
+        
+        if target == current:
+            return
+        
+        self._target_workers = target
+        if target > len(self.workers):
+            self._spawn_workers(target - len(self.workers))
+        else:
+            # 唤醒空闲的工作线程让多余的退出
+            self._task_available.set()
+        logger.info(f"{reason}，工作线程数调整: {current} -> {target}")
+    
+    def _pop_next_locked(self) -> Optional[TaskInfo]:
+        """在持有_lock的情况下按DRR选出下一个可运行的任务
+        
+        轮到的owner每轮获得与其权重相等的额度，每运行一个任务消耗1；
+        已达到并发上限的owner本轮跳过但保留额度。已取消任务在堆中只是墓碑，在此丢弃。
+        """
+        skipped = 0
+        while self._active_owners and skipped < len(self._active_owners):
+            owner = self._active_owners[0]
+            heap = self._owner_queues[owner]
+            while heap and heap[0][2].status != TaskStatus.PENDING:
+                heapq.heappop(heap)
+            
+            if not heap:
+                self._active_owners.popleft()
+                del self._owner_queues[owner]
+                self._deficits.pop(owner, None)
+                continue
+            
+            if self.per_owner_limit is not None and self._owner_running.get(owner, 0) >= self.per_owner_limit:
+                self._active_owners.rotate(-1)
+                skipped += 1
+                continue
+            
+            if self._deficits[owner] < 1:
+                self._deficits[owner] += self._owner_weights.get(owner, 1)
+                if self._deficits[owner] < 1:
+                    # 权重小于1时额度跨轮累积，累积到1之前本轮跳过
+                    self._active_owners.rotate(-1)
+                    skipped = 0
+                    continue
+            _, _, task_info = heapq.heappop(heap)
+            self._deficits[owner] -= 1
+            if self._deficits[owner] < 1:
+                self._active_owners.rotate(-1)
+            return task_info
+        
+        return None
+    
+    def _release_owner_slot(self, task_info: TaskInfo):
+        """在持有_lock的情况下释放运行中任务占用的owner名额"""
+        remaining = self._owner_running.get(task_info.owner, 0) - 1
+        if remaining > 0:
+            self._owner_running[task_info.owner] = remaining
+        else:
+            self._owner_running.pop(task_info.owner, None)
+        if self.per_owner_limit is not None:
+            self._task_available.set()
+    
+    def set_owner_weight(self, owner: Any, weight: float):
+        """设置owner的调度权重，权重越大每轮可运行的任务越多"""
+        if weight <= 0:
+            raise ValueError("权重必须大于0")
+        self._owner_weights[owner] = weight
+    
+    def _record_completed(self, task_info: TaskInfo):
+        """在持有_lock的情况下保存已结束任务的精简记录，超出容量时淘汰最久未访问的记录"""
+        record = TaskResult(task_info)
+        self.completed_tasks[task_info.task_id] = record
+        self.completed_tasks.move_to_end(task_info.task_id)
+        
+        waiter = self._waiters.pop(task_info.task_id, None)
+        if waiter is not None and not waiter.done():
+            waiter.set_result(record.to_dict())
+        while len(self.completed_tasks) > self.completed_max_size:
+            self.completed_tasks.popitem(last=False)
+    
+    async def _sweep_completed(self):
+        """定期清理过期的已完成任务记录"""
+        while self.is_running:
+            try:
+                await asyncio.sleep(self.sweep_interval)
+                await self.clear_completed_tasks(older_than=self.completed_ttl)
+            except asyncio.CancelledError:
+                break
+            except Exception as e:
+                logger.error(f"清理已完成任务时出错: {e}", exc_info=True)
+    
     async def _execute_task(self, task_info: TaskInfo) -> Any:
         """执行任务"""
         if task_info.task_func is None:
@@ -192,21 +444,31 @@ class ImprovedTaskQueue:
         else:
             return task_info.task_func(*task_info.args, **task_info.kwargs)
     
-    def add_task(self, name: str, task_func: Callable, *args, priority: int = 0, **kwargs) -> str:
-        """添加任务到队列"""
+    def add_task(self, name: str, task_func: Callable, *args, priority: int = 0,
+                 owner: Any = None, task_id: Optional[str] = None, **kwargs) -> str:
+        """添加任务到队列
+        
+        owner用于公平调度，相同owner的任务共享同一个调度份额和并发上限。
+        task_id可由调用方指定（例如从持久化存储恢复的任务），默认自动生成。
+        """
         if not self.is_running:
             raise TaskQueueError("任务队列未运行")
         
-        if self.pending_queue.qsize() >= self.queue_max_size:
+        if len(self.pending_tasks) >= self.queue_max_size:
             raise TaskQueueError(f"任务队列已满 (最大容量: {self.queue_max_size})")
         
-        task_id = str(uuid.uuid4())
+        if task_id is None:
+            task_id = str(uuid.uuid4())
+        elif task_id in self.pending_tasks or task_id in self.running_tasks:
+            raise TaskQueueError(f"任务 {task_id} 已在队列中")
+        
         task_info = TaskInfo(
             task_id=task_id,
             name=name,
             status=TaskStatus.PENDING,
             created_at=datetime.now(),
-            priority=priority
+            priority=priority,
+            owner=owner
         )
         
         # 存储任务函数和参数到task_info中
@@ -214,25 +476,45 @@ class ImprovedTaskQueue:
         task_info.args = args
         task_info.kwargs = kwargs
         
-        # 注意：Python的PriorityQueue是小顶堆，所以我们使用负数来实现大顶堆
-        self.pending_queue.put_nowait((-priority, task_info))
+        heap = self._owner_queues.get(owner)
+        if heap is None:
+            heap = self._owner_queues[owner] = []
+            self._active_owners.append(owner)
+            self._deficits[owner] = 0
+        heapq.heappush(heap, (self._sort_key(priority), next(self._sequence), task_info))
         
-        # 添加到运行中任务列表
-        self.running_tasks[task_id] = task_info
+        # 添加到等待中任务索引
+        self.pending_tasks[task_id] = task_info
+        self._task_available.set()
         
         logger.info(f"任务 {name} ({task_id}) 已加入队列，优先级: {priority}")
         return task_id
     
+    def _sort_key(self, priority: int) -> float:
+        """计算任务在小顶堆中的排序键
+        
+        启用老化时，排序键为入队时间减去优先级对应的提前量：高优先级任务仍然优先，
+        但低优先级任务等待超过 优先级差 x priority_aging 秒后会排到新入队的高优先级任务之前。
+        """
+        if self.priority_aging > 0:
+            return time.monotonic() - priority * self.priority_aging
+        return -priority
+    
     async def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
         """获取任务状态"""
         async with self._lock:
+            # 检查等待中的任务
+            if task_id in self.pending_tasks:
+                return asdict(self.pending_tasks[task_id])
+            
             # 检查运行中的任务
             if task_id in self.running_tasks:
                 return asdict(self.running_tasks[task_id])
             
             # 检查已完成的任务
             if task_id in self.completed_tasks:
-                return asdict(self.completed_tasks[task_id])
+                self.completed_tasks.move_to_end(task_id)
+                return self.completed_tasks[task_id].to_dict()
             
             return None
     
@@ -241,53 +523,105 @@ class ImprovedTaskQueue:
         async with self._lock:
             async with self._stats_lock:
                 return {
-                    "pending_tasks": self.pending_queue.qsize(),
+                    "pending_tasks": len(self.pending_tasks),
                     "running_tasks": len(self.running_tasks),
+                    "active_owners": len(self._active_owners),
                     "completed_tasks": len(self.completed_tasks),
                     "workers": len(self.workers),
+                    "target_workers": self._target_workers,
+                    "avg_task_seconds": self._latency_ewma,
                     "stats": self.stats.copy()
                 }
     
     async def cancel_task(self, task_id: str) -> bool:
-        """取消任务"""
+        """取消任务
+        
+        等待中的任务仅从索引中移除并标记为已取消，堆中残留的条目会在调度时直接丢弃；
+        运行中的任务会向其协程抛出CancelledError。
+        """
         async with self._lock:
-            # 检查是否在运行中任务列表中
-            if task_id in self.running_tasks:
-                task_info = self.running_tasks[task_id]
-                task_info.status = TaskStatus.CANCELLED
-                task_info.completed_at = datetime.now()
-                self.completed_tasks[task_id] = task_info
-                del self.running_tasks[task_id]
-                
-                async with self._stats_lock:
-                    self.stats["cancelled_tasks"] += 1
-                    self.stats["total_tasks"] += 1
-                
-                logger.info(f"任务 {task_info.name} ({task_id}) 已取消")
-                return True
-            
-            # 检查是否在等待队列中
-            # 注意：对于PriorityQueue，我们无法直接移除元素
-            # 这里可以标记任务为已取消，但在_worker中需要检查
-            
-            return False
+            cancelled = self._cancel_locked(task_id)
+        
+        if cancelled:
+            async with self._stats_lock:
+                self.stats["cancelled_tasks"] += 1
+                self.stats["total_tasks"] += 1
+        return cancelled
+    
+    async def cancel_tasks(self, task_ids: List[str]) -> int:
+        """批量取消任务，返回实际取消的数量"""
+        async with self._lock:
+            count = sum(1 for task_id in task_ids if self._cancel_locked(task_id))
+        
+        if count:
+            async with self._stats_lock:
+                self.stats["cancelled_tasks"] += count
+                self.stats["total_tasks"] += count
+        return count
+    
+    def _cancel_locked(self, task_id: str) -> bool:
+        """在持有_lock的情况下取消单个任务"""
+        task_info = self.pending_tasks.pop(task_id, None)
+        if task_info is None:
+            task_info = self.running_tasks.pop(task_id, None)
+            if task_info is None:
+                return False
+            self._release_owner_slot(task_info)
+            future = self._running_futures.get(task_id)
+            if future and not future.done():
+                future.cancel()
+        
+        task_info.status = TaskStatus.CANCELLED
+        task_info.completed_at = datetime.now()
+        self._record_completed(task_info)
+        
+        logger.info(f"任务 {task_info.name} ({task_id}) 已取消")
+        return True
     
     async def wait_for_task(self, task_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
-        """等待任务完成"""
-        start_time = time.time()
+        """等待任务完成
         
-        while True:
-            status = await self.get_task_status(task_id)
-            if not status:
-                return None
-            
-            if status["status"] in [TaskStatus.COMPLETED.value, TaskStatus.FAILED.value, TaskStatus.CANCELLED.value]:
-                return status
-            
-            if timeout and (time.time() - start_time) >= timeout:
+        任务结束时才会被唤醒，超时或任务不存在时返回None。
+        """
+        async with self._lock:
+            waiter = self._get_waiter(task_id)
+            if waiter is None:
                 return None
-            
-            await asyncio.sleep(0.1)
+        
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            return None
+    
+    async def as_completed(self, task_ids: List[str],
+                           timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """按完成顺序逐个产出任务状态，不存在的任务会被忽略
+        
+        Raises:
+            asyncio.TimeoutError: 超时后仍有任务未完成
+        """
+        async with self._lock:
+            waiters = [w for w in (self._get_waiter(task_id) for task_id in task_ids) if w is not None]
+        
+        for next_done in asyncio.as_completed(waiters, timeout=timeout):
+            yield await next_done
+    
+    def _get_waiter(self, task_id: str) -> Optional[asyncio.Future]:
+        """在持有_lock的情况下获取任务的完成future"""
+        if task_id in self.completed_tasks:
+            self.completed_tasks.move_to_end(task_id)
+            waiter = asyncio.get_running_loop().create_future()
+            waiter.set_result(self.completed_tasks[task_id].to_dict())
+            return waiter
+        
+        if task_id in self.pending_tasks or task_id in self.running_tasks:
+            waiter = self._waiters.get(task_id)
+            if waiter is None:
+                waiter = asyncio.get_running_loop().create_future()
+                self._waiters[task_id] = waiter
+            return waiter
+        
+        return None
     
     async def clear_completed_tasks(self, older_than: Optional[float] = None):
         """清理已完成的任务"""
@@ -306,7 +640,8 @@ class ImprovedTaskQueue:
                 for task_id in to_remove:
                     del self.completed_tasks[task_id]
                 
-                logger.info(f"已清理 {len(to_remove)} 个过期的已完成任务")
+                if to_remove:
+                    logger.info(f"已清理 {len(to_remove)} 个过期的已完成任务")
 
 
 # 全局任务队列实例
@@ -0,0 +1,443 @@
+"""持久化任务存储模块
+
+为任务队列提供可插拔的持久化后端，保证进程崩溃或重新部署后排队中的任务不会丢失。
+任务以租约方式领取：领取后在可见性超时内归领取者所有，超时未确认则重新可被领取，
+从而实现至少一次（at-least-once）投递。
+"""
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Optional, Dict, Any, List
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TaskStoreError(Exception):
+    """任务存储异常"""
+    pass
+
+
+class TaskRecord:
+    """持久化任务记录"""
+    __slots__ = ("task_id", "kind", "payload", "priority", "owner",
+                 "attempts", "created_at")
+
+    def __init__(self, task_id: str, kind: str, payload: Dict[str, Any], priority: int = 0,
+                 owner: Any = None, attempts: int = 0, created_at: float = 0.0):
+        self.task_id = task_id
+        self.kind = kind
+        self.payload = payload
+        self.priority = priority
+        self.owner = owner
+        self.attempts = attempts
+        self.created_at = created_at
+
+
+class TaskStore(ABC):
+    """持久化任务存储基类
+
+    记录状态只有两种：queued（可被领取）和 leased（已被领取，lease_until 之前不可再被领取）。
+    确认（ack）后记录即被删除；领取次数达到 max_attempts 仍未确认的记录由 dead_letter()
+    移入死信存储。所有阻塞I/O都在线程池中执行，不阻塞事件循环。
+    """
+
+    def __init__(self, visibility_timeout: float = 600.0, max_attempts: int = 5):
+        self.visibility_timeout = visibility_timeout
+        self.max_attempts = max_attempts
+
+    async def enqueue(self, record: TaskRecord) -> None:
+        """持久化一个新任务"""
+        await asyncio.to_thread(self._enqueue, record)
+
+    async def lease(self, consumer_id: str, task_id: Optional[str] = None) -> Optional[TaskRecord]:
+        """领取一个可用任务
+
+        Args:
+            consumer_id: 领取者标识
+            task_id: 指定要领取的任务，None表示按优先级领取下一个
+
+        Returns:
+            领取到的任务，没有可领取的任务时返回None
+        """
+        return await asyncio.to_thread(self._lease, consumer_id, task_id)
+
+    async def heartbeat(self, task_id: str, consumer_id: str) -> bool:
+        """延长租约，返回False表示租约已丢失"""
+        return await asyncio.to_thread(self._heartbeat, task_id, consumer_id)
+
+    async def ack(self, task_id: str) -> bool:
+        """确认任务已结束（成功、失败或取消），从存储中删除，返回False表示任务不存在"""
+        return await asyncio.to_thread(self._ack, task_id)
+
+    async def release(self, task_id: str, consumer_id: str) -> None:
+        """放弃租约，让任务重新可被领取（用于停机排空）"""
+        await asyncio.to_thread(self._release, task_id, consumer_id)
+
+    async def list_available(self) -> List[TaskRecord]:
+        """列出当前可领取的任务（排队中或租约已过期），按优先级和创建时间排序"""
+        return await asyncio.to_thread(self._list_available)
+
+    async def count(self) -> int:
+        """存储中未确认的任务总数（不含死信）"""
+        return await asyncio.to_thread(self._count)
+
+    async def count_ids(self, task_ids: List[str]) -> int:
+        """给定的任务中仍未确认（排队中或执行中）的数量"""
+        if not task_ids:
+            return 0
+        return await asyncio.to_thread(self._count_ids, list(task_ids))
+
+    async def dead_letter(self) -> int:
+        """将领取次数已用完且没有有效租约的任务移入死信存储
+
+        Returns:
+            int: 移入死信存储的任务数
+        """
+        return await asyncio.to_thread(self._dead_letter)
+
+    def close(self) -> None:
+        """关闭存储"""
+        pass
+
+    @abstractmethod
+    def _enqueue(self, record: TaskRecord) -> None:
+        pass
+
+    @abstractmethod
+    def _lease(self, consumer_id: str, task_id: Optional[str]) -> Optional[TaskRecord]:
+        pass
+
+    @abstractmethod
+    def _heartbeat(self, task_id: str, consumer_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def _ack(self, task_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def _release(self, task_id: str, consumer_id: str) -> None:
+        pass
+
+    @abstractmethod
+    def _list_available(self) -> List[TaskRecord]:
+        pass
+
+    @abstractmethod
+    def _count(self) -> int:
+        pass
+
+    @abstractmethod
+    def _count_ids(self, task_ids: List[str]) -> int:
+        pass
+
+    @abstractmethod
+    def _dead_letter(self) -> int:
+        pass
+
+
+class MongoTaskStore(TaskStore):
+    """基于MongoDB集合的任务存储，使用 find_one_and_update 原子领取"""
+
+    def __init__(self, collection, visibility_timeout: float = 600.0, max_attempts: int = 5):
+        super().__init__(visibility_timeout, max_attempts)
+        self.collection = collection
+        self.collection.create_index([("status", 1), ("lease_until", 1)])
+        self.collection.create_index([("priority", -1), ("created_at", 1)])
+        # 重试次数用完的任务移到同库的 <集合名>_dead 集合，便于排查
+        self.dead_collection = collection.database[f"{collection.name}_dead"]
+
+    def _available_filter(self, now: float) -> Dict[str, Any]:
+        return {
+            "attempts": {"$lt": self.max_attempts},
+            "$or": [
+                {"status": "queued"},
+                {"status": "leased", "lease_until": {"$lt": now}}
+            ]
+        }
+
+    @staticmethod
+    def _to_record(doc: Dict[str, Any]) -> TaskRecord:
+        return TaskRecord(doc["_id"], doc["kind"], doc.get("payload", {}), doc.get("priority", 0),
+                          doc.get("owner"), doc.get("attempts", 0), doc.get("created_at", 0.0))
+
+    def _enqueue(self, record: TaskRecord) -> None:
+        self.collection.insert_one({
+            "_id": record.task_id,
+            "kind": record.kind,
+            "payload": record.payload,
+            "priority": record.priority,
+            "owner": record.owner,
+            "attempts": 0,
+            "status": "queued",
+            "lease_owner": None,
+            "lease_until": 0.0,
+            "created_at": record.created_at or time.time()
+        })
+
+    def _lease(self, consumer_id: str, task_id: Optional[str]) -> Optional[TaskRecord]:
+        from pymongo import ReturnDocument
+
+        now = time.time()
+        query = self._available_filter(now)
+        if task_id is not None:
+            query["_id"] = task_id
+        doc = self.collection.find_one_and_update(
+            query,
+            {
+                "$set": {
+                    "status": "leased",
+                    "lease_owner": consumer_id,
+                    "lease_until": now + self.visibility_timeout
+                },
+                "$inc": {"attempts": 1}
+            },
+            sort=[("priority", -1), ("created_at", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+        return self._to_record(doc) if doc else None
+
+    def _heartbeat(self, task_id: str, consumer_id: str) -> bool:
+        result = self.collection.update_one(
+            {"_id": task_id, "status": "leased", "lease_owner": consumer_id},
+            {"$set": {"lease_until": time.time() + self.visibility_timeout}}
+        )
+        return result.matched_count > 0
+
+    def _ack(self, task_id: str) -> bool:
+        return self.collection.delete_one({"_id": task_id}).deleted_count > 0
+
+    def _release(self, task_id: str, consumer_id: str) -> None:
+        self.collection.update_one(
+            {"_id": task_id, "lease_owner": consumer_id},
+            {"$set": {"status": "queued", "lease_owner": None, "lease_until": 0.0},
+             "$inc": {"attempts": -1}}
+        )
+
+    def _list_available(self) -> List[TaskRecord]:
+        cursor = self.collection.find(self._available_filter(time.time())).sort(
+            [("priority", -1), ("created_at", 1)])
+        return [self._to_record(doc) for doc in cursor]
+
+    def _count(self) -> int:
+        return self.collection.count_documents({})
+
+    def _count_ids(self, task_ids: List[str]) -> int:
+        return self.collection.count_documents({"_id": {"$in": task_ids}})
+
+    def _dead_letter(self) -> int:
+        now = time.time()
+        query = {
+            "attempts": {"$gte": self.max_attempts},
+            "$or": [
+                {"status": "queued"},
+                {"status": "leased", "lease_until": {"$lt": now}}
+            ]
+        }
+        moved = 0
+        for doc in self.collection.find(query):
+            doc["dead_at"] = now
+            self.dead_collection.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+            # 删除时再次确认记录未被续租或确认，避免误删
+            result = self.collection.delete_one({"_id": doc["_id"], "status": doc["status"],
+                                                 "lease_until": doc["lease_until"]})
+            if result.deleted_count:
+                moved += 1
+            else:
+                self.dead_collection.delete_one({"_id": doc["_id"]})
+        return moved
+
+
+class SQLiteTaskStore(TaskStore):
+    """基于本地SQLite（WAL模式）的任务存储"""
+
+    def __init__(self, path: str, visibility_timeout: float = 600.0, max_attempts: int = 5):
+        super().__init__(visibility_timeout, max_attempts)
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self.path = path
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn_lock = threading.Lock()
+        with self._conn_lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS task_queue (
+                    task_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    lease_owner TEXT,
+                    lease_until REAL NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_task_queue_order ON task_queue (priority DESC, created_at)")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS task_dead_letter (
+                    task_id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    owner TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    dead_at REAL NOT NULL
+                )
+            """)
+
+    _AVAILABLE = ("attempts < ? AND (status = 'queued' OR (status = 'leased' AND lease_until < ?))")
+    _EXHAUSTED = ("attempts >= ? AND (status = 'queued' OR (status = 'leased' AND lease_until < ?))")
+
+    @staticmethod
+    def _to_record(row: sqlite3.Row) -> TaskRecord:
+        return TaskRecord(row["task_id"], row["kind"], json.loads(row["payload"]), row["priority"],
+                          json.loads(row["owner"]) if row["owner"] is not None else None,
+                          row["attempts"], row["created_at"])
+
+    def _enqueue(self, record: TaskRecord) -> None:
+        with self._conn_lock:
+            self._conn.execute(
+                "INSERT INTO task_queue (task_id, kind, payload, priority, owner, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (record.task_id, record.kind, json.dumps(record.payload), record.priority,
+                 json.dumps(record.owner) if record.owner is not None else None,
+                 record.created_at or time.time())
+            )
+
+    def _lease(self, consumer_id: str, task_id: Optional[str]) -> Optional[TaskRecord]:
+        now = time.time()
+        with self._conn_lock:
+            # BEGIN IMMEDIATE 获取写锁，保证多个进程之间的领取是原子的
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if task_id is None:
+                    row = self._conn.execute(
+                        f"SELECT * FROM task_queue WHERE {self._AVAILABLE} "
+                        "ORDER BY priority DESC, created_at LIMIT 1",
+                        (self.max_attempts, now)
+                    ).fetchone()
+                else:
+                    row = self._conn.execute(
+                        f"SELECT * FROM task_queue WHERE task_id = ? AND {self._AVAILABLE}",
+                        (task_id, self.max_attempts, now)
+                    ).fetchone()
+
+                if row is None:
+                    self._conn.execute("COMMIT")
+                    return None
+
+                self._conn.execute(
+                    "UPDATE task_queue SET status = 'leased', lease_owner = ?, lease_until = ?, "
+                    "attempts = attempts + 1 WHERE task_id = ?",
+                    (consumer_id, now + self.visibility_timeout, row["task_id"])
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+        record = self._to_record(row)
+        record.attempts += 1
+        return record
+
+    def _heartbeat(self, task_id: str, consumer_id: str) -> bool:
+        with self._conn_lock:
+            cursor = self._conn.execute(
+                "UPDATE task_queue SET lease_until = ? "
+                "WHERE task_id = ? AND status = 'leased' AND lease_owner = ?",
+                (time.time() + self.visibility_timeout, task_id, consumer_id)
+            )
+            return cursor.rowcount > 0
+
+    def _ack(self, task_id: str) -> bool:
+        with self._conn_lock:
+            return self._conn.execute("DELETE FROM task_queue WHERE task_id = ?", (task_id,)).rowcount > 0
+
+    def _release(self, task_id: str, consumer_id: str) -> None:
+        with self._conn_lock:
+            self._conn.execute(
+                "UPDATE task_queue SET status = 'queued', lease_owner = NULL, lease_until = 0, "
+                "attempts = attempts - 1 WHERE task_id = ? AND lease_owner = ?",
+                (task_id, consumer_id)
+            )
+
+    def _list_available(self) -> List[TaskRecord]:
+        with self._conn_lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM task_queue WHERE {self._AVAILABLE} ORDER BY priority DESC, created_at",
+                (self.max_attempts, time.time())
+            ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def _count(self) -> int:
+        with self._conn_lock:
+            return self._conn.execute("SELECT COUNT(*) FROM task_queue").fetchone()[0]
+
+    def _count_ids(self, task_ids: List[str]) -> int:
+        placeholders = ",".join("?" * len(task_ids))
+        with self._conn_lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM task_queue WHERE task_id IN ({placeholders})", task_ids
+            ).fetchone()[0]
+
+    def _dead_letter(self) -> int:
+        now = time.time()
+        with self._conn_lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO task_dead_letter "
+                    "(task_id, kind, payload, priority, owner, attempts, created_at, dead_at) "
+                    "SELECT task_id, kind, payload, priority, owner, attempts, created_at, ? "
+                    f"FROM task_queue WHERE {self._EXHAUSTED}",
+                    (now, self.max_attempts, now)
+                )
+                cursor = self._conn.execute(
+                    f"DELETE FROM task_queue WHERE {self._EXHAUSTED}",
+                    (self.max_attempts, now)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cursor.rowcount
+
+    def close(self) -> None:
+        with self._conn_lock:
+            self._conn.close()
+
+
+def create_task_store() -> Optional[TaskStore]:
+    """根据配置创建任务存储，TASK_QUEUE_BACKEND=memory 时返回None（不持久化）"""
+    backend = settings.TASK_QUEUE_BACKEND.lower()
+    timeout = settings.TASK_VISIBILITY_TIMEOUT
+
+    if backend == "memory":
+        return None
+
+    if backend == "mongo":
+        from .database import db_manager
+        if db_manager.db is None:
+            raise TaskStoreError("TASK_QUEUE_BACKEND=mongo 需要配置 MONGO_DB")
+        logger.info("使用MongoDB持久化任务队列")
+        return MongoTaskStore(db_manager.db.task_queue, visibility_timeout=timeout)
+
+    if backend == "sqlite":
+        logger.info(f"使用SQLite持久化任务队列: {settings.TASK_QUEUE_SQLITE_PATH}")
+        return SQLiteTaskStore(settings.TASK_QUEUE_SQLITE_PATH, visibility_timeout=timeout)
+
+    raise TaskStoreError(f"不支持的任务队列后端: {settings.TASK_QUEUE_BACKEND}")
@@ -0,0 +1,360 @@
+"""Userbot账号池模块
+
+把多个用户账号（Userbot）组成一个池，下载任务分配给当前负载最低的账号。
+遇到FloodWait的账号在冷却期内不会被分配；无法访问某个频道的账号
+在一段时间内不再用于该频道。
+
+UserClientCache 则按需启动请求者自己的账号，让用户的请求通过其本人的账号下载。
+"""
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Optional, Dict, Any, Hashable, List, Callable, Awaitable
+
+from pyrogram import Client
+
+logger = logging.getLogger(__name__)
+
+
+class PoolAccount:
+    """账号池中的一个账号"""
+
+    __slots__ = ("key", "client", "owned", "active", "total", "cooldown_until", "healthy", "no_access")
+
+    def __init__(self, key: Hashable, client: Client, owned: bool):
+        self.key = key
+        self.client = client
+        # owned 为True时由账号池负责停止客户端
+        self.owned = owned
+        self.active = 0
+        self.total = 0
+        self.cooldown_until = 0.0
+        self.healthy = True
+        # 聊天 -> 记录时间，账号无法访问这些聊天
+        self.no_access: Dict[str, float] = {}
+
+    def can_access(self, chat: Any, ttl: float) -> bool:
+        if chat is None:
+            return True
+        marked = self.no_access.get(str(chat))
+        if marked is None:
+            return True
+        if time.monotonic() - marked > ttl:
+            # 用户之后可能加入了该频道
+            del self.no_access[str(chat)]
+            return True
+        return False
+
+
+class UserbotPool:
+    """Userbot账号池"""
+
+    def __init__(self, health_check_interval: float = 300.0, no_access_ttl: float = 3600.0):
+        self.health_check_interval = health_check_interval
+        self.no_access_ttl = no_access_ttl
+        self._accounts: Dict[Hashable, PoolAccount] = {}
+        self._health_checker: Optional[asyncio.Task] = None
+
+    @property
+    def size(self) -> int:
+        return len(self._accounts)
+
+    def add(self, key: Hashable, client: Optional[Client], owned: bool = True):
+        """添加账号，相同key的旧账号会被替换（不会停止旧客户端）"""
+        if client is None:
+            self._accounts.pop(key, None)
+            return
+        self._accounts[key] = PoolAccount(key, client, owned)
+        logger.info(f"账号池添加账号: {key}，当前账号数: {len(self._accounts)}")
+
+    def get(self, key: Hashable) -> Optional[Client]:
+        """按key获取账号池中的客户端"""
+        account = self._accounts.get(key)
+        return account.client if account else None
+
+    def get_account(self, key: Hashable) -> Optional[PoolAccount]:
+        """按key获取账号（包含正在进行的下载数）"""
+        return self._accounts.get(key)
+
+    def _find(self, client: Client) -> Optional[PoolAccount]:
+        for account in self._accounts.values():
+            if account.client is client:
+                return account
+        return None
+
+    def _select(self, chat: Any) -> Optional[PoolAccount]:
+        candidates = [
+            a for a in self._accounts.values()
+            if a.healthy and a.can_access(chat, self.no_access_ttl)
+        ]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        # 优先选择不在冷却期的账号，其次选择负载最低、总任务最少的账号
+        return min(candidates, key=lambda a: (max(a.cooldown_until - now, 0), a.active, a.total))
+
+    @asynccontextmanager
+    async def acquire(self, chat: Any = None, prefer: Optional[Hashable] = None):
+        """获取一个账号用于下载
+
+        Args:
+            chat: 要访问的聊天，跳过已知无法访问该聊天的账号
+            prefer: 优先使用的账号key（例如请求者本人的账号），
+                该账号不可用、无法访问该聊天或在冷却中时按负载选择其他账号
+
+        Yields:
+            Optional[Client]: 选中的客户端，没有可用账号时为None
+        """
+        account = self._accounts.get(prefer) if prefer is not None else None
+        if (account is None or not account.healthy or not account.can_access(chat, self.no_access_ttl)
+                or account.cooldown_until > time.monotonic()):
+            account = self._select(chat)
+        if account is None:
+            yield None
+            return
+
+        delay = account.cooldown_until - time.monotonic()
+        if delay > 0:
+            logger.info(f"所有账号都在冷却中，等待账号 {account.key} {delay:.0f} 秒")
+            await asyncio.sleep(delay)
+
+        account.active += 1
+        account.total += 1
+        try:
+            yield account.client
+        finally:
+            account.active -= 1
+
+    def report_flood_wait(self, client: Optional[Client], wait_seconds: float):
+        """记录账号遇到的FloodWait，冷却期内优先使用其他账号"""
+        account = self._find(client) if client else None
+        if account is not None:
+            account.cooldown_until = max(account.cooldown_until, time.monotonic() + wait_seconds)
+            logger.warning(f"账号 {account.key} 进入冷却 {wait_seconds} 秒")
+
+    def report_no_access(self, client: Optional[Client], chat: Any):
+        """记录账号无法访问某个聊天"""
+        account = self._find(client) if client else None
+        if account is not None:
+            account.no_access[str(chat)] = time.monotonic()
+
+    def start_health_checks(self):
+        """启动定期健康检查"""
+        if self._health_checker is None and self._accounts:
+            self._health_checker = asyncio.create_task(self._health_check_loop())
+
+    async def _health_check_loop(self):
+        while True:
+            await asyncio.sleep(self.health_check_interval)
+            await self.check_health()
+
+    async def check_health(self):
+        """检查所有账号是否仍然可用"""
+        for account in list(self._accounts.values()):
+            try:
+                await account.client.get_me()
+                if not account.healthy:
+                    logger.info(f"账号 {account.key} 已恢复")
+                account.healthy = True
+            except Exception as e:
+                if account.healthy:
+                    logger.warning(f"账号 {account.key} 健康检查失败: {e}")
+                account.healthy = False
+
+    async def stop(self):
+        """停止健康检查和账号池启动的客户端"""
+        if self._health_checker:
+            self._health_checker.cancel()
+            try:
+                await self._health_checker
+            except asyncio.CancelledError:
+                pass
+            self._health_checker = None
+
+        for account in list(self._accounts.values()):
+            if account.owned:
+                try:
+                    await account.client.stop()
+                except Exception as e:
+                    logger.warning(f"停止账号 {account.key} 失败: {e}")
+        self._accounts.clear()
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """获取各账号的状态"""
+        now = time.monotonic()
+        return [
+            {
+                "key": account.key,
+                "healthy": account.healthy,
+                "active": account.active,
+                "total": account.total,
+                "cooldown": max(round(account.cooldown_until - now), 0)
+            }
+            for account in self._accounts.values()
+        ]
+
+
+class UserClientCache:
+    """按用户缓存的Userbot客户端
+
+    用户第一次请求时使用其保存的SESSION启动客户端，之后的请求复用该客户端。
+    超过数量上限时停止最久未使用的客户端，空闲超时的客户端会被断开。
+    """
+
+    def __init__(self, factory: Callable[[int], Awaitable[Optional[Client]]], max_clients: int = 10,
+                 idle_timeout: float = 900.0, retry_interval: float = 300.0,
+                 on_stop: Optional[Callable[[int], None]] = None):
+        """
+        Args:
+            factory: 启动指定用户客户端的协程函数，用户没有可用SESSION时返回None
+            max_clients: 同时保持连接的客户端数量上限
+            idle_timeout: 空闲多少秒后断开客户端
+            retry_interval: 启动失败（或没有SESSION）后多久再次尝试
+            on_stop: 客户端被断开后调用，参数为用户ID
+        """
+        self.factory = factory
+        self.on_stop = on_stop
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.retry_interval = retry_interval
+        # user_id -> [客户端, 最后使用时间, 正在进行的下载数]
+        self._clients: "OrderedDict[int, list]" = OrderedDict()
+        self._unavailable: Dict[int, float] = {}
+        self._locks: Dict[int, asyncio.Lock] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        # SESSION变更后等待下载结束再断开的旧客户端: user_id -> 断开任务
+        self._retiring: Dict[int, asyncio.Task] = {}
+
+    @property
+    def size(self) -> int:
+        return len(self._clients)
+
+    async def _get(self, user_id: int) -> Optional[list]:
+        entry = self._clients.get(user_id)
+        if entry is not None:
+            self._clients.move_to_end(user_id)
+            return entry
+
+        failed_at = self._unavailable.get(user_id)
+        if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+            return None
+
+        lock = self._locks.setdefault(user_id, asyncio.Lock())
+        async with lock:
+            # 同一个会话名的旧客户端断开后才能启动新客户端
+            retiring = self._retiring.get(user_id)
+            if retiring is not None:
+                await asyncio.wait([retiring])
+            # 等待锁期间其他请求可能已经完成启动
+            entry = self._clients.get(user_id)
+            if entry is not None:
+                return entry
+            failed_at = self._unavailable.get(user_id)
+            if failed_at is not None and time.monotonic() - failed_at < self.retry_interval:
+                return None
+            try:
+                client = await self.factory(user_id)
+            except Exception as e:
+                logger.warning(f"启动用户 {user_id} 的客户端失败: {e}")
+                client = None
+            if client is None:
+                self._unavailable[user_id] = time.monotonic()
+                return None
+
+            self._unavailable.pop(user_id, None)
+            entry = [client, time.monotonic(), 0]
+            self._clients[user_id] = entry
+            logger.info(f"已启动用户 {user_id} 的客户端，当前缓存数: {len(self._clients)}")
+            await self._evict()
+            if self._reaper is None:
+                self._reaper = asyncio.create_task(self._reap_idle())
+            return entry
+
+    @asynccontextmanager
+    async def acquire(self, user_id: int):
+        """获取用户自己的客户端
+
+        Yields:
+            Optional[Client]: 用户的客户端，用户没有可用SESSION时为None
+        """
+        entry = await self._get(user_id) if self.max_clients > 0 else None
+        if entry is None:
+            yield None
+            return
+
+        entry[2] += 1
+        try:
+            yield entry[0]
+        finally:
+            entry[1] = time.monotonic()
+            entry[2] -= 1
+
+    async def _stop_client(self, user_id: int, reason: str):
+        entry = self._clients.pop(user_id, None)
+        if entry is not None:
+            await self._disconnect(user_id, entry[0], reason)
+
+    async def _disconnect(self, user_id: int, client: Client, reason: str):
+        try:
+            await client.stop()
+            logger.info(f"已断开用户 {user_id} 的客户端（{reason}）")
+        except Exception as e:
+            logger.warning(f"断开用户 {user_id} 的客户端失败: {e}")
+        if self.on_stop:
+            self.on_stop(user_id)
+
+    def invalidate(self, user_id: int, grace: float = 60.0):
+        """用户保存或删除SESSION后丢弃其缓存的客户端，下次请求时使用新的SESSION重新启动
+
+        旧客户端上正在进行的下载最多等待 grace 秒后再断开。
+        """
+        self._unavailable.pop(user_id, None)
+        entry = self._clients.pop(user_id, None)
+        if entry is None:
+            return
+
+        async def retire():
+            deadline = time.monotonic() + grace
+            while entry[2] > 0 and time.monotonic() < deadline:
+                await asyncio.sleep(1)
+            await self._disconnect(user_id, entry[0], "SESSION已变更")
+
+        task = asyncio.create_task(retire())
+        self._retiring[user_id] = task
+        task.add_done_callback(
+            lambda t: self._retiring.pop(user_id, None) if self._retiring.get(user_id) is t else None)
+
+    async def _evict(self):
+        """超过上限时停止最久未使用且空闲的客户端"""
+        for user_id in list(self._clients):
+            if len(self._clients) <= self.max_clients:
+                break
+            if self._clients[user_id][2] == 0:
+                await self._stop_client(user_id, "超过缓存上限")
+
+    async def _reap_idle(self):
+        while True:
+            await asyncio.sleep(min(self.idle_timeout, 60.0))
+            now = time.monotonic()
+            try:
+                for user_id, entry in list(self._clients.items()):
+                    if entry[2] == 0 and now - entry[1] > self.idle_timeout:
+                        await self._stop_client(user_id, "空闲超时")
+            except Exception as e:
+                logger.error(f"清理空闲用户客户端时出错: {e}", exc_info=True)
+
+    async def stop(self):
+        """停止所有缓存的客户端"""
+        if self._reaper:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for user_id in list(self._clients):
+            await self._stop_client(user_id, "关闭")
+        if self._retiring:
+            await asyncio.gather(*self._retiring.values(), return_exceptions=True)
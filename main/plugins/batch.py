@@ -6,14 +6,13 @@ from typing import Dict
 from ..core.base_plugin import BasePlugin
 from ..core.clients import client_manager
 from ..config import settings
-from ..services.download_service import download_service
+from ..core.task_queue import TaskStatus
 from ..services.download_task_manager import download_task_manager
 from ..utils.media_utils import get_link
 from ..utils.error_handler import handle_errors
 
 from telethon import events, Button
 from pyrogram import Client
-from pyrogram.errors import FloodWait
 
 class BatchPlugin(BasePlugin):
     """批量下载插件"""
@@ -21,6 +20,7 @@ class BatchPlugin(BasePlugin):
     def __init__(self):
         super().__init__("batch")
         self.batch_users = set()  # 正在进行批量任务的用户
+        self.queued_batches: Dict[int, str] = {}  # 用户ID -> 进行中的批量任务ID
     
     async def on_load(self):
         """插件加载时注册事件处理器"""
@@ -42,14 +42,27 @@ class BatchPlugin(BasePlugin):
         
         self.logger.info("批量下载插件事件处理器已移除")
     
+    async def _active_batch(self, user_id: int):
+        """获取用户仍有子任务未结束的批量任务ID，已全部结束时清除记录"""
+        batch_task_id = self.queued_batches.get(user_id)
+        if batch_task_id is None:
+            return None
+        if await download_task_manager.get_batch_remaining(batch_task_id):
+            return batch_task_id
+        if self.queued_batches.get(user_id) == batch_task_id:
+            del self.queued_batches[user_id]
+        return None
+    
     async def _cancel_command(self, event):
         """处理 /cancel 命令"""
-        if event.sender_id not in self.batch_users:
+        batch_task_id = await self._active_batch(event.sender_id)
+        if batch_task_id is None:
             await event.reply("没有正在进行的批量任务。")
             return
+        self.queued_batches.pop(event.sender_id, None)
         
-        # 从批量用户集合中移除
-        self.batch_users.discard(event.sender_id)
+        # 取消等待中和运行中的子任务，_run_batch 随后发送汇总并结束
+        await download_task_manager.cancel_batch_task(batch_task_id)
         await event.reply("已取消。")
     
     async def _batch_command(self, event):
@@ -58,7 +71,7 @@ class BatchPlugin(BasePlugin):
             return
         
         # 检查 userbot 是否可用
-        if client_manager.userbot is None:
+        if await client_manager.get_userbot() is None:
             await event.reply("❌ 未配置 SESSION，无法使用批量下载功能\n\n使用 /addsession 添加 SESSION")
             return
         
@@ -67,7 +80,7 @@ class BatchPlugin(BasePlugin):
             # 这里应该实现强制订阅检查逻辑
             pass
         
-        if event.sender_id in self.batch_users:
+        if event.sender_id in self.batch_users or await self._active_batch(event.sender_id):
             await event.reply("您已经开始了一个批量任务，请等待它完成！")
             return
         
@@ -115,75 +128,65 @@ class BatchPlugin(BasePlugin):
                 await conv.send_message("范围必须是一个整数！")
                 return conv.cancel()
             
+            # 交给独立工作进程时写入任务队列，工作进程直接把文件发送给用户
+            if download_task_manager.uses_external_workers():
+                self.queued_batches[event.sender_id] = await download_task_manager.create_batch_task(
+                    event.sender_id, link, value)
+                await conv.send_message(f"已将 {value} 个文件加入下载队列，发送 /cancel 可取消。")
+                return conv.cancel()
+            
             self.batch_users.add(event.sender_id)
             
-            # 直接运行批量下载（不通过任务队列）
-            await self._run_batch(client_manager.userbot, client_manager.pyrogram_bot, 
-                                event.sender_id, link, value, messages_to_delete)
+            await self._run_batch(client_manager.bot_client, event.sender_id, link, value, messages_to_delete)
             
             conv.cancel()
             self.batch_users.discard(event.sender_id)
     
     @handle_errors(default_return=False)
-    async def _run_batch(self, userbot: Client, client: Client, sender: int, 
-                        link: str, range_count: int, messages_to_delete: list = None):
-        """运行批量下载任务"""
+    async def _run_batch(self, client: Client, sender: int, link: str, range_count: int,
+                         messages_to_delete: list = None):
+        """运行批量下载任务
+        
+        子任务提交到下载任务队列（按用户公平调度、FloodWait时自动降低并发），
+        这里按完成顺序统计结果并发送进度。
+        """
         completed = 0
         failed = 0
+        cancelled = 0
         progress_messages = []  # 收集进度消息ID
         
-        for i in range(range_count):
-            try:
-                if sender not in self.batch_users:
-                    final_msg = await client.send_message(sender, f"批量任务已完成。\n✅ 成功: {completed}\n❌ 失败: {failed}")
-                    progress_messages.append(final_msg.id)
-                    break
-            except Exception as e:
-                self.logger.error(f"检查批量任务状态时出错: {e}")
-                final_msg = await client.send_message(sender, f"批量任务已完成。\n✅ 成功: {completed}\n❌ 失败: {failed}")
-                progress_messages.append(final_msg.id)
-                break
-            
-            try:
-                # 直接调用download_service，不经过任务队列
-                success = await download_service.download_message(userbot, client, client_manager.bot, sender, 0, link, i)
-                
-                if success:
+        batch_task_id = await download_task_manager.create_batch_task(sender, link, range_count)
+        self.queued_batches[sender] = batch_task_id
+        task_ids = list(download_task_manager.batch_tasks.get(batch_task_id, []))
+        try:
+            async for status in download_task_manager.as_completed(task_ids):
+                if status["status"] == TaskStatus.COMPLETED and status["result"]:
                     completed += 1
+                elif status["status"] == TaskStatus.CANCELLED:
+                    cancelled += 1
+                    continue
                 else:
                     failed += 1
                 
-            except FloodWait as fw:
-                if fw.value > 299:
-                    final_msg = await client.send_message(sender, f"由于洪水等待超过5分钟，取消批量任务。\n✅ 成功: {completed}\n❌ 失败: {failed}")
-                    progress_messages.append(final_msg.id)
-                    break
-                
-                # 等待FloodWait时间后重试
-                await asyncio.sleep(fw.value)
-                
-                try:
-                    success = await download_service.download_message(userbot, client, client_manager.bot, sender, 0, link, i)
-                    if success:
-                        completed += 1
-                    else:
-                        failed += 1
-                except Exception as retry_error:
-                    self.logger.error(f"重试失败: {retry_error}")
-                    failed += 1
-            
-            # 每5个文件或最后一批发送进度更新
-            if (i + 1) % 5 == 0 or i == range_count - 1:
-                progress_pct = (completed + failed) * 100 // range_count
-                progress_msg_text = f"📊 进度: {completed + failed}/{range_count} ({progress_pct}%)\n✅ 成功: {completed}\n❌ 失败: {failed}"
-                
-                try:
-                    progress_msg = await client.send_message(sender, progress_msg_text)
-                    progress_messages.append(progress_msg.id)
-                except Exception:
-                    pass
+                # 每5个文件发送进度更新
+                done = completed + failed
+                if done % 5 == 0 and done < range_count:
+                    progress_pct = done * 100 // range_count
+                    progress_msg_text = f"📊 进度: {done}/{range_count} ({progress_pct}%)\n✅ 成功: {completed}\n❌ 失败: {failed}"
+                    try:
+                        progress_msg = await client.send_message(sender, progress_msg_text)
+                        progress_messages.append(progress_msg.id)
+                    except Exception:
+                        pass
+        finally:
+            if self.queued_batches.get(sender) == batch_task_id:
+                del self.queued_batches[sender]
+            await download_task_manager.complete_batch_task(batch_task_id)
         
-        final_msg_text = f"🎉 批量任务完成！\n✅ 成功: {completed}\n❌ 失败: {failed}\n📊 总计: {range_count}"
+        if cancelled:
+            final_msg_text = f"批量任务已取消。\n✅ 成功: {completed}\n❌ 失败: {failed}"
+        else:
+            final_msg_text = f"🎉 批量任务完成！\n✅ 成功: {completed}\n❌ 失败: {failed}\n📊 总计: {range_count}"
         final_msg = await client.send_message(sender, final_msg_text)
         progress_messages.append(final_msg.id)
         
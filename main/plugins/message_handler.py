@@ -5,7 +5,7 @@ from telethon import events
 from ..core.base_plugin import BasePlugin
 from ..core.clients import client_manager
 from ..config import settings
-from ..services.download_service import download_service
+from ..services.download_task_manager import download_task_manager
 from ..services.user_service import user_service
 from ..utils.media_utils import get_link
 
@@ -91,22 +91,10 @@ class MessageHandlerPlugin(BasePlugin):
         status_msg = await event.reply("⏳ 正在处理...")
         
         try:
-            # 调用下载服务处理消息
-            success = await download_service.download_message(
-                userbot=client_manager.userbot,
-                client=client_manager.pyrogram_bot,
-                telethon_bot=client_manager.bot,
-                sender=user_id,
-                edit_id=status_msg.id,
-                msg_link=link,
-                offset=0
-            )
-            
-            if success:
-                self.logger.info(f"用户 {user_id} 成功下载: {link}")
-            else:
-                self.logger.warning(f"用户 {user_id} 下载失败: {link}")
-                
+            # 提交到下载任务队列，按用户公平调度；交给独立工作进程时由工作进程通过同一个机器人更新状态消息
+            await status_msg.edit("⏳ 已加入下载队列，等待处理...")
+            task_id = await download_task_manager.add_download_task(user_id, link, edit_id=status_msg.id)
+            self.logger.info(f"用户 {user_id} 的下载任务已入队: {link} ({task_id})")
         except Exception as e:
             self.logger.error(f"处理消息链接时出错: {e}", exc_info=True)
             await status_msg.edit(f"❌ 处理失败: {str(e)}")
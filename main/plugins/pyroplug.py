@@ -9,6 +9,7 @@ from ..core.clients import client_manager
 from ..config import settings
 from ..services.download_service import download_service
 from ..services.traffic_service import traffic_service
+from ..services.thumbnail_service import thumbnail_service
 from ..utils.media_utils import screenshot
 
 from pyrogram import Client, filters
@@ -35,12 +36,9 @@ class PyroplugPlugin(BasePlugin):
         # 这个插件主要提供工具函数，不需要特殊清理
         self.logger.info("Pyrogram插件已卸载")
     
-    def thumbnail(self, sender: int) -> Optional[str]:
+    async def thumbnail(self, sender: int) -> Optional[str]:
         """获取用户缩略图"""
-        if os.path.exists(f'{sender}.jpg'):
-            return f'{sender}.jpg'
-        else:
-            return None
+        return await thumbnail_service.get_thumbnail_path(sender)
 
 # 创建插件实例并注册
 pyroplug_plugin = PyroplugPlugin()
@@ -6,6 +6,7 @@ from telethon import events, Button
 from ..core.base_plugin import BasePlugin
 from ..core.clients import client_manager
 from ..services.user_service import user_service
+from ..services.thumbnail_service import thumbnail_service
 from ..utils.file_manager import file_manager
 
 logger = logging.getLogger(__name__)
@@ -80,13 +81,11 @@ class StartPlugin(BasePlugin):
                 t = await event.client.send_message(event.chat_id, '处理中...')
                 path = await event.client.download_media(x.media)
                 
-                # 使用文件管理器安全处理文件
-                user_thumb = f'{event.sender_id}.jpg'
-                if file_manager.file_exists(user_thumb):
-                    file_manager.safe_remove(user_thumb)
-                
-                file_manager.move_file(path, user_thumb)
-                await t.edit("临时缩略图已保存！")
+                try:
+                    saved = await thumbnail_service.set_thumbnail(event.sender_id, path)
+                finally:
+                    file_manager.safe_remove(path)
+                await t.edit("缩略图已保存！" if saved else "❌ 保存缩略图失败")
                 
             except TimeoutError:
                 await conv.send_message("⏱️ 操作超时，请重新尝试。")
@@ -98,8 +97,7 @@ class StartPlugin(BasePlugin):
         """删除用户缩略图"""
         await event.edit('处理中...')
         try:
-            user_thumb = f'{event.sender_id}.jpg'
-            if file_manager.safe_remove(user_thumb):
+            if await thumbnail_service.remove_thumbnail(event.sender_id):
                 await event.edit('已删除！')
             else:
                 await event.edit("未保存缩略图。")
@@ -6,20 +6,25 @@ import asyncio
 import logging
 import os
 import time
-from typing import Optional, Tuple, Any, Union
+from typing import Optional, Tuple, Any, Union, Dict
 
 from pyrogram import Client
-from pyrogram.errors import ChannelBanned, ChannelInvalid, ChannelPrivate, ChatIdInvalid, ChatInvalid, PeerIdInvalid
+from pyrogram.errors import ChannelBanned, ChannelInvalid, ChannelPrivate, ChatIdInvalid, ChatInvalid, PeerIdInvalid, FloodWait
 from pyrogram.enums import MessageMediaType
 from telethon import TelegramClient
 from telethon.tl.types import DocumentAttributeVideo
-from ethon.pyfunc import video_metadata
 from ethon.telefunc import fast_upload
 
 from ..core.database import DatabaseManager
+from ..core.rate_limiter import rate_limiter
+from ..core.userbot_pool import UserbotPool
 from ..services.traffic_service import TrafficService
-from ..utils.media_utils import screenshot, progress_for_pyrogram
+from ..services.media_cache_service import MediaCacheService
+from ..services.thumbnail_service import thumbnail_service
+from ..utils.media_utils import resolve_thumbnail, progress_for_pyrogram
+from ..utils.media_probe import media_probe
 from ..utils.file_manager import file_manager
+from ..utils.link_resolver import LinkResolver, link_resolver
 from ..utils.error_handler import handle_errors
 from ..exceptions.telegram import ChannelAccessException, SessionException
 from ..exceptions.validation import TrafficLimitException
@@ -38,6 +43,11 @@ class DownloadService:
         """初始化下载服务"""
         self.db: DatabaseManager = db_manager
         self.traffic: TrafficService = traffic_service
+        self.media_cache: MediaCacheService = media_cache_service
+        self.userbot_pool: UserbotPool = client_manager.userbot_pool
+        self.link_resolver: LinkResolver = link_resolver
+        # 正在下载的消息 (聊天, 消息ID) -> 完成事件，相同请求合并为一次下载
+        self._inflight: Dict[Tuple[str, int], asyncio.Event] = {}
     
     @handle_errors(default_return=False)
     async def download_message(self, userbot: Client, client: Client, telethon_bot: TelegramClient, 
@@ -56,69 +66,142 @@ class DownloadService:
         Returns:
             bool: 下载是否成功
         """
-        # 检查 userbot 是否可用
+        try:
+            link = self.link_resolver.parse(msg_link, offset)
+        except ValueError as e:
+            logger.warning(str(e))
+            if edit_id > 0:
+                await client.edit_message_text(sender, edit_id, "❌ 无效的消息链接")
+            return False
+        chat, msg_id = link.peer, link.msg_id
+        
+        # 公开频道先由机器人直接复制；已知机器人无法读取的频道直接使用Userbot
+        if link.is_public and not self.link_resolver.is_restricted(chat):
+            result = await self._download_public_message(client, sender, edit_id, msg_link, chat, msg_id)
+            if result is not None:
+                return result
+            self.link_resolver.mark_restricted(chat)
+        
+        # 检查 userbot 是否可用（启动时Userbot可能仍在后台连接）
         if userbot is None:
+            userbot = await client_manager.get_userbot()
+        if userbot is None and not self.userbot_pool.size:
             if edit_id > 0:
                 await client.edit_message_text(sender, edit_id, "❌ 未配置 SESSION，无法访问受限内容\n\n使用 /addsession 添加 SESSION")
             return False
         
-        edit = ""
-        chat = ""
-        round_message = False
+        key = (str(chat), msg_id)
+        # 其他用户正在下载同一条消息时等待其完成，之后直接通过file_id转发
+        if key in self._inflight:
+            logger.info(f"相同消息正在下载，等待完成: {msg_link}")
+            if edit_id > 0:
+                await client.edit_message_text(sender, edit_id, "相同文件正在下载中，请稍候...")
+            while key in self._inflight:
+                await self._inflight[key].wait()
         
-        # 处理链接中的参数
-        if "?single" in msg_link:
-            msg_link = msg_link.split("?single")[0]
+        self._inflight[key] = asyncio.Event()
+        try:
+            # 优先使用请求者本人的账号（通常就是加入了该频道的账号）
+            async with client_manager.acquire_user_client(sender, chat) as own:
+                if own is not None:
+                    return await self._download_private_message(own, client, telethon_bot, sender,
+                                                                edit_id, msg_link, chat, msg_id)
+            
+            # 从账号池中选择负载最低的账号，账号池为空时使用调用方传入的userbot
+            async with self.userbot_pool.acquire(chat) as pooled:
+                return await self._download_private_message(pooled or userbot, client, telethon_bot, sender,
+                                                            edit_id, msg_link, chat, msg_id)
+        finally:
+            self._inflight.pop(key).set()
+    
+    async def _download_private_message(self, userbot: Client, client: Client, telethon_bot: TelegramClient,
+                                        sender: int, edit_id: int, msg_link: str, chat: Union[int, str],
+                                        msg_id: int) -> bool:
+        """下载受限频道或机器人中的消息
         
-        msg_id = int(msg_link.split("/")[-1]) + offset
+        Args:
+            userbot: Pyrogram用户客户端
+            client: Pyrogram机器人客户端
+            telethon_bot: Telethon机器人客户端
+            sender: 发送者用户ID
+            edit_id: 编辑消息ID
+            msg_link: 消息链接
+            chat: 源聊天ID或机器人用户名
+            msg_id: 消息ID
+            
+        Returns:
+            bool: 下载是否成功
+        """
+        edit = ""
+        round_message = False
         height, width, duration, thumb_path = 90, 90, 0, None
+        file = ""
+        # 本次下载使用中的媒体缓存项，结束前不会被淘汰
+        pinned_unique_id = None
         
-        if 't.me/c/' in msg_link or 't.me/b/' in msg_link:
-            if 't.me/b/' in msg_link:
-                chat = str(msg_link.split("/")[-2])
-            else:
-                chat = int('-100' + str(msg_link.split("/")[-2]))
-            
-            file = ""
-            try:
-                msg = await userbot.get_messages(chat, msg_id)
-                if msg.media:
-                    if msg.media == MessageMediaType.WEB_PAGE:
-                        if edit_id > 0:
-                            edit = await client.edit_message_text(sender, edit_id, "克隆中...")
-                        if msg.text:
-                            await client.send_message(sender, msg.text.markdown)
-                        if edit_id > 0 and edit:
-                            await edit.delete()
-                        return True
-                
-                if not msg.media:
+        try:
+            # 先用当前账号获取源消息：媒体缓存只在该账号能读取源消息时使用，
+            # 避免把受限频道的内容发给无权访问的用户
+            msg = await userbot.get_messages(chat, msg_id)
+            if msg.media:
+                if msg.media == MessageMediaType.WEB_PAGE:
+                    if edit_id > 0:
+                        edit = await client.edit_message_text(sender, edit_id, "克隆中...")
                     if msg.text:
-                        if edit_id > 0:
-                            edit = await client.edit_message_text(sender, edit_id, "克隆中...")
                         await client.send_message(sender, msg.text.markdown)
-                        if edit_id > 0 and edit:
-                            await edit.delete()
-                        return True
-                    else:
-                        if edit_id > 0:
-                            await client.edit_message_text(sender, edit_id, "❌ 消息为空")
-                        return False
-                
-                if edit_id > 0:
-                    edit = await client.edit_message_text(sender, edit_id, "尝试下载...")
-                
-                # 获取文件大小并检查流量限制
-                file_size = self._get_file_size(msg)
-                
-                # 检查流量限制
-                can_download, limit_msg = await self.traffic.check_traffic_limit(sender, file_size)
-                if not can_download:
+                    if edit_id > 0 and edit:
+                        await edit.delete()
+                    return True
+            
+            if not msg.media:
+                if msg.text:
                     if edit_id > 0:
-                        await client.edit_message_text(sender, edit_id, f"❌ {limit_msg}\n\n使用 /traffic 查看流量使用情况")
-                    await self.db.add_download(sender, msg_link, msg_id, str(chat), "限制", file_size, "failed")
+                        edit = await client.edit_message_text(sender, edit_id, "克隆中...")
+                    await client.send_message(sender, msg.text.markdown)
+                    if edit_id > 0 and edit:
+                        await edit.delete()
+                    return True
+                else:
+                    if edit_id > 0:
+                        await client.edit_message_text(sender, edit_id, "❌ 消息为空")
                     return False
-                
+            
+            # 之前已上传过的消息，或同一个源文件（例如被转发到其他频道）已上传过时直接复用
+            source_unique_id = self._get_file_unique_id(msg)
+            cached = (await self.media_cache.get(chat, msg_id)
+                      or await self.media_cache.get_by_unique_id(source_unique_id))
+            if cached:
+                source_caption = str(msg.caption) if msg.caption is not None else None
+                result = await self._send_cached_media(client, sender, edit_id, cached, source_caption,
+                                                       msg_link, msg_id, chat)
+                if result:
+                    await self.media_cache.put(chat, msg_id, source_unique_id, cached,
+                                               caption=source_caption, file_size=cached.get("file_size", 0))
+                if result is not None:
+                    return result
+            
+            if edit_id > 0:
+                edit = await client.edit_message_text(sender, edit_id, "尝试下载...")
+            
+            # 获取文件大小并检查流量限制
+            file_size = self._get_file_size(msg)
+            
+            # 检查流量限制
+            can_download, limit_msg = await self.traffic.check_traffic_limit(sender, file_size)
+            if not can_download:
+                if edit_id > 0:
+                    await client.edit_message_text(sender, edit_id, f"❌ {limit_msg}\n\n使用 /traffic 查看流量使用情况")
+                await self.db.add_download(sender, msg_link, msg_id, str(chat), "限制", file_size, "failed")
+                return False
+            
+            # 本地已有同一文件（之前上传失败或重复请求）时跳过下载；
+            # 未缓存时为即将下载的文件预留缓存空间
+            file_manager.pin_media(source_unique_id, file_size)
+            pinned_unique_id = source_unique_id
+            file = file_manager.get_cached_media(source_unique_id)
+            if file:
+                logger.info(f"使用本地缓存文件: {file}")
+            else:
                 file = await userbot.download_media(
                     msg,
                     progress=progress_for_pyrogram,
@@ -135,125 +218,142 @@ class DownloadService:
                         await client.edit_message_text(sender, edit_id, "❌ 下载失败")
                     await self.db.add_download(sender, msg_link, msg_id, str(chat), "download_error", file_size, "failed")
                     return False
-                    
-                logger.info(f"下载完成: {file}")
-                if edit_id > 0:
-                    await client.edit_message_text(sender, edit_id, '准备上传！')
-                
-                caption = None
-                if msg.caption is not None:
-                    caption = msg.caption
                 
-                if msg.media == MessageMediaType.VIDEO_NOTE:
-                    round_message = True
-                    logger.info("获取视频元数据")
-                    data = video_metadata(file)
-                    height, width, duration = data["height"], data["width"], data["duration"]
-                    logger.info(f'视频信息: 时长={duration}, 宽={width}, 高={height}')
-                    try:
-                        thumb_path = await screenshot(file, duration, sender)
-                    except Exception:
-                        thumb_path = None
-                    await client.send_video_note(
-                        chat_id=sender,
-                        video_note=file,
-                        length=height, duration=duration, 
-                        thumb=thumb_path,
-                        progress=progress_for_pyrogram,
-                        progress_args=(
-                            client,
-                            '**UPLOADING:**\n',
-                            edit,
-                            time.time()
-                        )
-                    )
-                elif msg.media == MessageMediaType.VIDEO and msg.video.mime_type in ["video/mp4", "video/x-matroska"]:
-                    logger.info("获取视频元数据")
-                    data = video_metadata(file)
-                    height, width, duration = data["height"], data["width"], data["duration"]
-                    logger.info(f'视频信息: 时长={duration}, 宽={width}, 高={height}')
-                    try:
-                        thumb_path = await screenshot(file, duration, sender)
-                    except Exception:
-                        thumb_path = None
-                    await client.send_video(
-                        chat_id=sender,
-                        video=file,
-                        caption=caption,
-                        supports_streaming=True,
-                        height=height, width=width, duration=duration, 
-                        thumb=thumb_path,
-                        progress=progress_for_pyrogram,
-                        progress_args=(
-                            client,
-                            '**UPLOADING:**\n',
-                            edit,
-                            time.time()
-                        )
+                logger.info(f"下载完成: {file}")
+                file = file_manager.add_to_media_cache(source_unique_id, file)
+            if edit_id > 0:
+                await client.edit_message_text(sender, edit_id, '准备上传！')
+            
+            caption = None
+            if msg.caption is not None:
+                caption = msg.caption
+            
+            if msg.media == MessageMediaType.VIDEO_NOTE:
+                round_message = True
+                logger.info("获取视频元数据")
+                data = await media_probe.get_video_metadata(file, msg.video_note)
+                height, width, duration = data["height"], data["width"], data["duration"]
+                logger.info(f'视频信息: 时长={duration}, 宽={width}, 高={height}')
+                try:
+                    thumb_path = await resolve_thumbnail(userbot, msg.video_note, file, duration,
+                                                         await self._get_thumbnail(sender))
+                except Exception:
+                    thumb_path = None
+                sent = await client.send_video_note(
+                    chat_id=sender,
+                    video_note=file,
+                    length=height, duration=duration, 
+                    thumb=thumb_path,
+                    progress=progress_for_pyrogram,
+                    progress_args=(
+                        client,
+                        '**UPLOADING:**\n',
+                        edit,
+                        time.time()
                     )
-                elif msg.media == MessageMediaType.PHOTO:
-                    if edit_id > 0 and edit:
-                        await edit.edit("上传照片中...")
-                    await telethon_bot.send_file(sender, file, caption=caption)
-                else:
-                    thumb_path = self._get_thumbnail(sender)
-                    await client.send_document(
-                        sender,
-                        file, 
-                        caption=caption,
-                        thumb=thumb_path,
-                        progress=progress_for_pyrogram,
-                        progress_args=(
-                            client,
-                            '**UPLOADING:**\n',
-                            edit,
-                            time.time()
-                        )
+                )
+            elif msg.media == MessageMediaType.VIDEO and msg.video.mime_type in ["video/mp4", "video/x-matroska"]:
+                logger.info("获取视频元数据")
+                data = await media_probe.get_video_metadata(file, msg.video)
+                height, width, duration = data["height"], data["width"], data["duration"]
+                logger.info(f'视频信息: 时长={duration}, 宽={width}, 高={height}')
+                try:
+                    thumb_path = await resolve_thumbnail(userbot, msg.video, file, duration,
+                                                         await self._get_thumbnail(sender))
+                except Exception:
+                    thumb_path = None
+                sent = await client.send_video(
+                    chat_id=sender,
+                    video=file,
+                    caption=caption,
+                    supports_streaming=True,
+                    height=height, width=width, duration=duration, 
+                    thumb=thumb_path,
+                    progress=progress_for_pyrogram,
+                    progress_args=(
+                        client,
+                        '**UPLOADING:**\n',
+                        edit,
+                        time.time()
                     )
-                
-                # 清理文件
-                await self._cleanup_file(file)
-                
-                # 记录流量和下载成功
-                media_type = self._get_media_type(msg)
-                await self.traffic.add_traffic(sender, file_size, file_size)
-                await self.db.add_download(sender, msg_link, msg_id, str(chat), media_type, file_size, "success")
-                
+                )
+            elif msg.media == MessageMediaType.PHOTO:
                 if edit_id > 0 and edit:
-                    await edit.delete()
-                return True
-                
-            except (ChannelBanned, ChannelInvalid, ChannelPrivate, ChatIdInvalid, ChatInvalid) as e:
-                logger.warning(f"频道访问错误: {e}")
+                    await edit.edit("上传照片中...")
+                sent = await client.send_photo(sender, file, caption=caption)
+            else:
+                thumb_path = await self._get_thumbnail(sender)
+                sent = await client.send_document(
+                    sender,
+                    file, 
+                    caption=caption,
+                    thumb=thumb_path,
+                    progress=progress_for_pyrogram,
+                    progress_args=(
+                        client,
+                        '**UPLOADING:**\n',
+                        edit,
+                        time.time()
+                    )
+                )
+            
+            # 清理文件
+            await self._cleanup_file(file)
+            
+            # 记录上传后的file_id，下次请求同一消息时直接复用
+            uploaded = self.media_cache.extract_file_id(sent)
+            if uploaded:
+                await self.media_cache.put(chat, msg_id, source_unique_id, uploaded,
+                                           caption=str(caption) if caption is not None else None,
+                                           file_size=file_size)
+            
+            # 记录流量和下载成功
+            media_type = self._get_media_type(msg)
+            await self.traffic.add_traffic(sender, file_size, file_size)
+            await self.db.add_download(sender, msg_link, msg_id, str(chat), media_type, file_size, "success")
+            
+            if edit_id > 0 and edit:
+                await edit.delete()
+            return True
+            
+        except (ChannelBanned, ChannelInvalid, ChannelPrivate, ChatIdInvalid, ChatInvalid, PeerIdInvalid) as e:
+            logger.warning(f"频道访问错误: {e}")
+            # 换用账号池中可能已加入该频道的其他账号
+            self.userbot_pool.report_no_access(userbot, chat)
+            async with self.userbot_pool.acquire(chat) as alternative:
+                if alternative is not None and alternative is not userbot:
+                    logger.info("当前账号无法访问该频道，尝试账号池中的其他账号")
+                    return await self._download_private_message(alternative, client, telethon_bot, sender,
+                                                                edit_id, msg_link, chat, msg_id)
+            if edit_id > 0:
+                await client.edit_message_text(sender, edit_id, "您加入该频道了吗？")
+            await self.db.add_download(sender, msg_link, msg_id, str(chat), "channel_error", 0, "failed")
+            return False
+        except Exception as e:
+            logger.error(f"下载消息时出错: {e}", exc_info=True)
+            if isinstance(e, FloodWait):
+                # 反馈给速率限制器，任务队列据此缩减并发
+                rate_limiter.record_flood_wait(e.value)
+                self.userbot_pool.report_flood_wait(userbot, e.value)
+            if self._is_telethon_fallback_needed(e):
+                return await self._upload_with_telethon_fallback(
+                    userbot, client, telethon_bot, sender, edit_id, msg_link, 
+                    msg, file, chat, msg_id, file_size, edit, round_message, 
+                    height, width, duration, thumb_path, caption
+                )
+            else:
+                error_msg = self._translate_error(str(e))
                 if edit_id > 0:
-                    await client.edit_message_text(sender, edit_id, "您加入该频道了吗？")
-                await self.db.add_download(sender, msg_link, msg_id, str(chat), "channel_error", 0, "failed")
+                    await client.edit_message_text(sender, edit_id, f'保存失败: `{msg_link}`\n\n错误: {error_msg}')
+                await self.db.add_download(sender, msg_link, msg_id, str(chat), "error", file_size, "failed")
+                await self._cleanup_file(file)
                 return False
-            except PeerIdInvalid:
-                chat = msg_link.split("/")[-3]
-                try:
-                    int(chat)
-                    new_link = f"t.me/c/{chat}/{msg_id}"
-                except ValueError:
-                    new_link = f"t.me/b/{chat}/{msg_id}"
-                return await self.download_message(userbot, client, telethon_bot, sender, edit_id, new_link, 0)
-            except Exception as e:
-                logger.error(f"下载消息时出错: {e}", exc_info=True)
-                if self._is_telethon_fallback_needed(e):
-                    return await self._upload_with_telethon_fallback(
-                        userbot, client, telethon_bot, sender, edit_id, msg_link, 
-                        msg, file, chat, msg_id, file_size, edit, round_message, 
-                        height, width, duration, thumb_path, caption
-                    )
-                else:
-                    error_msg = self._translate_error(str(e))
-                    if edit_id > 0:
-                        await client.edit_message_text(sender, edit_id, f'保存失败: `{msg_link}`\n\n错误: {error_msg}')
-                    await self.db.add_download(sender, msg_link, msg_id, str(chat), "error", file_size, "failed")
-                    await self._cleanup_file(file)
-                    return False
-        else:
-            return await self._download_public_message(client, sender, edit_id, msg_link, msg_id)
+        finally:
+            # 用户自定义缩略图之外的缩略图只在本次上传中使用
+            if thumb_path and not thumbnail_service.is_thumbnail_path(thumb_path):
+                await self._cleanup_file(thumb_path)
+            if pinned_unique_id:
+                file_manager.unpin_media(pinned_unique_id)
     
     def _get_file_size(self, msg: Any) -> int:
         """获取文件大小
@@ -279,7 +379,63 @@ class DownloadService:
             file_size = msg.video_note.file_size
         return file_size
     
-    def _get_thumbnail(self, sender: int) -> Optional[str]:
+    def _get_file_unique_id(self, msg: Any) -> Optional[str]:
+        """获取源消息中媒体文件的file_unique_id
+        
+        Args:
+            msg: Telegram消息对象
+            
+        Returns:
+            Optional[str]: 文件唯一ID，没有可下载媒体时返回None
+        """
+        for media in (msg.document, msg.video, msg.audio, msg.photo, msg.voice, msg.video_note):
+            if media is not None:
+                return media.file_unique_id
+        return None
+    
+    async def _send_cached_media(self, client: Client, sender: int, edit_id: int, cached: dict,
+                                 caption: Optional[str], msg_link: str, msg_id: int, chat: Any) -> Optional[bool]:
+        """通过缓存的file_id发送媒体
+        
+        Args:
+            client: Pyrogram机器人客户端
+            sender: 发送者用户ID
+            edit_id: 编辑消息ID（0表示没有状态消息）
+            cached: 媒体缓存记录
+            caption: 媒体说明
+            msg_link: 消息链接
+            msg_id: 消息ID
+            chat: 源聊天
+            
+        Returns:
+            Optional[bool]: True表示发送成功，False表示超出流量限制，
+            None表示缓存的file_id不可用（缓存记录已删除，需要重新下载）
+        """
+        file_size = cached.get("file_size", 0)
+        # 缓存命中同样计入用户流量
+        can_download, limit_msg = await self.traffic.check_traffic_limit(sender, file_size)
+        if not can_download:
+            if edit_id > 0:
+                await client.edit_message_text(sender, edit_id, f"❌ {limit_msg}\n\n使用 /traffic 查看流量使用情况")
+            await self.db.add_download(sender, msg_link, msg_id, str(chat), "限制", file_size, "failed")
+            return False
+        
+        try:
+            await client.send_cached_media(sender, cached["file_id"], caption=caption)
+        except Exception as e:
+            logger.warning(f"缓存的file_id不可用，将重新下载: {e}")
+            await self.media_cache.invalidate(cached["file_id"])
+            return None
+        
+        logger.info(f"命中媒体缓存: {msg_link}")
+        await self.traffic.add_traffic(sender, file_size, file_size)
+        await self.db.add_download(sender, msg_link, msg_id, str(chat), cached.get("media_type", "unknown"),
+                                   file_size, "success")
+        if edit_id > 0:
+            await client.delete_messages(sender, edit_id)
+        return True
+    
+    async def _get_thumbnail(self, sender: int) -> Optional[str]:
         """获取缩略图路径
         
         Args:
@@ -288,10 +444,7 @@ class DownloadService:
         Returns:
             Optional[str]: 缩略图文件路径，如果不存在则返回None
         """
-        if os.path.exists(f'{sender}.jpg'):
-            return f'{sender}.jpg'
-        else:
-            return None
+        return await thumbnail_service.get_thumbnail_path(sender)
     
     def _get_media_type(self, msg: Any) -> str:
         """获取媒体类型
@@ -403,7 +556,7 @@ class DownloadService:
             return False
     
     async def _download_public_message(self, client: Client, sender: int, edit_id: int, 
-                                     msg_link: str, msg_id: int) -> bool:
+                                     msg_link: str, chat: str, msg_id: int) -> Optional[bool]:
         """下载公开消息
         
         Args:
@@ -411,22 +564,21 @@ class DownloadService:
             sender: 发送者用户ID
             edit_id: 编辑消息ID（0表示不需要编辑状态消息）
             msg_link: 消息链接
+            chat: 频道用户名
             msg_id: 消息ID
             
         Returns:
-            bool: 下载是否成功
+            Optional[bool]: 下载是否成功，机器人无法读取该消息（需要Userbot）时返回None
         """
         # 只有在edit_id > 0时才发送状态消息
         edit = None
         if edit_id > 0:
             edit = await client.edit_message_text(sender, edit_id, "克隆中...")
         
-        chat = msg_link.split("t.me")[1].split("/")[1]
         try:
             msg = await client.get_messages(chat, msg_id)
-            if msg.empty:
-                new_link = f't.me/b/{chat}/{int(msg_id)}'
-                return await self.download_message(None, client, None, sender, edit_id, new_link, 0)
+            if msg is None or getattr(msg, "empty", False):
+                return None
             await client.copy_message(sender, chat, msg_id)
         except Exception as e:
             logger.error(f"复制消息时出错: {e}", exc_info=True)
@@ -450,6 +602,9 @@ class DownloadService:
             bool: 清理是否成功
         """
         try:
+            # 媒体缓存中的文件保留给后续重试和重复请求，由LRU淘汰
+            if file_manager.is_media_cached(file_path):
+                return False
             if file_manager.file_exists(file_path):
                 file_manager.safe_remove(file_path)
                 logger.info(f"已清理文件: {file_path}")
@@ -463,4 +618,6 @@ class DownloadService:
 # 全局下载服务实例
 from ..core.database import db_manager
 from ..services.traffic_service import traffic_service
+from ..services.media_cache_service import media_cache_service
+from ..core.clients import client_manager
 download_service = DownloadService()
\ No newline at end of file
@@ -1,10 +1,17 @@
 """下载任务管理器"""
 import asyncio
+import functools
 import logging
-from typing import Optional, Dict, Any
+import os
+import socket
+import time
+import uuid
+from typing import Optional, Dict, Any, List, AsyncIterator
 from datetime import datetime
 
-from ..core.task_queue import ImprovedTaskQueue, TaskInfo, TaskStatus
+from ..core.task_queue import ImprovedTaskQueue, TaskInfo, TaskStatus, TaskQueueError
+from ..core.task_store import TaskStore, TaskRecord, create_task_store
+from ..core.rate_limiter import rate_limiter
 from ..services.download_service import download_service
 from ..core.clients import client_manager
 from ..config import settings
@@ -13,41 +20,311 @@ logger = logging.getLogger(__name__)
 
 
 class DownloadTaskManager:
-    """下载任务管理器"""
+    """下载任务管理器
+    
+    配置了持久化后端时，任务先写入任务存储再进入内存队列，开始执行时领取租约，
+    结束后确认删除；进程崩溃后未确认的任务在下次启动时恢复，运行期间也会定期回收
+    租约已过期的任务，重试次数用完的任务移入死信存储。
+    """
     
     def __init__(self):
-        self.task_queue = ImprovedTaskQueue(max_workers=settings.MAX_WORKERS)
+        # 按用户公平调度，避免单个用户的批量任务占满所有工作线程；
+        # 工作线程数在MIN_WORKERS和MAX_WORKERS之间按积压和FloodWait自动伸缩
+        self.task_queue = ImprovedTaskQueue(
+            max_workers=settings.MAX_WORKERS,
+            min_workers=settings.MIN_WORKERS,
+            per_owner_limit=settings.MAX_TASKS_PER_USER,
+            rate_limiter=rate_limiter
+        )
         self.download_svc = download_service
         self.clients = client_manager
+        # 批量任务ID -> 子任务ID列表
+        self.batch_tasks: Dict[str, List[str]] = {}
+        # 持久化任务存储，None表示仅内存队列
+        self.task_store: Optional[TaskStore] = None
+        self.consumer_id = f"{socket.gethostname()}:{os.getpid()}"
+        # 停机或排空时为True，此时被中断的任务归还给存储而不是确认删除
+        self._shutting_down = False
+        # 独立工作进程模式下把持久化存储中的任务放入内存队列的消费循环
+        self._consumer: Optional[asyncio.Task] = None
+        # 定期回收过期租约和清理死信的后台任务
+        self._maintainer: Optional[asyncio.Task] = None
     
     async def start(self):
         """启动下载任务管理器"""
+        self._shutting_down = False
         await self.task_queue.start()
+        
+        try:
+            self.task_store = create_task_store()
+        except Exception as e:
+            logger.error(f"初始化持久化任务存储失败，将仅使用内存队列: {e}", exc_info=True)
+            self.task_store = None
+        
+        if self.task_store is None and settings.EXTERNAL_WORKERS:
+            logger.error("EXTERNAL_WORKERS 需要持久化任务存储，下载任务将在本进程执行")
+        
+        if self.task_store:
+            # 交给独立工作进程执行时，本进程只负责写入任务存储，不回收任务
+            if not self.uses_external_workers():
+                await self._recover_tasks()
+            self._maintainer = asyncio.create_task(
+                self._maintain_store(reclaim=not self.uses_external_workers()))
         logger.info("下载任务管理器已启动")
     
-    async def stop(self):
-        """停止下载任务管理器"""
+    async def start_worker(self, concurrency: Optional[int] = None):
+        """以独立工作进程模式启动：从持久化存储领取并执行下载任务
+        
+        任务同样经过内存队列执行，与前端进程一样按用户公平调度、限制单个用户的并发，
+        并在FloodWait时自动降低并发；concurrency为工作线程数上限。
+        """
+        self._shutting_down = False
+        self.task_store = create_task_store()
+        if self.task_store is None:
+            raise TaskQueueError("工作进程模式需要配置 TASK_QUEUE_BACKEND 为 mongo 或 sqlite")
+        
+        if concurrency:
+            self.task_queue.max_workers = concurrency
+            self.task_queue.min_workers = min(self.task_queue.min_workers, concurrency)
+        await self.task_queue.start()
+        self._consumer = asyncio.create_task(self._consume())
+        # 消费循环本身会领取过期租约，这里只需清理死信
+        self._maintainer = asyncio.create_task(self._maintain_store(reclaim=False))
+        logger.info(f"下载工作进程已启动: {self.consumer_id}")
+    
+    async def stop(self, drain_timeout: float = 30.0):
+        """停止下载任务管理器（先排空，未开始的任务保留在持久化存储中）"""
+        await self.drain(drain_timeout)
+        if self._maintainer:
+            self._maintainer.cancel()
+            try:
+                await self._maintainer
+            except asyncio.CancelledError:
+                pass
+            self._maintainer = None
         await self.task_queue.stop()
+        if self.task_store:
+            self.task_store.close()
+            self.task_store = None
         logger.info("下载任务管理器已停止")
     
-    def add_download_task(self, sender: int, msg_link: str, offset: int = 0, priority: int = 0) -> str:
-        """添加下载任务"""
-        task_name = f"下载_{msg_link.split('/')[-1]}_{offset}"
-        
-        # 创建任务信息
-        task_id = self.task_queue.add_task(
-            name=task_name,
-            task_func=self._execute_download_task,
-            sender=sender,
-            msg_link=msg_link,
-            offset=offset,
-            priority=priority
+    async def drain(self, timeout: Optional[float] = None):
+        """排空队列：不再接收和启动新任务，等待运行中的任务结束
+        
+        排队中的任务只从内存队列移除，仍保留在持久化存储中，由下一个实例继续处理。
+        """
+        self._shutting_down = True
+        # 工作进程先停止领取新任务
+        if self._consumer:
+            await self._stop_consumer()
+        
+        pending_ids = list(self.task_queue.pending_tasks)
+        if pending_ids:
+            await self.task_queue.cancel_tasks(pending_ids)
+            logger.info(f"排空队列: {len(pending_ids)} 个排队中的任务已移出内存队列")
+        
+        running_ids = list(self.task_queue.running_tasks)
+        if running_ids:
+            logger.info(f"排空队列: 等待 {len(running_ids)} 个运行中的任务结束")
+            try:
+                async for _ in self.task_queue.as_completed(running_ids, timeout=timeout):
+                    pass
+            except asyncio.TimeoutError:
+                logger.warning("排空队列超时，未完成的任务将在停止时归还给任务存储")
+    
+    def uses_external_workers(self) -> bool:
+        """下载任务是否交给独立工作进程执行"""
+        return settings.EXTERNAL_WORKERS and self.task_store is not None
+    
+    async def _consume(self):
+        """工作进程的消费循环：把持久化存储中可领取的任务放入内存队列
+        
+        每个用户在内存队列中最多积压max_workers个任务，避免一个大批量任务的全部子任务
+        排在其他用户前面；任务开始执行时才领取租约，已被其他工作进程领取的任务直接跳过。
+        """
+        idle_delay = 0.5
+        while not self._shutting_down:
+            try:
+                recovered = await self._recover_tasks(per_owner_backlog=self.task_queue.max_workers)
+            except Exception as e:
+                logger.error(f"领取任务时出错: {e}", exc_info=True)
+                recovered = 0
+            # 没有新任务时逐步放慢轮询
+            idle_delay = 0.5 if recovered else min(idle_delay * 2, 5.0)
+            await asyncio.sleep(idle_delay)
+    
+    async def _stop_consumer(self):
+        """停止消费循环，不再把新任务放入内存队列"""
+        self._consumer.cancel()
+        try:
+            await self._consumer
+        except asyncio.CancelledError:
+            pass
+        self._consumer = None
+    
+    async def _maintain_store(self, reclaim: bool):
+        """定期将重试次数用完的任务移入死信存储，reclaim为True时重新入队租约已过期的任务"""
+        interval = self.task_store.visibility_timeout / 2
+        while not self._shutting_down:
+            await asyncio.sleep(interval)
+            try:
+                dead = await self.task_store.dead_letter()
+                if dead:
+                    logger.warning(f"{dead} 个任务重试次数已用完，已移入死信存储")
+                if reclaim and not self._shutting_down:
+                    await self._recover_tasks()
+            except Exception as e:
+                logger.error(f"维护持久化任务存储时出错: {e}", exc_info=True)
+    
+    async def _recover_tasks(self, per_owner_backlog: Optional[int] = None) -> int:
+        """从持久化存储恢复未完成的任务（排队中或租约已过期且不在本地队列中的任务）
+        
+        per_owner_backlog限制每个用户在内存队列中等待的任务数，None表示不限制。
+        """
+        records = await self.task_store.list_available()
+        backlog: Dict[Any, int] = {}
+        for task_info in self.task_queue.pending_tasks.values():
+            backlog[task_info.owner] = backlog.get(task_info.owner, 0) + 1
+        recovered = 0
+        for record in records:
+            if record.kind != "download":
+                continue
+            if record.task_id in self.task_queue.pending_tasks or record.task_id in self.task_queue.running_tasks:
+                continue
+            if per_owner_backlog is not None and backlog.get(record.owner, 0) >= per_owner_backlog:
+                continue
+            backlog[record.owner] = backlog.get(record.owner, 0) + 1
+            try:
+                self._enqueue_local(record)
+                recovered += 1
+            except TaskQueueError as e:
+                logger.warning(f"恢复任务 {record.task_id} 失败: {e}")
+        if recovered:
+            logger.info(f"已从持久化存储回收 {recovered} 个下载任务")
+        return recovered
+    
+    def _enqueue_local(self, record: TaskRecord) -> str:
+        """将任务记录加入内存队列"""
+        payload = record.payload
+        return self.task_queue.add_task(
+            f"下载_{payload['msg_link'].split('/')[-1]}_{payload['offset']}",
+            functools.partial(self._run_stored_task, record.task_id),
+            priority=record.priority,
+            owner=record.owner,
+            task_id=record.task_id,
+            **payload
         )
+    
+    async def add_download_task(self, sender: int, msg_link: str, offset: int = 0, priority: int = 0,
+                                edit_id: int = 0) -> str:
+        """添加下载任务
+        
+        edit_id为用于显示进度的状态消息ID，0表示不显示进度。
+        """
+        if self._shutting_down:
+            raise TaskQueueError("下载任务管理器正在停止，暂不接收新任务")
+        
+        record = TaskRecord(
+            task_id=str(uuid.uuid4()),
+            kind="download",
+            payload={"sender": sender, "msg_link": msg_link, "offset": offset, "edit_id": edit_id},
+            priority=priority,
+            owner=sender,
+            created_at=time.time()
+        )
+        
+        # 先持久化再入队，保证工作线程开始执行时能领取到租约
+        if self.task_store:
+            await self.task_store.enqueue(record)
+        if self.uses_external_workers():
+            logger.info(f"已添加下载任务（由工作进程执行）: {msg_link} (偏移: {offset}) ({record.task_id})")
+            return record.task_id
+        try:
+            task_id = self._enqueue_local(record)
+        except TaskQueueError:
+            if self.task_store:
+                await self.task_store.ack(record.task_id)
+            raise
         
-        logger.info(f"已添加下载任务: {task_name} ({task_id})")
+        logger.info(f"已添加下载任务: {msg_link} (偏移: {offset}) ({task_id})")
         return task_id
     
-    async def _execute_download_task(self, sender: int, msg_link: str, offset: int) -> bool:
+    async def _run_stored_task(self, task_id: str, sender: int, msg_link: str, offset: int,
+                               edit_id: int = 0) -> bool:
+        """在持久化租约保护下执行下载任务"""
+        if self.task_store is None:
+            return await self._execute_download_task(sender, msg_link, offset, edit_id)
+        
+        record = await self.task_store.lease(self.consumer_id, task_id)
+        if record is None:
+            logger.info(f"任务 {task_id} 已被其他实例处理，跳过")
+            return False
+        
+        return await self._run_leased(task_id, sender, msg_link, offset, edit_id,
+                                      cancel_on_lost_lease=self._consumer is not None)
+    
+    async def _run_leased(self, task_id: str, sender: int, msg_link: str, offset: int, edit_id: int = 0,
+                          cancel_on_lost_lease: bool = False) -> bool:
+        """执行已领取租约的任务，运行期间续租，结束后确认或归还
+        
+        cancel_on_lost_lease为True时（独立工作进程），租约丢失（例如任务已被前端取消并确认删除）
+        会中断任务并返回False；前端不再等待结果，下载失败时由工作进程通过机器人通知用户。
+        """
+        runner = asyncio.current_task() if cancel_on_lost_lease else None
+        keepalive = asyncio.create_task(self._keep_lease(task_id, runner))
+        release = False
+        lost_lease = False
+        try:
+            result = await self._execute_download_task(sender, msg_link, offset, edit_id)
+            if not result and cancel_on_lost_lease and not edit_id:
+                # 有状态消息时下载服务已在其中显示失败原因
+                await self._notify(sender, f"❌ 下载失败: {msg_link} (偏移: {offset})")
+            return result
+        except asyncio.CancelledError:
+            # 停机时中断的任务归还给存储重新投递，用户取消的任务直接确认
+            release = self._shutting_down
+            # 续租任务只在租约丢失时自行结束
+            lost_lease = runner is not None and keepalive.done() and not keepalive.cancelled()
+            if release or not lost_lease:
+                raise
+            # 租约丢失导致的中断只结束本任务，任务记录已被删除或由其他工作进程领取，不再确认
+            runner.uncancel()
+            logger.info(f"任务 {task_id} 因租约丢失已中断")
+            return False
+        finally:
+            keepalive.cancel()
+            if release:
+                await self.task_store.release(task_id, self.consumer_id)
+            elif not lost_lease:
+                await self.task_store.ack(task_id)
+    
+    async def _notify(self, sender: int, text: str, edit_id: int = 0):
+        """通过机器人向用户发送任务结果"""
+        try:
+            if edit_id:
+                await self.clients.bot_client.edit_message_text(sender, edit_id, text)
+            else:
+                await self.clients.bot_client.send_message(sender, text)
+        except Exception as e:
+            logger.warning(f"通知用户 {sender} 失败: {e}")
+    
+    async def _keep_lease(self, task_id: str, runner: Optional[asyncio.Task] = None):
+        """任务运行期间定期续租"""
+        interval = self.task_store.visibility_timeout / 3
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                if not await self.task_store.heartbeat(task_id, self.consumer_id):
+                    if runner is not None:
+                        logger.info(f"任务 {task_id} 的租约已丢失，中断执行")
+                        runner.cancel()
+                    else:
+                        logger.warning(f"任务 {task_id} 的租约已丢失，可能会被重复执行")
+                    return
+            except Exception as e:
+                logger.error(f"任务 {task_id} 续租失败: {e}")
+    
+    async def _execute_download_task(self, sender: int, msg_link: str, offset: int, edit_id: int = 0) -> bool:
         """执行下载任务"""
         try:
             logger.info(f"开始执行下载任务: {msg_link} (偏移: {offset})")
@@ -55,10 +332,10 @@ class DownloadTaskManager:
             # 执行下载
             result = await self.download_svc.download_message(
                 userbot=self.clients.userbot,
-                client=self.clients.pyrogram_bot,
+                client=self.clients.bot_client,
                 telethon_bot=self.clients.bot,
                 sender=sender,
-                edit_id=0,  # 这里需要更好的处理方式
+                edit_id=edit_id,
                 msg_link=msg_link,
                 offset=offset
             )
@@ -68,6 +345,8 @@ class DownloadTaskManager:
             
         except Exception as e:
             logger.error(f"下载任务执行失败: {msg_link} (偏移: {offset}) - 错误: {e}", exc_info=True)
+            # 提交任务的处理器不等待结果，由这里通知用户
+            await self._notify(sender, f"❌ 处理失败: {e}", edit_id)
             raise
     
     async def get_task_status(self, task_id: str) -> Optional[Dict[str, Any]]:
@@ -75,17 +354,33 @@ class DownloadTaskManager:
         return await self.task_queue.get_task_status(task_id)
     
     async def cancel_task(self, task_id: str) -> bool:
-        """取消任务"""
-        return await self.task_queue.cancel_task(task_id)
+        """取消任务
+        
+        由工作进程执行的任务直接从任务存储删除，工作进程在下次续租时发现租约丢失后中断执行。
+        """
+        if self.uses_external_workers():
+            return await self.task_store.ack(task_id)
+        
+        cancelled = await self.task_queue.cancel_task(task_id)
+        if cancelled and self.task_store:
+            await self.task_store.ack(task_id)
+        return cancelled
     
     async def get_queue_stats(self) -> Dict[str, Any]:
         """获取队列统计信息"""
-        return await self.task_queue.get_queue_stats()
+        stats = await self.task_queue.get_queue_stats()
+        if self.task_store:
+            stats["persisted_tasks"] = await self.task_store.count()
+        return stats
     
     async def wait_for_task(self, task_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
         """等待任务完成"""
         return await self.task_queue.wait_for_task(task_id, timeout)
     
+    def as_completed(self, task_ids: List[str], timeout: Optional[float] = None) -> AsyncIterator[Dict[str, Any]]:
+        """按完成顺序获取一组任务的结果"""
+        return self.task_queue.as_completed(task_ids, timeout)
+    
     async def create_batch_task(self, sender: int, start_link: str, count: int) -> str:
         """创建批量下载任务"""
         batch_task_id = f"batch_{int(datetime.now().timestamp())}"
@@ -95,28 +390,49 @@ class DownloadTaskManager:
         # 添加多个下载任务
         task_ids = []
         for i in range(count):
-            task_id = self.add_download_task(
+            task_id = await self.add_download_task(
                 sender=sender,
                 msg_link=start_link,
-                offset=i,
-                priority=1
+                offset=i
             )
             task_ids.append(task_id)
         
+        self.batch_tasks[batch_task_id] = task_ids
         logger.info(f"批量下载任务 {batch_task_id} 已添加 {len(task_ids)} 个子任务")
         return batch_task_id
     
+    async def get_batch_remaining(self, batch_task_id: str) -> int:
+        """批量任务中尚未结束的子任务数，全部结束后移除该批量任务的记录
+        
+        由工作进程执行时以持久化存储为准（子任务结束后即被确认删除）。
+        """
+        task_ids = self.batch_tasks.get(batch_task_id, [])
+        if self.uses_external_workers():
+            remaining = await self.task_store.count_ids(task_ids)
+        else:
+            remaining = sum(1 for task_id in task_ids
+                            if task_id in self.task_queue.pending_tasks or task_id in self.task_queue.running_tasks)
+        if remaining == 0:
+            self.batch_tasks.pop(batch_task_id, None)
+        return remaining
+    
     async def update_batch_progress(self, task_id: str, completed: int) -> None:
         """更新批量任务进度"""
         logger.debug(f"批量任务 {task_id} 进度更新: {completed}")
     
     async def complete_batch_task(self, task_id: str) -> None:
         """完成批量任务"""
+        self.batch_tasks.pop(task_id, None)
         logger.info(f"批量任务 {task_id} 已完成")
     
     async def cancel_batch_task(self, task_id: str) -> None:
-        """取消批量任务"""
-        logger.info(f"批量任务 {task_id} 已取消")
+        """取消批量任务（包括等待中和运行中的所有子任务）"""
+        task_ids = self.batch_tasks.pop(task_id, [])
+        cancelled = await self.task_queue.cancel_tasks(task_ids)
+        if self.task_store:
+            for sub_task_id in task_ids:
+                await self.task_store.ack(sub_task_id)
+        logger.info(f"批量任务 {task_id} 已取消，共取消 {cancelled} 个子任务")
     
     async def process_batch_download(self, sender: int, start_link: str, count: int) -> str:
         """处理批量下载任务（别名方法，保持向后兼容）"""
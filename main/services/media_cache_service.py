@@ -0,0 +1,115 @@
+"""媒体缓存服务模块
+
+记录已上传到用户的媒体的file_id，同一条源消息（或同一个源文件）再次被请求时，
+直接通过file_id转发，无需重新下载和上传。缓存只在本次请求使用的账号能读取源消息时使用，
+并且和正常下载一样检查、计入用户流量。
+"""
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from ..core.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+# 按上传后消息的媒体类型查找file_id的顺序
+_MEDIA_ATTRS = ("video", "video_note", "animation", "audio", "voice", "document", "photo")
+
+
+class MediaCacheService:
+    """媒体file_id缓存服务
+
+    以(源聊天, 源消息ID)和源文件的file_unique_id两种键索引，
+    内存中保留最近使用的记录，MongoDB可用时持久化。
+    """
+
+    def __init__(self, max_entries: int = 2000):
+        self.db = db_manager
+        self.max_entries = max_entries
+        self._by_message: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._by_unique_id: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def extract_file_id(message: Any) -> Optional[Dict[str, str]]:
+        """从Pyrogram消息中提取媒体的file_id和file_unique_id"""
+        if message is None:
+            return None
+        for attr in _MEDIA_ATTRS:
+            media = getattr(message, attr, None)
+            if media is not None and getattr(media, "file_id", None):
+                return {
+                    "media_type": attr,
+                    "file_id": media.file_id,
+                    "file_unique_id": media.file_unique_id
+                }
+        return None
+
+    def _remember(self, cache: OrderedDict, key: Any, record: Dict[str, Any]):
+        cache[key] = record
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    async def get(self, chat: Any, message_id: int) -> Optional[Dict[str, Any]]:
+        """按源消息获取缓存记录"""
+        key = (str(chat), message_id)
+        record = self._by_message.get(key)
+        if record is not None:
+            self._by_message.move_to_end(key)
+            return record
+
+        record = await self.db.get_cached_media(str(chat), message_id)
+        if record:
+            self._remember(self._by_message, key, record)
+        return record
+
+    async def get_by_unique_id(self, file_unique_id: Optional[str]) -> Optional[Dict[str, Any]]:
+        """按源文件的file_unique_id获取缓存记录"""
+        if not file_unique_id:
+            return None
+
+        record = self._by_unique_id.get(file_unique_id)
+        if record is not None:
+            self._by_unique_id.move_to_end(file_unique_id)
+            return record
+
+        record = await self.db.get_cached_media_by_unique_id(file_unique_id)
+        if record:
+            self._remember(self._by_unique_id, file_unique_id, record)
+        return record
+
+    async def put(self, chat: Any, message_id: int, source_unique_id: Optional[str],
+                  uploaded: Dict[str, str], caption: Optional[str] = None, file_size: int = 0) -> None:
+        """记录源消息对应的已上传媒体
+
+        Args:
+            chat: 源聊天ID或用户名
+            message_id: 源消息ID
+            source_unique_id: 源文件的file_unique_id
+            uploaded: extract_file_id() 从上传后的消息中提取的结果
+            caption: 媒体说明
+            file_size: 文件大小（字节）
+        """
+        record = {
+            "file_id": uploaded["file_id"],
+            "media_type": uploaded["media_type"],
+            "file_unique_id": source_unique_id,
+            "caption": caption,
+            "file_size": file_size
+        }
+        self._remember(self._by_message, (str(chat), message_id), record)
+        if source_unique_id:
+            self._remember(self._by_unique_id, source_unique_id, record)
+        await self.db.save_cached_media(str(chat), message_id, record)
+
+    async def invalidate(self, file_id: str) -> None:
+        """file_id失效时删除相关缓存"""
+        for cache in (self._by_message, self._by_unique_id):
+            for key in [k for k, v in cache.items() if v.get("file_id") == file_id]:
+                del cache[key]
+        await self.db.delete_cached_media(file_id)
+        logger.info(f"已删除失效的媒体缓存: {file_id}")
+
+
+# 全局媒体缓存服务实例
+media_cache_service = MediaCacheService()
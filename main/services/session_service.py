@@ -2,45 +2,45 @@
 import logging
 import hashlib
 import secrets
-from typing import Optional, List, Dict, Any
+import time
+from collections import OrderedDict
+from typing import Optional, List, Dict, Any, Tuple, Callable
 from datetime import datetime
 from cryptography.fernet import Fernet, InvalidToken
-from cryptography.hazmat.primitives import hashes
-from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
-import base64
 
 from ..core.database import db_manager
 from ..config import settings
 from ..exceptions.telegram import SessionException
+from ..utils.security import security_manager
 
 logger = logging.getLogger(__name__)
 
 
+def _zero(buffer: bytearray):
+    """用0覆盖缓存的明文SESSION"""
+    buffer[:] = bytes(len(buffer))
+
+
 class SessionService:
     """会话管理服务"""
     
-    def __init__(self):
+    def __init__(self, cache_ttl: float = 300.0, max_entries: int = 256):
         self.db = db_manager
         self.cipher_suite = None
         self._init_encryption()
+        # 解密后的SESSION缓存: user_id -> (数据库中的密文, 明文, 读取时间)
+        # 其他主机修改SESSION后，本地缓存最多在 cache_ttl 秒后更新
+        self.cache_ttl = cache_ttl
+        self.max_entries = max_entries
+        self._cache: "OrderedDict[int, Tuple[str, bytearray, float]]" = OrderedDict()
+        # SESSION保存或删除后调用，参数为用户ID（例如丢弃用旧SESSION启动的客户端）
+        self._change_listeners: List[Callable[[int], None]] = []
     
     def _init_encryption(self):
-        """初始化加密系统"""
+        """初始化加密系统（密钥派生由 security_manager 完成并缓存）"""
         try:
             if settings.ENCRYPTION_KEY:
-                # 使用提供的密钥
-                key = settings.ENCRYPTION_KEY.encode()
-                if len(key) != 32:
-                    # 如果不是32字节，使用PBKDF2派生密钥
-                    salt = b'tg_content_bot_salt_16bytes'  # 固定盐值
-                    kdf = PBKDF2HMAC(
-                        algorithm=hashes.SHA256(),
-                        length=32,
-                        salt=salt,
-                        iterations=100000,
-                    )
-                    key = base64.urlsafe_b64encode(kdf.derive(key))
-                self.cipher_suite = Fernet(key)
+                self.cipher_suite = security_manager.get_fernet(settings.ENCRYPTION_KEY)
                 logger.info("会话加密已启用")
             else:
                 logger.warning("会话加密未配置，SESSION将明文存储")
@@ -48,6 +48,50 @@ class SessionService:
             logger.error(f"初始化加密系统失败: {e}")
             self.cipher_suite = None
     
+    def _remember(self, user_id: int, encrypted_session: str, session_string: str):
+        self._forget(user_id)
+        self._cache[user_id] = (encrypted_session, bytearray(session_string.encode()), time.monotonic())
+        while len(self._cache) > self.max_entries:
+            _, (_, buffer, _) = self._cache.popitem(last=False)
+            _zero(buffer)
+    
+    def _forget(self, user_id: int):
+        entry = self._cache.pop(user_id, None)
+        if entry is not None:
+            _zero(entry[1])
+    
+    def _cached(self, user_id: int, encrypted_session: Optional[str] = None) -> Optional[str]:
+        """读取缓存的明文，指定密文时只在密文一致时命中"""
+        entry = self._cache.get(user_id)
+        if entry is None:
+            return None
+        if encrypted_session is None and time.monotonic() - entry[2] > self.cache_ttl:
+            self._forget(user_id)
+            return None
+        if encrypted_session is not None:
+            if entry[0] != encrypted_session:
+                return None
+            # 刚与数据库核对过，重新计算过期时间
+            self._cache[user_id] = (entry[0], entry[1], time.monotonic())
+        self._cache.move_to_end(user_id)
+        return entry[1].decode()
+    
+    def add_change_listener(self, listener: Callable[[int], None]):
+        """注册SESSION变更回调"""
+        self._change_listeners.append(listener)
+    
+    def _notify_change(self, user_id: int):
+        for listener in self._change_listeners:
+            try:
+                listener(user_id)
+            except Exception as e:
+                logger.error(f"处理用户 {user_id} 的SESSION变更回调失败: {e}")
+    
+    def clear_cache(self):
+        """清空并覆盖所有缓存的明文SESSION"""
+        for user_id in list(self._cache):
+            self._forget(user_id)
+    
     def _generate_encryption_key(self) -> str:
         """生成新的加密密钥"""
         return Fernet.generate_key().decode()
@@ -105,9 +149,11 @@ class SessionService:
         
         try:
             # 保存到数据库
+            self._forget(user_id)
             result = await self.db.save_session(user_id, encrypted_session)
             if result:
                 logger.info(f"SESSION已保存: 用户 {user_id}")
+                self._notify_change(user_id)
             else:
                 logger.error(f"保存SESSION失败: 用户 {user_id}")
             return result
@@ -117,6 +163,10 @@ class SessionService:
     
     async def get_session(self, user_id: int) -> Optional[str]:
         """获取SESSION字符串"""
+        cached = self._cached(user_id)
+        if cached is not None:
+            return cached
+        
         try:
             encrypted_session = await self.db.get_session(user_id)
             if not encrypted_session:
@@ -129,6 +179,7 @@ class SessionService:
                 logger.error(f"解密用户 {user_id} 的SESSION失败")
                 return None
             
+            self._remember(user_id, encrypted_session, session_string)
             return session_string
         except Exception as e:
             logger.error(f"获取SESSION时数据库错误: {e}")
@@ -136,10 +187,12 @@ class SessionService:
     
     async def delete_session(self, user_id: int) -> bool:
         """删除SESSION字符串"""
+        self._forget(user_id)
         try:
             result = await self.db.delete_session(user_id)
             if result:
                 logger.info(f"SESSION已删除: 用户 {user_id}")
+                self._notify_change(user_id)
             else:
                 logger.warning(f"删除SESSION失败: 用户 {user_id} 未找到SESSION")
             return result
@@ -152,11 +205,18 @@ class SessionService:
         try:
             sessions = await self.db.get_all_sessions()
             
-            # 解密所有SESSION
+            # 解密所有SESSION，密文未变化的直接使用缓存
             for session in sessions:
-                if session.get("session_string"):
-                    decrypted_session = self._decrypt_session(session["session_string"])
-                    session["session_string"] = decrypted_session
+                encrypted_session = session.get("session_string")
+                if not encrypted_session:
+                    continue
+                user_id = session.get("user_id")
+                decrypted_session = self._cached(user_id, encrypted_session)
+                if decrypted_session is None:
+                    decrypted_session = self._decrypt_session(encrypted_session)
+                    if decrypted_session is not None:
+                        self._remember(user_id, encrypted_session, decrypted_session)
+                session["session_string"] = decrypted_session
             
             return sessions
         except Exception as e:
@@ -0,0 +1,156 @@
+"""缩略图服务模块
+
+用户自定义缩略图缩放为JPEG后保存在MongoDB中，多台主机上的工作进程共享同一份数据。
+最近使用的缩略图保留在内存中，只有上传需要文件路径时才写入临时目录。
+"""
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from ..core.database import db_manager, DatabaseOperationError
+from ..utils.ffmpeg_executor import ffmpeg_executor
+from ..utils.file_manager import file_manager
+
+logger = logging.getLogger(__name__)
+
+
+class ThumbnailService:
+    """用户缩略图服务"""
+
+    # Telegram 要求缩略图宽高不超过320像素
+    MAX_DIMENSION = 320
+
+    def __init__(self, max_entries: int = 256, cache_ttl: float = 300.0):
+        self.db = db_manager
+        self.max_entries = max_entries
+        # 其他主机修改缩略图后，本地缓存最多在 cache_ttl 秒后更新
+        self.cache_ttl = cache_ttl
+        self.thumb_dir = os.path.abspath(os.path.join(file_manager.base_temp_dir, "thumbnails"))
+        # user_id -> (JPEG数据, 读取时间)
+        self._cache: "OrderedDict[int, Tuple[bytes, float]]" = OrderedDict()
+
+    def _path(self, user_id: int) -> str:
+        return os.path.join(self.thumb_dir, f"{user_id}.jpg")
+
+    def _remember(self, user_id: int, data: bytes):
+        self._cache[user_id] = (data, time.monotonic())
+        self._cache.move_to_end(user_id)
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+
+    def _write(self, user_id: int, data: bytes) -> str:
+        os.makedirs(self.thumb_dir, exist_ok=True)
+        path = self._path(user_id)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return path
+
+    async def _resize(self, image_path: str) -> bytes:
+        """使用ffmpeg把图片缩放为JPEG，失败时返回原图数据"""
+        out = os.path.join(file_manager.base_temp_dir, f"thumb_resize_{uuid.uuid4().hex}.jpg")
+        cmd = [
+            "ffmpeg",
+            "-i", image_path,
+            "-vf", f"scale={self.MAX_DIMENSION}:{self.MAX_DIMENSION}:force_original_aspect_ratio=decrease",
+            "-frames:v", "1",
+            "-q:v", "5",
+            out,
+            "-y"
+        ]
+        try:
+            returncode, _, stderr = await ffmpeg_executor.run(cmd, timeout=30)
+            if returncode == 0 and file_manager.file_exists(out):
+                with open(out, "rb") as f:
+                    return f.read()
+            logger.warning(f"缩放缩略图失败: {stderr.decode(errors='ignore').strip()}")
+        except Exception as e:
+            logger.warning(f"缩放缩略图失败: {e}")
+        finally:
+            file_manager.safe_remove(out)
+
+        with open(image_path, "rb") as f:
+            return f.read()
+
+    async def set_thumbnail(self, user_id: int, image_path: str) -> bool:
+        """保存用户自定义缩略图
+
+        Args:
+            user_id: 用户ID
+            image_path: 用户发送的图片路径
+
+        Returns:
+            bool: 是否保存成功
+        """
+        data = await self._resize(image_path)
+        # 先写数据库，保存失败时本地副本和缓存保持原样
+        if self.db.db is not None and not await self.db.save_thumbnail(user_id, data):
+            return False
+        self._write(user_id, data)
+        self._remember(user_id, data)
+        logger.info(f"已保存用户 {user_id} 的缩略图 ({len(data)} 字节)")
+        return True
+
+    async def remove_thumbnail(self, user_id: int) -> bool:
+        """删除用户自定义缩略图
+
+        Returns:
+            bool: 是否删除了已有的缩略图
+        """
+        removed = self._cache.pop(user_id, None) is not None
+        removed = file_manager.safe_remove(self._path(user_id)) or removed
+        removed = await self.db.delete_thumbnail(user_id) or removed
+        return removed
+
+    async def get_thumbnail_path(self, user_id: int) -> Optional[str]:
+        """获取上传时使用的用户缩略图文件路径
+
+        Returns:
+            Optional[str]: 缩略图路径，用户未设置缩略图时返回None
+        """
+        entry = self._cache.get(user_id)
+        if entry is not None and time.monotonic() - entry[1] < self.cache_ttl:
+            self._cache.move_to_end(user_id)
+            path = self._path(user_id)
+            return path if file_manager.file_exists(path) else self._write(user_id, entry[0])
+
+        if self.db.db is None:
+            # 未配置数据库时本地文件是唯一的副本
+            path = self._path(user_id)
+            return path if file_manager.file_exists(path) else await self._migrate_legacy(user_id)
+
+        try:
+            data = await self.db.get_thumbnail(user_id)
+        except DatabaseOperationError:
+            # 数据库暂时不可用时继续使用本地副本（可能稍旧）
+            path = self._path(user_id)
+            return path if file_manager.file_exists(path) else None
+
+        if data is None:
+            self._cache.pop(user_id, None)
+            file_manager.safe_remove(self._path(user_id))
+            return await self._migrate_legacy(user_id)
+
+        self._remember(user_id, data)
+        return self._write(user_id, data)
+
+    async def _migrate_legacy(self, user_id: int) -> Optional[str]:
+        """迁移旧版本保存在工作目录中的 `{user_id}.jpg`"""
+        legacy = f"{user_id}.jpg"
+        if not file_manager.file_exists(legacy):
+            return None
+        await self.set_thumbnail(user_id, legacy)
+        file_manager.safe_remove(legacy)
+        return self._path(user_id)
+
+    def is_thumbnail_path(self, path: Optional[str]) -> bool:
+        """路径是否为用户自定义缩略图（上传后不应删除）"""
+        return bool(path) and os.path.dirname(os.path.abspath(path)) == self.thumb_dir
+
+
+# 全局缩略图服务实例
+thumbnail_service = ThumbnailService()
@@ -0,0 +1,65 @@
+"""ffmpeg子进程执行器
+
+限制同时运行的ffmpeg/ffprobe进程数量（默认与CPU核心数相同），并为每个任务设置超时，
+避免批量下载时同时启动大量子进程。
+"""
+import asyncio
+import logging
+import os
+from typing import Optional, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class FFmpegExecutor:
+    """有并发上限的ffmpeg子进程执行器"""
+
+    def __init__(self, max_processes: Optional[int] = None, timeout: float = 60.0):
+        self.max_processes = max_processes or os.cpu_count() or 1
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(self.max_processes)
+        self._running = 0
+
+    async def run(self, cmd: List[str], timeout: Optional[float] = None) -> Tuple[int, bytes, bytes]:
+        """运行命令并等待其结束
+
+        Args:
+            cmd: 命令及参数
+            timeout: 超时时间（秒），默认使用执行器的超时
+
+        Returns:
+            Tuple[int, bytes, bytes]: 返回码、标准输出、标准错误
+
+        Raises:
+            asyncio.TimeoutError: 超时，子进程已被终止
+        """
+        async with self._semaphore:
+            self._running += 1
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=timeout or self.timeout)
+                return process.returncode, stdout, stderr
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                if process.returncode is None:
+                    process.kill()
+                    await process.wait()
+                    logger.warning(f"{cmd[0]} 进程超时或被取消，已终止")
+                raise
+            finally:
+                self._running -= 1
+
+    def get_stats(self) -> dict:
+        """获取执行器状态"""
+        return {
+            "max_processes": self.max_processes,
+            "running": self._running
+        }
+
+
+# 全局ffmpeg执行器实例
+ffmpeg_executor = FFmpegExecutor()
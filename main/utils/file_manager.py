@@ -3,19 +3,34 @@ import os
 import tempfile
 import logging
 import shutil
-from typing import Optional, Union
+from collections import OrderedDict
+from typing import Optional, Union, Dict
 from contextlib import asynccontextmanager, contextmanager
 from pathlib import Path
 
+from ..config import settings
+
 logger = logging.getLogger(__name__)
 
 
 class FileManager:
     """文件管理器"""
     
-    def __init__(self, base_temp_dir: str = "temp"):
+    def __init__(self, base_temp_dir: str = "temp", media_cache_dir: str = "media_cache",
+                 media_cache_max_size: int = 2147483648):
         self.base_temp_dir = base_temp_dir
         self._ensure_temp_dir()
+        
+        # 媒体缓存: file_unique_id -> (文件路径, 文件大小)，按最近使用排序
+        self.media_cache_dir = os.path.abspath(media_cache_dir)
+        self.media_cache_max_size = media_cache_max_size
+        self._media_cache: "OrderedDict[str, tuple]" = OrderedDict()
+        self._media_cache_size = 0
+        # 正在使用的缓存项引用计数，使用中的文件不会被淘汰
+        self._media_pins: Dict[str, int] = {}
+        # 正在下载、尚未加入缓存的文件预留的空间: file_unique_id -> 预计大小
+        self._media_reserved: Dict[str, int] = {}
+        self._load_media_cache()
     
     def _ensure_temp_dir(self):
         """确保临时目录存在"""
@@ -118,6 +133,141 @@ class FileManager:
             logger.error(f"复制文件失败 {src} -> {dst}: {e}")
             return False
     
+    # ==================== 媒体缓存 ====================
+    
+    def _load_media_cache(self):
+        """扫描缓存目录，按最后访问时间重建LRU索引"""
+        os.makedirs(self.media_cache_dir, exist_ok=True)
+        entries = []
+        for unique_id in os.listdir(self.media_cache_dir):
+            entry_dir = os.path.join(self.media_cache_dir, unique_id)
+            files = os.listdir(entry_dir) if os.path.isdir(entry_dir) else []
+            if len(files) != 1:
+                # 不完整的缓存项直接删除
+                self._remove_path(entry_dir)
+                continue
+            path = os.path.join(entry_dir, files[0])
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, unique_id, path, stat.st_size))
+        
+        for _, unique_id, path, size in sorted(entries):
+            self._media_cache[unique_id] = (path, size)
+            self._media_cache_size += size
+        self._evict_media_cache()
+        if self._media_cache:
+            logger.info(f"加载媒体缓存: {len(self._media_cache)} 个文件, {self._media_cache_size} 字节")
+    
+    def _remove_path(self, path: str):
+        try:
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            elif os.path.exists(path):
+                os.remove(path)
+        except Exception as e:
+            logger.warning(f"删除缓存文件失败 {path}: {e}")
+    
+    def _evict_media_cache(self, keep: Optional[str] = None):
+        """淘汰最久未使用的缓存文件，直到总大小（含正在下载的文件）不超过容量
+        
+        正在使用的缓存项不会被淘汰，容量暂时不足时等它们释放后再淘汰。
+        """
+        for unique_id in list(self._media_cache):
+            if self._media_cache_size + sum(self._media_reserved.values()) <= self.media_cache_max_size:
+                break
+            if unique_id == keep or self._media_pins.get(unique_id):
+                continue
+            path, size = self._media_cache.pop(unique_id)
+            self._media_cache_size -= size
+            self._remove_path(os.path.dirname(path))
+            logger.debug(f"淘汰媒体缓存: {path}")
+    
+    def pin_media(self, file_unique_id: Optional[str], expected_size: int = 0):
+        """标记缓存项正在使用，直到调用 unpin_media
+        
+        文件尚未缓存时为即将下载的文件预留expected_size字节，提前淘汰旧文件腾出空间。
+        """
+        if not file_unique_id:
+            return
+        self._media_pins[file_unique_id] = self._media_pins.get(file_unique_id, 0) + 1
+        if (file_unique_id not in self._media_cache and expected_size
+                and expected_size <= self.media_cache_max_size):
+            self._media_reserved[file_unique_id] = expected_size
+            self._evict_media_cache()
+    
+    def unpin_media(self, file_unique_id: Optional[str]):
+        """释放 pin_media 的标记，最后一个使用者释放后按容量淘汰"""
+        count = self._media_pins.get(file_unique_id, 0)
+        if count > 1:
+            self._media_pins[file_unique_id] = count - 1
+            return
+        self._media_pins.pop(file_unique_id, None)
+        self._media_reserved.pop(file_unique_id, None)
+        self._evict_media_cache()
+    
+    def get_cached_media(self, file_unique_id: Optional[str]) -> Optional[str]:
+        """按源文件的file_unique_id获取本地缓存的文件路径
+        
+        返回的文件只有在调用方先用 pin_media 标记后才保证不会被淘汰。
+        """
+        entry = self._media_cache.get(file_unique_id) if file_unique_id else None
+        if entry is None:
+            return None
+        path = entry[0]
+        if not os.path.isfile(path):
+            self._media_cache.pop(file_unique_id)
+            self._media_cache_size -= entry[1]
+            return None
+        
+        self._media_cache.move_to_end(file_unique_id)
+        # 更新修改时间，重启后仍能恢复LRU顺序
+        os.utime(path)
+        return path
+    
+    def add_to_media_cache(self, file_unique_id: Optional[str], file_path: str) -> str:
+        """把下载完成的文件移入媒体缓存
+        
+        文件保存为 `<缓存目录>/<file_unique_id>/<原文件名>`，上传时仍使用原文件名。
+        
+        Returns:
+            str: 缓存后的文件路径；文件超过缓存容量或移动失败时返回原路径
+        """
+        self._media_reserved.pop(file_unique_id, None)
+        size = self.get_file_size(file_path)
+        if not file_unique_id or size > self.media_cache_max_size:
+            return file_path
+        
+        # 同一个文件已被并发的下载加入缓存时直接使用已有文件，不替换可能正在上传的文件
+        existing = self.get_cached_media(file_unique_id)
+        if existing:
+            self.safe_remove(file_path)
+            return existing
+        
+        entry_dir = os.path.join(self.media_cache_dir, file_unique_id)
+        cached_path = os.path.join(entry_dir, os.path.basename(file_path))
+        os.makedirs(entry_dir, exist_ok=True)
+        if not self.move_file(file_path, cached_path):
+            self._remove_path(entry_dir)
+            return file_path
+        
+        self._media_cache[file_unique_id] = (cached_path, size)
+        self._media_cache_size += size
+        self._evict_media_cache(keep=file_unique_id)
+        return cached_path
+    
+    def is_media_cached(self, file_path: str) -> bool:
+        """文件是否位于媒体缓存目录中（缓存文件由LRU淘汰，不应被直接删除）"""
+        return bool(file_path) and os.path.abspath(file_path).startswith(self.media_cache_dir + os.sep)
+    
+    def get_media_cache_stats(self) -> dict:
+        """获取媒体缓存统计信息"""
+        return {
+            "files": len(self._media_cache),
+            "size": self._media_cache_size,
+            "pinned": len(self._media_pins),
+            "reserved": sum(self._media_reserved.values()),
+            "max_size": self.media_cache_max_size
+        }
+    
     def safe_remove(self, file_path: str) -> bool:
         """安全删除文件"""
         try:
@@ -132,7 +282,10 @@ class FileManager:
 
 
 # 全局文件管理器实例
-file_manager = FileManager()
+file_manager = FileManager(
+    media_cache_dir=settings.MEDIA_CACHE_DIR,
+    media_cache_max_size=settings.MEDIA_CACHE_MAX_SIZE
+)
 
 
 @contextmanager
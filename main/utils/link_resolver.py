@@ -0,0 +1,111 @@
+"""消息链接解析模块
+
+把 t.me 消息链接一次性解析为结构化的 (peer, msg_id, kind)，并缓存公开频道是否
+需要Userbot才能读取，重复请求同一频道时无需再让机器人先尝试一次。
+频道的 access_hash 由各账号的Pyrogram会话存储缓存。
+"""
+import logging
+import time
+from collections import OrderedDict
+from typing import Optional, Union
+
+logger = logging.getLogger(__name__)
+
+_DOMAINS = ("t.me/", "telegram.me/", "telegram.dog/")
+
+
+class ParsedLink:
+    """解析后的消息链接
+
+    Attributes:
+        kind: private（t.me/c/<id>）、bot（t.me/b/<用户名>）或 public（t.me/<用户名>）
+        peer: 私有频道为 -100 开头的整数ID，其他为用户名
+        msg_id: 消息ID（已加上偏移量）
+        topic_id: 论坛话题ID，链接中没有时为None
+    """
+
+    __slots__ = ("kind", "peer", "msg_id", "topic_id")
+
+    def __init__(self, kind: str, peer: Union[int, str], msg_id: int, topic_id: Optional[int] = None):
+        self.kind = kind
+        self.peer = peer
+        self.msg_id = msg_id
+        self.topic_id = topic_id
+
+    @property
+    def is_public(self) -> bool:
+        return self.kind == "public"
+
+    def __repr__(self) -> str:
+        return f"ParsedLink(kind={self.kind!r}, peer={self.peer!r}, msg_id={self.msg_id})"
+
+
+def parse_link(msg_link: str, offset: int = 0) -> ParsedLink:
+    """解析消息链接
+
+    支持 t.me/c/<id>/<msg>、t.me/c/<id>/<话题>/<msg>、t.me/b/<用户名>/<msg>、
+    t.me/<用户名>/<msg> 和 t.me/<用户名>/<话题>/<msg>。
+
+    Args:
+        msg_link: 消息链接
+        offset: 消息ID偏移量（批量下载时使用）
+
+    Raises:
+        ValueError: 链接格式无效
+    """
+    link = msg_link.strip().split("?")[0].split("#")[0].rstrip("/")
+    for domain in _DOMAINS:
+        index = link.lower().find(domain)
+        if index != -1:
+            link = link[index + len(domain):]
+            break
+    else:
+        raise ValueError(f"不是Telegram消息链接: {msg_link}")
+
+    parts = [p for p in link.split("/") if p]
+    try:
+        if parts[0] == "c" and len(parts) in (3, 4):
+            topic_id = int(parts[2]) if len(parts) == 4 else None
+            return ParsedLink("private", int("-100" + str(int(parts[1]))), int(parts[-1]) + offset, topic_id)
+        if parts[0] == "b" and len(parts) == 3:
+            return ParsedLink("bot", parts[1], int(parts[2]) + offset)
+        if parts[0] not in ("c", "b", "s") and len(parts) in (2, 3):
+            topic_id = int(parts[1]) if len(parts) == 3 else None
+            return ParsedLink("public", parts[0], int(parts[-1]) + offset, topic_id)
+    except (ValueError, IndexError):
+        pass
+    raise ValueError(f"无法解析消息链接: {msg_link}")
+
+
+class LinkResolver:
+    """记录公开频道能否由机器人直接读取"""
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # 用户名（小写） -> (是否需要Userbot, 记录时间)
+        self._restricted: "OrderedDict[str, tuple]" = OrderedDict()
+
+    parse = staticmethod(parse_link)
+
+    def is_restricted(self, username: str) -> Optional[bool]:
+        """公开频道是否需要Userbot才能读取，未知时返回None"""
+        entry = self._restricted.get(username.lower())
+        if entry is None:
+            return None
+        if time.monotonic() - entry[1] > self.ttl:
+            del self._restricted[username.lower()]
+            return None
+        return entry[0]
+
+    def mark_restricted(self, username: str, restricted: bool = True):
+        """记录公开频道是否需要Userbot"""
+        key = username.lower()
+        self._restricted[key] = (restricted, time.monotonic())
+        self._restricted.move_to_end(key)
+        while len(self._restricted) > self.max_entries:
+            self._restricted.popitem(last=False)
+
+
+# 全局链接解析器实例
+link_resolver = LinkResolver()
@@ -0,0 +1,143 @@
+"""媒体探测模块
+
+获取视频的时长、宽高、编码和旋转信息。优先使用Telegram消息自带的元数据，
+缺失时才调用一次 `ffprobe -print_format json`，结果按文件标识缓存。
+探测在子进程中异步执行（经由ffmpeg执行器限制并发），不会阻塞事件循环。
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+from .ffmpeg_executor import ffmpeg_executor
+
+logger = logging.getLogger(__name__)
+
+
+class MediaProbe:
+    """异步视频元数据探测器"""
+
+    def __init__(self, timeout: float = 30.0, max_entries: int = 256):
+        self.timeout = timeout
+        self.max_entries = max_entries
+        # (绝对路径, 大小, 修改时间) -> 元数据
+        self._cache: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+
+    @staticmethod
+    def _file_key(path: str) -> tuple:
+        stat = os.stat(path)
+        return (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+    @staticmethod
+    def from_message(media: Any) -> Optional[Dict[str, Any]]:
+        """从Telegram的Video/VideoNote对象中读取元数据，信息不完整时返回None"""
+        if media is None:
+            return None
+        duration = getattr(media, "duration", None)
+        # VideoNote 只有边长 length
+        length = getattr(media, "length", None)
+        width = getattr(media, "width", None) or length
+        height = getattr(media, "height", None) or length
+        if not (duration and width and height):
+            return None
+        return {
+            "duration": int(duration),
+            "width": int(width),
+            "height": int(height),
+            "codec": None,
+            "rotation": 0
+        }
+
+    @staticmethod
+    def _parse(output: bytes) -> Optional[Dict[str, Any]]:
+        data = json.loads(output or b"{}")
+        streams = data.get("streams") or []
+        if not streams:
+            return None
+        stream = streams[0]
+
+        duration = stream.get("duration") or data.get("format", {}).get("duration") or 0
+        width = int(stream.get("width") or 0)
+        height = int(stream.get("height") or 0)
+
+        rotation = stream.get("tags", {}).get("rotate")
+        for side_data in stream.get("side_data_list") or []:
+            if "rotation" in side_data:
+                rotation = side_data["rotation"]
+        rotation = int(float(rotation or 0)) % 360
+        if rotation in (90, 270):
+            # 竖屏视频按显示方向返回宽高
+            width, height = height, width
+
+        return {
+            "duration": int(float(duration)),
+            "width": width,
+            "height": height,
+            "codec": stream.get("codec_name"),
+            "rotation": rotation
+        }
+
+    async def probe(self, path: str) -> Optional[Dict[str, Any]]:
+        """使用ffprobe探测视频文件
+
+        Returns:
+            Optional[Dict[str, Any]]: duration/width/height/codec/rotation，探测失败时返回None
+        """
+        try:
+            key = self._file_key(path)
+        except OSError as e:
+            logger.warning(f"无法读取文件信息 {path}: {e}")
+            return None
+
+        cached = self._cache.get(key)
+        if cached is not None:
+            self._cache.move_to_end(key)
+            return cached
+
+        cmd = [
+            "ffprobe", "-v", "error",
+            "-select_streams", "v:0",
+            "-show_streams", "-show_format",
+            "-print_format", "json",
+            path
+        ]
+        try:
+            returncode, stdout, stderr = await ffmpeg_executor.run(cmd, timeout=self.timeout)
+            if returncode != 0:
+                logger.warning(f"ffprobe 探测失败 {path}: {stderr.decode(errors='ignore').strip()}")
+                return None
+            metadata = self._parse(stdout)
+        except asyncio.TimeoutError:
+            logger.warning(f"ffprobe 探测超时 {path}")
+            return None
+        except Exception as e:
+            logger.warning(f"ffprobe 探测出错 {path}: {e}")
+            return None
+
+        if metadata:
+            self._cache[key] = metadata
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return metadata
+
+    async def get_video_metadata(self, path: str, media: Any = None) -> Dict[str, Any]:
+        """获取视频元数据
+
+        Args:
+            path: 本地视频文件路径
+            media: 源消息中的Video/VideoNote对象，信息完整时无需探测文件
+
+        Returns:
+            Dict[str, Any]: duration/width/height/codec/rotation，全部失败时返回默认值
+        """
+        metadata = self.from_message(media) or await self.probe(path)
+        if metadata is None:
+            logger.warning(f"无法获取视频元数据，使用默认值: {path}")
+            metadata = {"duration": 0, "width": 90, "height": 90, "codec": None, "rotation": 0}
+        return metadata
+
+
+# 全局媒体探测器实例
+media_probe = MediaProbe()
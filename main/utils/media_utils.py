@@ -4,30 +4,35 @@ import re
 import os
 import time
 import math
-from datetime import datetime as dt
-from typing import Optional
+import logging
+import uuid
+from typing import Optional, Any
 from pyrogram.errors import FloodWait, InviteHashInvalid, InviteHashExpired, UserAlreadyParticipant
 
 from ..exceptions.telegram import SessionException
 from .file_manager import file_manager
+from .ffmpeg_executor import ffmpeg_executor
+
+logger = logging.getLogger(__name__)
 
 def hhmmss(seconds: int) -> str:
     """将秒数转换为HH:MM:SS格式"""
     return time.strftime('%H:%M:%S', time.gmtime(seconds))
 
 
-async def screenshot(video: str, duration: int, sender: int) -> Optional[str]:
-    """为视频生成缩略图"""
-    # 检查用户特定的缩略图
-    user_thumb = f'{sender}.jpg'
-    if file_manager.file_exists(user_thumb):
-        return user_thumb
+async def screenshot(video: str, duration: int) -> Optional[str]:
+    """为视频生成缩略图
     
+    截图保存在临时目录中并使用唯一文件名，调用方上传后负责删除。
+    """
     time_stamp = hhmmss(int(duration) // 2)
-    out = dt.now().isoformat("_", "seconds") + ".jpg"
+    out = os.path.join(file_manager.base_temp_dir, f"screenshot_{uuid.uuid4().hex}.jpg")
     
+    # 输入前定位并只解码关键帧，无需解码到目标位置
     cmd = [
         "ffmpeg",
+        "-skip_frame",
+        "nokey",
         "-ss",
         f"{time_stamp}", 
         "-i",
@@ -39,22 +44,51 @@ async def screenshot(video: str, duration: int, sender: int) -> Optional[str]:
     ]
     
     try:
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=asyncio.subprocess.PIPE,
-            stderr=asyncio.subprocess.PIPE
-        )
-        stdout, stderr = await process.communicate()
+        await ffmpeg_executor.run(cmd, timeout=30)
         
         if file_manager.file_exists(out):
             return out
         else:
             return None
     except Exception as e:
-        print(f"生成缩略图失败: {e}")
+        logger.warning(f"生成缩略图失败: {e}")
+        file_manager.safe_remove(out)
         return None
 
 
+async def resolve_thumbnail(client, media: Any, video: str, duration: int,
+                            user_thumb: Optional[str] = None) -> Optional[str]:
+    """获取上传视频使用的缩略图
+    
+    依次尝试：用户自定义缩略图、源消息自带的缩略图（只需下载几KB）、ffmpeg截图。
+    
+    Args:
+        client: 能访问源消息的Pyrogram客户端
+        media: 源消息中的Video/VideoNote对象
+        video: 本地视频文件路径
+        duration: 视频时长（秒）
+        user_thumb: 用户自定义缩略图路径
+        
+    Returns:
+        Optional[str]: 缩略图路径，全部失败时返回None
+    """
+    if user_thumb:
+        return user_thumb
+    
+    thumbs = getattr(media, "thumbs", None)
+    if thumbs:
+        thumb = max(thumbs, key=lambda t: (t.width or 0) * (t.height or 0))
+        out = os.path.abspath(os.path.join(file_manager.base_temp_dir, f"thumb_{uuid.uuid4().hex}.jpg"))
+        try:
+            path = await client.download_media(thumb.file_id, file_name=out)
+            if path and file_manager.file_exists(path):
+                return path
+        except Exception as e:
+            logger.warning(f"下载源消息缩略图失败: {e}")
+    
+    return await screenshot(video, duration)
+
+
 async def progress_for_pyrogram(current: int, total: int, client, ud_type: str, message, start: float):
     """Pyrogram下载/上传进度回调"""
     now = time.time()
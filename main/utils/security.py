@@ -2,12 +2,15 @@
 import hashlib
 import secrets
 import logging
-from typing import Optional, Tuple
+from typing import Optional, Tuple, Dict
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
 import base64
 
+# 会话加密使用的固定盐值
+SESSION_KEY_SALT = b'tg_content_bot_salt_16bytes'
+
 logger = logging.getLogger(__name__)
 
 
@@ -16,24 +19,45 @@ class SecurityManager:
     
     def __init__(self):
         self._fernet = None
+        # secret的SHA-256摘要 -> Fernet实例。PBKDF2每次需要约100毫秒，
+        # 只缓存使用固定盐值的 get_fernet，随机盐值的派生结果不缓存
+        self._ciphers: Dict[bytes, Fernet] = {}
     
     def generate_encryption_key(self) -> str:
         """生成新的加密密钥"""
         return Fernet.generate_key().decode()
     
-    def derive_key_from_password(self, password: str, salt: Optional[bytes] = None) -> Tuple[str, bytes]:
-        """从密码派生加密密钥"""
-        if salt is None:
-            salt = secrets.token_bytes(16)
-        
+    def _derive_key(self, password: bytes, salt: bytes) -> bytes:
         kdf = PBKDF2HMAC(
             algorithm=hashes.SHA256(),
             length=32,
             salt=salt,
             iterations=100000,
         )
-        key = base64.urlsafe_b64encode(kdf.derive(password.encode()))
-        return key.decode(), salt
+        return base64.urlsafe_b64encode(kdf.derive(password))
+    
+    def derive_key_from_password(self, password: str, salt: Optional[bytes] = None) -> Tuple[str, bytes]:
+        """从密码派生加密密钥"""
+        if salt is None:
+            salt = secrets.token_bytes(16)
+        
+        return self._derive_key(password.encode(), salt).decode(), salt
+    
+    def get_fernet(self, secret: str) -> Fernet:
+        """获取使用 secret 加密的Fernet实例
+        
+        secret 不是32字节时使用PBKDF2派生密钥。相同的 secret 只派生一次，
+        SessionService 等调用方共享同一个实例。
+        """
+        digest = hashlib.sha256(secret.encode()).digest()
+        cipher = self._ciphers.get(digest)
+        if cipher is None:
+            key = secret.encode()
+            if len(key) != 32:
+                key = self._derive_key(key, SESSION_KEY_SALT)
+            cipher = Fernet(key)
+            self._ciphers[digest] = cipher
+        return cipher
     
     def hash_password(self, password: str, salt: Optional[str] = None) -> Tuple[str, str]:
         """哈希密码"""
@@ -0,0 +1,60 @@
+"""下载工作进程入口
+
+通过 `python -m main worker [名称]` 启动。工作进程使用自己的Telegram客户端会话，
+从持久化任务队列领取下载任务并执行，不处理任何机器人命令。
+可以在多个CPU核心或多台主机上同时运行多个工作进程，共享同一个机器人Token和任务队列。
+"""
+import asyncio
+import signal
+
+from .core.clients import client_manager
+from .utils.logging_config import get_logger
+from .config import settings
+
+logger = get_logger(__name__)
+
+
+async def worker_async(name: str):
+    """工作进程异步主函数"""
+    from .services.download_task_manager import download_task_manager
+
+    logger.info("=" * 50)
+    logger.info(f"🛠️ 下载工作进程 {name} 启动中...")
+    logger.info("=" * 50)
+
+    # 同一主机上的多个进程使用不同的会话文件
+    client_manager.session_suffix = f"_{name}"
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+
+    try:
+        await client_manager.initialize_clients(wait_for_userbot=True)
+        await download_task_manager.start_worker(settings.MAX_WORKERS)
+        logger.info(f"✅ 工作进程 {name} 已就绪，并发数: {settings.MAX_WORKERS}")
+        await stop_event.wait()
+        logger.info("收到停止信号，正在关闭工作进程...")
+    except Exception as e:
+        logger.error(f"工作进程运行时出错: {e}", exc_info=True)
+    finally:
+        try:
+            await download_task_manager.stop()
+        except Exception as e:
+            logger.error(f"停止下载任务管理器失败: {e}", exc_info=True)
+        await client_manager.stop_clients()
+        logger.info(f"工作进程 {name} 已关闭")
+
+
+def main(name: str = "worker"):
+    """工作进程主函数"""
+    try:
+        asyncio.run(worker_async(name))
+    except KeyboardInterrupt:
+        logger.info("收到中断信号")
+    except Exception as e:
+        logger.error(f"工作进程主函数出错: {e}", exc_info=True)